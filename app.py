@@ -1,7 +1,9 @@
-from flask import Flask, render_template, request, jsonify, session, url_for, redirect
+from flask import Flask, render_template, request, jsonify, session, url_for, redirect, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 import os
+import time
 from dotenv import load_dotenv, dotenv_values
 import json
 from itsdangerous import URLSafeTimedSerializer
@@ -11,21 +13,58 @@ from functools import wraps
 # Initialize Flask app first
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dev-key-123'  # Use a fixed key for development
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///shop.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///shop.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool (server databases and SQLite files alike)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# Add missing model indexes at startup (normally `python migrations.py` before a deploy)
+app.config['DB_CREATE_INDEXES_ON_START'] = os.environ.get('DB_CREATE_INDEXES_ON_START', '0') == '1'
+# SQLite only
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16000))
 app.config['SESSION_COOKIE_SECURE'] = False  # Allow non-HTTPS for development
 app.config['SECURITY_PASSWORD_SALT'] = 'email-confirm-key'
+app.config['CHAT_SESSION_MAX_ENTRIES'] = int(os.environ.get('CHAT_SESSION_MAX_ENTRIES', 10000))
+app.config['CHAT_SESSION_TTL_SECONDS'] = int(os.environ.get('CHAT_SESSION_TTL_SECONDS', 1800))
+app.config['CHAT_SESSION_BACKEND'] = os.environ.get('CHAT_SESSION_BACKEND', 'memory')  # memory or sqlite
+app.config['CHAT_SESSION_DB_PATH'] = os.environ.get('CHAT_SESSION_DB_PATH', 'instance/chat_sessions.db')
+app.config['RETRIEVAL_WARM_QUERIES_FILE'] = os.environ.get('RETRIEVAL_WARM_QUERIES_FILE', 'faq_queries.txt')
+# Request profiling is off unless a sample rate or a slow-request threshold is set
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 200))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'instance/profiles')
+app.config['CHECKOUT_KEY_TTL_HOURS'] = float(os.environ.get('CHECKOUT_KEY_TTL_HOURS', 24))
+app.config['SUPPORT_TICKET_BATCH_MAX'] = int(os.environ.get('SUPPORT_TICKET_BATCH_MAX', 100))
 
 # Import db and initialize it with app
-from db import db
+from db import db, engine_options, configure_sqlite
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 db.init_app(app)
+with app.app_context():
+    configure_sqlite(db.engine, app.config)
+
+from profiling import init_profiling
+init_profiling(app)
 
 # Import models after db initialization
-from models import Employee, Product, Order, Cart, Company, SupportTicket, Refund
+from models import Employee, Product, Order, Cart, Company, SupportTicket, Refund, CheckoutRequest
+from migrations import create_missing_indexes
+from pagination import PaginationError, paginated_response, parse_fields
+import checkout
+from checkout import CheckoutError
+from bulk import bulk_insert
 
-# Read API key directly from .env file
+# Read API key directly from .env file, falling back to the environment
 env_path = os.path.join(os.path.dirname(__file__), '.env')
-api_key = None
+api_key = os.environ.get('OPENAI_API_KEY')
 
 try:
     with open(env_path, 'r') as f:
@@ -80,25 +119,56 @@ if not os.path.exists('instance'):
 
 # Initialize RAG engines for different sessions
 from rag_engine import RAGEngine
+from retrieval import get_retrieval_index, read_query_file
+from session_store import create_session_store
+from intent_router import get_intent_router
+from tool_executor import get_tool_executor
+from prompt_builder import get_prompt_builder
+from llm_client import get_llm_client
+from response_cache import get_response_cache
+import metrics
 from uuid import uuid4
 
-rag_engines = {}
+SOP_FILE_PATH = 'support_sop.txt'
+
+# Load the shared retrieval index once per worker so the first chat message doesn't pay for it,
+# and precompute the retrieval results of the most frequent questions
+retrieval_index = get_retrieval_index(SOP_FILE_PATH)
+warmed = retrieval_index.warm(read_query_file(app.config['RETRIEVAL_WARM_QUERIES_FILE']))
+if warmed:
+    print(f"Warmed retrieval for {warmed} FAQ queries")
+
+# Bounded conversation state for chat sessions; idle or least recently used sessions are evicted.
+# Use the sqlite backend when running several workers so any of them can serve any turn.
+chat_sessions = create_session_store(
+    backend=app.config['CHAT_SESSION_BACKEND'],
+    max_entries=app.config['CHAT_SESSION_MAX_ENTRIES'],
+    ttl_seconds=app.config['CHAT_SESSION_TTL_SECONDS'],
+    db_path=app.config['CHAT_SESSION_DB_PATH']
+)
 
 def get_or_create_rag_engine(session_id):
-    if session_id not in rag_engines:
-        rag_engines[session_id] = RAGEngine('support_sop.txt', api_key=api_key)
-    return rag_engines[session_id]
+    state = chat_sessions.get_or_create(session_id)
+    return RAGEngine(SOP_FILE_PATH, api_key=api_key, state=state)
 
 def get_ai_response(message, session_id, customer_email=None):
+    metrics.start_request('chat')
     try:
         # Get or create RAG engine for this session
-        engine = get_or_create_rag_engine(session_id)
+        with metrics.span('engine'):
+            engine = get_or_create_rag_engine(session_id)
         
         # Get AI response using RAG with conversation history and customer context
         response = engine.generate_response(message, customer_email=customer_email)
+        
+        # Write the updated conversation state back so the next turn can land on any worker
+        with metrics.span('session_store'):
+            chat_sessions.put(session_id, engine.state)
+        metrics.finish_request()
         return response
     except Exception as e:
         print(f"Error in get_ai_response: {str(e)}")
+        metrics.finish_request('error')
         return f"I apologize, but I'm having trouble processing your request. Please try again later."
 
 @app.route('/')
@@ -124,15 +194,13 @@ def order_tracking(order_id):
 @app.route('/order-history')
 @login_required
 def order_history():
-    orders = Order.query.filter_by(employee_id=current_user.id)\
-                       .order_by(Order.order_time.desc())\
-                       .all()
-    return render_template('order_history.html', orders=orders)
+    # The page loads its orders a page at a time from /api/orders/history
+    return render_template('order_history.html')
 
 @app.route('/api/orders/<int:order_id>')
 @login_required
 def get_order(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(joinedload(Order.product)).get_or_404(order_id)
     if order.employee_id != current_user.id:
         abort(403)
     return jsonify(order.to_dict())
@@ -140,10 +208,16 @@ def get_order(order_id):
 @app.route('/api/orders/history')
 @login_required
 def get_order_history():
-    orders = Order.query.filter_by(employee_id=current_user.id)\
-                       .order_by(Order.order_time.desc())\
-                       .all()
-    return jsonify([order.to_dict() for order in orders])
+    """Newest orders first, a page at a time (see pagination.py for limit, cursor, fields and format)"""
+    try:
+        fields = parse_fields(request.args.get('fields'), Order.API_FIELDS)
+        query = Order.query.filter_by(employee_id=current_user.id)
+        if fields is None or 'product_name' in fields:
+            # Products are joined in, so serializing the orders doesn't query once per order
+            query = query.options(joinedload(Order.product))
+        return paginated_response(query, Order.order_time, Order.id, lambda order: order.to_dict(fields))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/dashboard')
 @login_required
@@ -203,7 +277,9 @@ def login():
 def logout():
     logout_user()
     session.pop('customer_email', None)
-    session.pop('session_id', None)
+    session_id = session.pop('session_id', None)
+    if session_id:
+        chat_sessions.delete(session_id)
     return jsonify({'message': 'Logout successful'})
 
 
@@ -272,8 +348,11 @@ def get_user_info():
     print(f'Meal allowance: {current_user.meal_allowance}')
     print(f'Credit balance: {current_user.credit_balance}')
     
+    # Load the cart and its products in one query; both loops below reuse it
+    cart_items = Cart.query.options(joinedload(Cart.product)).filter_by(employee_id=current_user.id).all()
+    
     # Calculate total from cart items
-    cart_total = sum(item.quantity * item.product.price for item in current_user.cart_items)
+    cart_total = sum(item.quantity * item.product.price for item in cart_items)
     
     cart_breakdown = current_user.calculate_payment_breakdown(cart_total)
     tax_rate = 0.08  # 8% tax
@@ -295,7 +374,7 @@ def get_user_info():
                 },
                 'quantity': item.quantity,
                 'subtotal': item.subtotal
-            } for item in current_user.cart_items],
+            } for item in cart_items],
             'breakdown': {
                 'subtotal': cart_total,
                 'tax': tax,
@@ -331,16 +410,19 @@ def add_to_cart():
             
             print(f"Found product: {product.name}, price: {product.price}")
             
-            # Check if product already in cart
-            cart_item = Cart.query.filter_by(
-                employee_id=current_user.id,
-                product_id=product_id
-            ).first()
+            # Add to the quantity of a row already in the cart. One UPDATE, not a read and a
+            # write: a checkout may delete the row in between, and SQLite can hand its id
+            # to the next new row, which would then get the old quantity added
+            cart = Cart.__table__
+            updated = db.session.execute(
+                cart.update()
+                .where(cart.c.employee_id == current_user.id)
+                .where(cart.c.product_id == product_id)
+                .values(quantity=cart.c.quantity + quantity)
+            ).rowcount
             
-            if cart_item:
-                print(f"Updating existing cart item, old quantity: {cart_item.quantity}")
-                cart_item.quantity += quantity
-                print(f"New quantity: {cart_item.quantity}")
+            if updated:
+                print(f"Updated existing cart item by {quantity}")
             else:
                 print("Creating new cart item")
                 cart_item = Cart(employee_id=current_user.id, product_id=product_id, quantity=quantity)
@@ -398,76 +480,29 @@ def process_credit_card_payment(amount, card_info):
         'success': True,
         'transaction_id': f'txn_{int(time.time())}',
         'amount': amount,
-        'last4': card_info['last4']
+        'last4': (card_info or {}).get('last4')
     }
 
 @app.route('/api/cart/place-order', methods=['POST'])
 @login_required
 def place_order():
+    # Retries that repeat the Idempotency-Key get the first checkout's response back
     try:
-        # Get user's cart
-        cart_items = Cart.query.filter_by(employee_id=current_user.id).all()
-        if not cart_items:
-            return jsonify({'error': 'Cart is empty'}), 400
-
-        # Calculate payment breakdown
-        cart_total = sum(item.product.price * item.quantity for item in cart_items)
-        tax = cart_total * 0.08
-        grand_total = cart_total + tax
-
-        # Get user's payment info
-        employee = Employee.query.filter_by(id=current_user.id).first()
-        payment_breakdown = employee.calculate_payment_breakdown(grand_total)
-
-        # Process credit card payment if needed
-        if payment_breakdown['credit_card'] > 0:
-            payment_result = process_credit_card_payment(
-                payment_breakdown['credit_card'],
-                employee.credit_card
-            )
-            if not payment_result['success']:
-                return jsonify({'error': 'Payment processing failed'}), 400
-
-        # Create order records
-        order_time = datetime.utcnow()
-        orders = []
-        for item in cart_items:
-            estimated_delivery = order_time + timedelta(minutes=30)
-            order = Order(
-                employee_id=current_user.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price=item.product.price,
-                order_time=order_time,
-                estimated_delivery=estimated_delivery,
-                allowance_used=payment_breakdown['meal_allowance'] * (item.product.price * item.quantity / cart_total),
-                credits_used=payment_breakdown['credit_balance'] * (item.product.price * item.quantity / cart_total)
-            )
-            db.session.add(order)
-            orders.append(order)
-
-        # Update employee's allowance and credits
-        employee.meal_allowance -= payment_breakdown['meal_allowance']
-        employee.credit_balance -= payment_breakdown['credit_balance']
-
-        # Clear the cart
-        Cart.query.filter_by(employee_id=current_user.id).delete()
-
-        # Commit all changes
-        db.session.commit()
-
-        return jsonify({
-            'message': 'Order placed successfully',
-            'order_id': orders[0].id,  # Return the first order's ID for tracking
-            'order_time': order_time.isoformat(),
-            'payment_breakdown': payment_breakdown
-        })
-
+        response, replayed = checkout.place_order(current_user, request.headers.get('Idempotency-Key'),
+                                                  charge_card=process_credit_card_payment,
+                                                  key_ttl_hours=app.config['CHECKOUT_KEY_TTL_HOURS'])
+    except CheckoutError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f'Error placing order: {str(e)}')
         return jsonify({'error': 'Error placing order', 'details': str(e)}), 500
 
+    result = jsonify(response)
+    if replayed:
+        result.headers['Idempotent-Replayed'] = 'true'
+    return result
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
 def chat():
@@ -482,6 +517,101 @@ def chat():
     ai_response = get_ai_response(user_message, session['session_id'], customer_email)
     return jsonify({"response": ai_response})
 
+def _sse_event(data, event=None):
+    """Format one Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Stream the AI response as Server-Sent Events, one event per completion delta"""
+    if 'session_id' not in session:
+        session['session_id'] = str(uuid4())
+    
+    data = request.json
+    user_message = data.get('message', '')
+    customer_email = session.get('customer_email')
+    session_id = session['session_id']
+    
+    def generate():
+        metrics.start_request('chat_stream')
+        try:
+            with metrics.span('engine'):
+                engine = get_or_create_rag_engine(session_id)
+            for delta in engine.stream_response(user_message, customer_email=customer_email):
+                yield _sse_event({"delta": delta})
+            with metrics.span('session_store'):
+                chat_sessions.put(session_id, engine.state)
+            metrics.finish_request()
+            yield _sse_event({}, event='done')
+        except Exception as e:
+            print(f"Error in chat_stream: {str(e)}")
+            metrics.finish_request('error')
+            yield _sse_event({"error": "I apologize, but I'm having trouble processing your request. Please try again later."}, event='error')
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let a proxy buffer the stream
+    })
+
+@app.route('/api/chat/sessions/stats')
+@login_required
+def chat_session_stats():
+    return jsonify(chat_sessions.stats())
+
+@app.route('/api/chat/router/stats')
+@login_required
+def chat_router_stats():
+    """How many chat turns were answered by the local intent router instead of the LLM"""
+    router = get_intent_router()
+    return jsonify(router.stats() if router else {'enabled': False})
+
+@app.route('/api/chat/tools/stats')
+@login_required
+def chat_tool_stats():
+    """Call counts and latency per chat tool"""
+    return jsonify(get_tool_executor().latency.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker's chat metrics"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def _component_metrics():
+    """Counters the chat components already keep, read at scrape time"""
+    samples = []
+    if api_key:
+        llm = get_llm_client(api_key).stats()
+        samples += [
+            ('chat_llm_requests_total', 'counter', 'Completion calls sent to the LLM API', llm['requests']),
+            ('chat_llm_retries_total', 'counter', 'Completion calls retried', llm['retries']),
+            ('chat_llm_failures_total', 'counter', 'Completion calls that failed for good', llm['failures'])
+        ]
+    cache = get_response_cache(SOP_FILE_PATH)
+    if cache is not None:
+        cache_stats = cache.stats()
+        samples += [
+            ('chat_response_cache_hits_total', 'counter', 'Answers served from the response cache',
+             cache_stats['hits'] + cache_stats['near_hits']),
+            ('chat_response_cache_misses_total', 'counter', 'Cacheable questions not in the cache', cache_stats['misses']),
+            ('chat_response_cache_entries', 'gauge', 'Answers held in the response cache', cache_stats['entries'])
+        ]
+    sessions = chat_sessions.stats()
+    if 'entries' in sessions:
+        samples.append(('chat_sessions', 'gauge', 'Conversation states held by this worker', sessions['entries']))
+    return samples
+
+metrics.REGISTRY.add_collector(_component_metrics)
+
+@app.route('/api/chat/prompt/stats')
+@login_required
+def chat_prompt_stats():
+    """Prompt sizes against the token budget, and how much was trimmed or summarized"""
+    return jsonify(get_prompt_builder().stats())
+
 @app.route('/api/products', methods=['GET'])
 @login_required
 def get_products():
@@ -578,9 +708,14 @@ def get_support_tickets():
         query = query.filter_by(status=status)
     if ticket_type:
         query = query.filter_by(ticket_type=ticket_type)
-        
-    tickets = query.order_by(SupportTicket.created_at.desc()).all()
-    return jsonify([ticket.to_dict() for ticket in tickets])
+
+    # Newest first, a page at a time (see pagination.py for limit, cursor, fields and format)
+    try:
+        fields = parse_fields(request.args.get('fields'), SupportTicket.API_FIELDS)
+        return paginated_response(query, SupportTicket.created_at, SupportTicket.id,
+                                  lambda ticket: ticket.to_dict(fields))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/support/tickets', methods=['POST'])
 def create_support_ticket():
@@ -605,6 +740,39 @@ def create_support_ticket():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/support/tickets/batch', methods=['POST'])
+@login_required
+def create_support_tickets():
+    """Create many of the user's support tickets in one transaction: {"tickets": [{issue, ...}, ...]}"""
+    data = request.json
+    tickets = data.get('tickets') if isinstance(data, dict) else None
+    if not isinstance(tickets, list) or not tickets:
+        return jsonify({'error': 'Expected a non-empty "tickets" list'}), 400
+    if len(tickets) > app.config['SUPPORT_TICKET_BATCH_MAX']:
+        return jsonify({'error': f"At most {app.config['SUPPORT_TICKET_BATCH_MAX']} tickets per batch"}), 400
+    invalid = [index for index, ticket in enumerate(tickets) if not isinstance(ticket, dict) or not ticket.get('issue')]
+    if invalid:
+        return jsonify({'error': 'Missing required fields', 'invalid': invalid}), 400
+
+    now = datetime.utcnow()
+    # Filed by the logged-in user, whatever the payload says
+    rows = [{
+        'customer_email': current_user.email,
+        'issue': ticket['issue'],
+        'ticket_type': ticket.get('ticket_type', 'general'),
+        'order_id': ticket.get('order_id'),
+        'status': 'open',
+        'created_at': now,
+        'updated_at': now
+    } for ticket in tickets]
+    try:
+        ids = bulk_insert(SupportTicket, rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    return jsonify([SupportTicket(id=ticket_id, **row).to_dict() for ticket_id, row in zip(ids, rows)]), 201
+
 @app.route('/api/orders', methods=['POST'])
 @login_required
 def create_order():
@@ -662,6 +830,7 @@ def create_order():
 def init_db():
     try:
         # Clear all existing data
+        db.session.query(CheckoutRequest).delete()
         db.session.query(Employee).delete()
         db.session.query(Cart).delete()
         db.session.query(Order).delete()
@@ -704,80 +873,78 @@ def init_db():
             print(f'Adding employee {employee.email} with meal_allowance={employee.meal_allowance}')
             db.session.add(employee)
 
+        # Flush for the employees' ids; products and orders are written in bulk
+        db.session.flush()
+
         # Create sample products
         products = [
-            Product(
-                name='Burger',
-                description='Classic beef burger',
-                price=10.99,
-                dietary_info=json.dumps({
+            {
+                'name': 'Burger',
+                'description': 'Classic beef burger',
+                'price': 10.99,
+                'dietary_info': json.dumps({
                     'dietary_preferences': {'vegetarian': False, 'vegan': False, 'gluten_free': False},
                     'allergens': ['dairy']
                 })
-            ),
-            Product(
-                name='Pizza',
-                description='Margherita pizza',
-                price=12.99,
-                dietary_info=json.dumps({
+            },
+            {
+                'name': 'Pizza',
+                'description': 'Margherita pizza',
+                'price': 12.99,
+                'dietary_info': json.dumps({
                     'dietary_preferences': {'vegetarian': True, 'vegan': False, 'gluten_free': False},
                     'allergens': ['dairy', 'gluten']
                 })
-            ),
-            Product(
-                name='Salad',
-                description='Fresh garden salad',
-                price=8.99,
-                dietary_info=json.dumps({
+            },
+            {
+                'name': 'Salad',
+                'description': 'Fresh garden salad',
+                'price': 8.99,
+                'dietary_info': json.dumps({
                     'dietary_preferences': {'vegetarian': True, 'vegan': True, 'gluten_free': True},
                     'allergens': []
                 })
-            ),
-            Product(
-                name='Pasta',
-                description='Spaghetti carbonara',
-                price=11.99,
-                dietary_info=json.dumps({
+            },
+            {
+                'name': 'Pasta',
+                'description': 'Spaghetti carbonara',
+                'price': 11.99,
+                'dietary_info': json.dumps({
                     'dietary_preferences': {'vegetarian': True, 'vegan': False, 'gluten_free': False},
                     'allergens': ['dairy', 'gluten']
                 })
-            )
+            }
         ]
         
-        for product in products:
-            db.session.add(product)
-
-        db.session.commit()
+        product_ids = bulk_insert(Product, products)
 
         # Create sample orders
         orders = [
-            Order(
-                employee_id=1,
-                product_id=1,
-                quantity=2,
-                price=10.99,
-                order_time=datetime.utcnow() - timedelta(days=1),
-                status='order_delivered',
-                allowance_used=21.98,
-                credits_used=0.0,
-                estimated_delivery=datetime.utcnow() - timedelta(hours=20)
-            ),
-            Order(
-                employee_id=2,
-                product_id=2,
-                quantity=1,
-                price=12.99,
-                order_time=datetime.utcnow() - timedelta(hours=1),
-                status='preparing_order',
-                allowance_used=12.99,
-                credits_used=0.0,
-                estimated_delivery=datetime.utcnow() + timedelta(minutes=15)
-            )
+            {
+                'employee_id': john.id,
+                'product_id': product_ids[0],
+                'quantity': 2,
+                'price': 10.99,
+                'order_time': datetime.utcnow() - timedelta(days=1),
+                'status': 'order_delivered',
+                'allowance_used': 21.98,
+                'credits_used': 0.0,
+                'estimated_delivery': datetime.utcnow() - timedelta(hours=20)
+            },
+            {
+                'employee_id': jane.id,
+                'product_id': product_ids[1],
+                'quantity': 1,
+                'price': 12.99,
+                'order_time': datetime.utcnow() - timedelta(hours=1),
+                'status': 'preparing_order',
+                'allowance_used': 12.99,
+                'credits_used': 0.0,
+                'estimated_delivery': datetime.utcnow() + timedelta(minutes=15)
+            }
         ]
         
-        for order in orders:
-            db.session.add(order)
-
+        bulk_insert(Order, orders)
         db.session.commit()
         
         # Verify employees were created correctly
@@ -877,6 +1044,10 @@ def request_refund():
 # Create all tables after model definitions
 with app.app_context():
     db.create_all()
+    # create_all() leaves existing tables alone; `python migrations.py` adds the indexes
+    # they are missing before a deploy, or set DB_CREATE_INDEXES_ON_START=1
+    if app.config['DB_CREATE_INDEXES_ON_START']:
+        create_missing_indexes(db.engine)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
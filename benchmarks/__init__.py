@@ -0,0 +1,4 @@
+"""Offline benchmarks; run them as modules from the repository root, e.g.
+
+    python -m benchmarks.sparse_vs_faiss
+"""
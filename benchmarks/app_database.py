@@ -0,0 +1,46 @@
+"""The app, imported against a database a benchmark may wipe.
+
+The benchmarks seed through /init_db, which deletes every row. DATABASE_URL is the
+app's real database setting, so it is never used as it stands: the app gets a
+temporary SQLite file, removed afterwards, unless the script was given an explicit
+--database URL.
+
+    with app_database(args.database, prefix='my_bench_') as app_module:
+        client = app_module.app.test_client()
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+
+
+def add_database_argument(parser):
+    parser.add_argument('--database', help='database URL to benchmark; it is wiped and re-seeded '
+                                           '(default: a temporary SQLite file)')
+
+
+@contextlib.contextmanager
+def app_database(database=None, prefix='benchmark_', seed=True, quiet=False):
+    """Import the app against `database` or a temporary SQLite file and yield the app module.
+
+    With seed, /init_db runs first; with quiet, the app's import and seeding output is
+    dropped. Nothing here reaches the LLM, but the chat engine insists on a key.
+    """
+    directory = None
+    if database:
+        os.environ['DATABASE_URL'] = database
+    else:
+        directory = tempfile.mkdtemp(prefix=prefix)
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        os.environ['CHAT_SESSION_DB_PATH'] = os.path.join(directory, 'chat_sessions.db')
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark-key')
+    try:
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext():
+                import app as app_module
+                if seed:
+                    app_module.app.test_client().get('/init_db')
+        yield app_module
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
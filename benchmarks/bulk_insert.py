@@ -0,0 +1,137 @@
+"""Rows per second for ORM-per-object writes versus bulk_insert().
+
+    python -m benchmarks.bulk_insert [--rows 5000] [--batch 500] [--database URL]
+
+Imports the app against a throwaway SQLite database (or --database, which is wiped) and writes
+--rows orders and --rows support tickets in each of these ways, emptying the table
+in between:
+
+    orm, commit each    session.add() and commit() per row, as the ticket routes do
+    orm, one commit     session.add() per row and one commit, as place_order used to
+    bulk_insert         bulk.bulk_insert() in batches of --batch rows, one commit
+
+and then creates the tickets over HTTP, once through POST /api/support/tickets per
+ticket and once, logged in, through POST /api/support/tickets/batch, --batch tickets
+(at most SUPPORT_TICKET_BATCH_MAX) a request.
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+from datetime import datetime
+
+from benchmarks.app_database import add_database_argument, app_database
+
+
+def order_rows(count, employee_id, product_id):
+    now = datetime.utcnow()
+    return [{'employee_id': employee_id, 'product_id': product_id, 'quantity': 1 + number % 3, 'price': 9.99,
+             'order_time': now, 'status': 'order_received', 'allowance_used': 0.0, 'credits_used': 0.0}
+            for number in range(count)]
+
+
+def ticket_rows(count):
+    return [{'customer_email': f"bulk{number}@techcorp.com", 'issue': f"Bulk benchmark ticket {number}",
+             'ticket_type': 'general'}
+            for number in range(count)]
+
+
+def timed(write, model, rows):
+    from db import db
+
+    model.query.delete()
+    db.session.commit()
+    started = time.perf_counter()
+    write(model, rows)
+    seconds = time.perf_counter() - started
+    written = model.query.count()
+    if written != len(rows):
+        raise RuntimeError(f"{model.__name__}: wrote {written} rows, expected {len(rows)}")
+    return len(rows) / seconds
+
+
+def orm_commit_each(model, rows):
+    from db import db
+
+    for row in rows:
+        db.session.add(model(**row))
+        db.session.commit()
+
+
+def orm_one_commit(model, rows):
+    from db import db
+
+    for row in rows:
+        db.session.add(model(**row))
+    db.session.commit()
+
+
+def run(app_module, rows, batch):
+    from bulk import bulk_insert
+    from db import db
+    from models import Employee, Order, Product, SupportTicket
+
+    def bulk(model, model_rows):
+        bulk_insert(model, model_rows, batch_size=batch)
+        db.session.commit()
+
+    client = app_module.app.test_client()
+    client.post('/login', json={'email': 'john@techcorp.com', 'password': 'password123'})
+    per_request = min(batch, app_module.app.config['SUPPORT_TICKET_BATCH_MAX'])
+    results = {'rows': rows, 'batch': batch, 'database': app_module.app.config['SQLALCHEMY_DATABASE_URI']}
+    with app_module.app.app_context():
+        employee_id = Employee.query.first().id
+        product_id = Product.query.first().id
+        for name, write in (('orm, commit each', orm_commit_each), ('orm, one commit', orm_one_commit),
+                            ('bulk_insert', bulk)):
+            results[name] = {
+                'orders_per_second': timed(write, Order, order_rows(rows, employee_id, product_id)),
+                'tickets_per_second': timed(write, SupportTicket, ticket_rows(rows))
+            }
+
+        def post_each(model, model_rows):
+            for row in model_rows:
+                client.post('/api/support/tickets', json=row)
+
+        def post_batches(model, model_rows):
+            for start in range(0, len(model_rows), per_request):
+                client.post('/api/support/tickets/batch', json={'tickets': model_rows[start:start + per_request]})
+
+        results['http'] = {
+            'POST /api/support/tickets': timed(post_each, SupportTicket, ticket_rows(rows)),
+            'POST /api/support/tickets/batch': timed(post_batches, SupportTicket, ticket_rows(rows))
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000, help='rows written per method and table')
+    parser.add_argument('--batch', type=int, default=500, help='rows per bulk statement and per batch request')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    add_database_argument(parser)
+    args = parser.parse_args()
+
+    with app_database(args.database, prefix='bulk_insert_', quiet=True) as app_module:
+        # The ticket routes log every request; keep the report readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = run(app_module, args.rows, args.batch)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.rows} rows per method and table, {args.batch} rows per bulk statement, {results['database']}")
+    baseline = results['orm, commit each']
+    print(f"{'method':<22}{'orders/s':>12}{'tickets/s':>12}{'vs commit each':>16}")
+    for name in ('orm, commit each', 'orm, one commit', 'bulk_insert'):
+        result = results[name]
+        print(f"{name:<22}{result['orders_per_second']:>12.0f}{result['tickets_per_second']:>12.0f}"
+              f"{result['tickets_per_second'] / baseline['tickets_per_second']:>15.1f}x")
+    print("\nOver HTTP (tickets/s):")
+    for name, rate in results['http'].items():
+        print(f"  {name:<34}{rate:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""End-to-end load test of the chat endpoints against the local mock LLM server.
+
+    python -m benchmarks.chat_load [--workers 2] [--users 40] [--concurrency 10] [--stream] [--database URL]
+
+Starts mock_openai_server.py in this process and --workers app processes pointed at it,
+each serving on its own port and sharing a throwaway SQLite database (or --database,
+which is wiped) and chat session database, seeds it through /init_db and then plays
+--users virtual customers, --concurrency at a time. Every customer logs in, looks up
+its orders and runs one of the multi-turn SCRIPTS below against /api/chat (or
+/api/chat/stream with --stream, which also measures time to the first delta), pinned
+to one worker like a sticky load balancer would. Use --latency and --token-delay to
+give the mock a realistic model speed.
+
+It reports throughput, p50/p95/p99 latency per script and overall, the error rate
+(HTTP errors, failed requests and the app's fallback apology), the number of LLM calls
+the mock received and the peak resident memory of every worker. No OpenAI access is
+needed; only the standard library is used for HTTP.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.app_database import add_database_argument
+from benchmarks.sparse_vs_faiss import percentile
+from mock_openai_server import MockConfig, start_mock_server
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_CODE = "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)"
+USERS = [('john@techcorp.com', 'password123'), ('jane@techcorp.com', 'password123')]
+FALLBACK_PREFIX = "I apologize, but I'm having trouble"
+
+# Multi-turn conversations; {order_id} is one of the customer's own orders
+SCRIPTS = {
+    'policy': [
+        "What is the refund policy?",
+        "How long does a refund take?",
+        "Can I change my delivery address after ordering?",
+    ],
+    'balance': [
+        "What is my meal allowance?",
+        "How many credits do I have?",
+        "What is the status of my last order?",
+    ],
+    'order': [
+        "Where is order {order_id}?",
+        "Can I get a refund for a late delivery?",
+        "Thanks for your help",
+    ],
+    'cancellation': [
+        "I want to cancel order {order_id}",
+        "I ordered the wrong meal by mistake",
+        "Thank you",
+    ],
+    'escalation': [
+        "My food arrived cold and damaged",
+        "I want to speak to a human agent",
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    """Cookie-keeping JSON client for one customer's browser session"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={'Content-Type': 'application/json'} if data else {})
+        return self.opener.open(request, timeout=self.timeout)
+
+    def call(self, path, payload=None):
+        """Return (status, decoded JSON body or None)"""
+        try:
+            with self._request(path, payload) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def stream(self, path, payload):
+        """Read a Server-Sent Events reply; return (status, text, seconds to first delta)"""
+        start = time.perf_counter()
+        first = None
+        parts = []
+        try:
+            with self._request(path, payload) as response:
+                event = None
+                for raw in response:
+                    line = raw.decode('utf-8').rstrip('\n')
+                    if line.startswith('event: '):
+                        event = line[7:]
+                    elif line.startswith('data: '):
+                        data = json.loads(line[6:])
+                        if event == 'error':
+                            parts.append(data.get('error', ''))
+                        elif 'delta' in data:
+                            if first is None:
+                                first = time.perf_counter() - start
+                            parts.append(data['delta'])
+                    elif not line:
+                        event = None
+                return response.status, ''.join(parts), first
+        except urllib.error.HTTPError as e:
+            return e.code, '', first
+
+
+def start_worker(port, env, log):
+    return subprocess.Popen([sys.executable, '-c', WORKER_CODE.format(port=port)], cwd=REPO_DIR,
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Worker on {base_url} exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/login', timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Worker on {base_url} did not start within {timeout}s")
+
+
+def worker_memory(pid):
+    """(current, peak) resident memory of a process in MB, from /proc"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def run_user(number, base_url, args):
+    """Log one customer in and play its script; return one result per turn"""
+    name = sorted(SCRIPTS)[number % len(SCRIPTS)]
+    email, password = USERS[number % len(USERS)]
+    client = Client(base_url, timeout=args.timeout)
+    results = []
+
+    status, _ = client.call('/login', {'email': email, 'password': password})
+    if status != 200:
+        return [{'script': name, 'turn': 0, 'latency': 0.0, 'first': None, 'ok': False}]
+    status, orders = client.call('/api/orders/history')
+    order_ids = [order['id'] for order in orders or []] or [1]
+    order_id = order_ids[number % len(order_ids)]
+
+    for turn, template in enumerate(SCRIPTS[name]):
+        message = template.format(order_id=order_id)
+        start = time.perf_counter()
+        first = None
+        try:
+            if args.stream:
+                status, text, first = client.stream('/api/chat/stream', {'message': message})
+            else:
+                status, body = client.call('/api/chat', {'message': message})
+                text = (body or {}).get('response') or ''
+            ok = status == 200 and bool(text) and not text.startswith(FALLBACK_PREFIX)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"User {number} turn {turn}: {str(e)}")
+            ok = False
+        results.append({'script': name, 'turn': turn, 'latency': time.perf_counter() - start,
+                        'first': first, 'ok': ok})
+        if args.think:
+            time.sleep(args.think)
+    return results
+
+
+def summarize(results):
+    latencies = sorted(r['latency'] for r in results if r['ok'])
+    firsts = sorted(r['first'] for r in results if r['ok'] and r['first'] is not None)
+    summary = {
+        'turns': len(results),
+        'errors': sum(1 for r in results if not r['ok']),
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+    }
+    if firsts:
+        summary['first_delta_p50_ms'] = percentile(firsts, 50) * 1000
+        summary['first_delta_p95_ms'] = percentile(firsts, 95) * 1000
+    return summary
+
+
+def _ms(value):
+    return f"{value:8.1f}" if value is not None else '       -'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='app processes to start')
+    parser.add_argument('--users', type=int, default=40, help='virtual customers to run')
+    parser.add_argument('--concurrency', type=int, default=10, help='customers active at once')
+    parser.add_argument('--stream', action='store_true', help='use /api/chat/stream instead of /api/chat')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds a customer waits between turns')
+    parser.add_argument('--latency', type=float, default=0.2, help='mock seconds before the first byte')
+    parser.add_argument('--token-delay', type=float, default=0.005, help='mock seconds per generated token')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of LLM calls the mock fails')
+    parser.add_argument('--session-backend', choices=('memory', 'sqlite'),
+                        help='CHAT_SESSION_BACKEND for the workers (sqlite shares sessions between them)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds per request')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    add_database_argument(parser)
+    args = parser.parse_args()
+
+    mock = MockConfig(latency=args.latency, token_delay=args.token_delay, error_rate=args.error_rate)
+    server, mock_url = start_mock_server(config=mock)
+    env = dict(os.environ, OPENAI_BASE_URL=mock_url, OPENAI_API_KEY='mock-key')
+    if args.session_backend:
+        env['CHAT_SESSION_BACKEND'] = args.session_backend
+    # /init_db wipes the database: whatever DATABASE_URL says, use a temporary one unless
+    # --database names one
+    data_dir = tempfile.TemporaryDirectory(prefix='chat_load_')
+    env['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(data_dir.name, 'shop.db')}"
+    env['CHAT_SESSION_DB_PATH'] = os.path.join(data_dir.name, 'chat_sessions.db')
+
+    log = tempfile.NamedTemporaryFile(prefix='chat_load_', suffix='.log', delete=False)
+    workers = []
+    peaks = {}
+    stop = threading.Event()
+    try:
+        for _ in range(args.workers):
+            # One at a time: every worker runs db.create_all() on import
+            port = free_port()
+            workers.append((f"http://127.0.0.1:{port}", start_worker(port, env, log)))
+            wait_ready(*workers[-1])
+        Client(workers[0][0]).call('/init_db')
+        requests_before = mock.requests
+
+        def sample_memory():
+            while not stop.wait(0.5):
+                for _, process in workers:
+                    rss, _ = worker_memory(process.pid)
+                    if rss is not None:
+                        peaks[process.pid] = max(peaks.get(process.pid, 0.0), rss)
+
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_user, n, workers[n % len(workers)][0], args) for n in range(args.users)]
+            results = [r for future in futures for r in future.result()]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+
+        llm_calls = mock.requests - requests_before
+        report = {
+            'workers': args.workers, 'users': args.users, 'concurrency': args.concurrency,
+            'stream': args.stream, 'seconds': elapsed,
+            'turns_per_second': len(results) / elapsed if elapsed else 0.0,
+            'llm_calls': llm_calls,
+            'llm_calls_per_turn': llm_calls / len(results) if results else 0.0,
+            'overall': summarize(results),
+            'scripts': {name: summarize([r for r in results if r['script'] == name]) for name in sorted(SCRIPTS)},
+            'memory_mb': [{'pid': process.pid, 'peak_rss': peaks.get(process.pid),
+                           'rss': worker_memory(process.pid)[0], 'hwm': worker_memory(process.pid)[1]}
+                          for _, process in workers],
+        }
+    finally:
+        stop.set()
+        for _, process in workers:
+            process.terminate()
+        for _, process in workers:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        server.shutdown()
+        log.close()
+        data_dir.cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    overall = report['overall']
+    print(f"{args.users} users on {args.workers} workers, {args.concurrency} concurrent, "
+          f"{'streaming' if args.stream else 'non-streaming'}; worker logs in {log.name}")
+    print(f"{overall['turns']} turns in {elapsed:.1f}s: {report['turns_per_second']:.1f} turns/s, "
+          f"{overall['errors']} errors ({overall['errors'] / max(overall['turns'], 1):.1%}), "
+          f"{llm_calls} LLM calls ({report['llm_calls_per_turn']:.2f} per turn)")
+    print(f"{'script':<14}{'turns':>6}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + (f"{'1st p50':>9}{'1st p95':>9}" if args.stream else ''))
+    for name, summary in list(report['scripts'].items()) + [('overall', overall)]:
+        line = (f"{name:<14}{summary['turns']:>6}{summary['errors']:>7} {_ms(summary['p50_ms'])}"
+                f" {_ms(summary['p95_ms'])} {_ms(summary['p99_ms'])}")
+        if args.stream:
+            line += f" {_ms(summary.get('first_delta_p50_ms'))} {_ms(summary.get('first_delta_p95_ms'))}"
+        print(line)
+    for entry in report['memory_mb']:
+        print(f"worker {entry['pid']}: peak RSS {_ms(entry['peak_rss'])} MB, high-water mark {_ms(entry['hwm'])} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Concurrent checkouts against one employee's balances, checked for overspend.
+
+    python -m benchmarks.checkout_stress [--threads 16] [--checkouts 20] [--replays 16] [--database URL]
+
+Imports the app against a throwaway SQLite database (or --database, which is wiped) and runs two
+scenarios, then checks the database:
+
+    racing     --threads clients logged in as the same employee each fill the cart and
+               check out --checkouts times, every checkout with its own key. However
+               the requests interleave, the allowance and credits must never go below
+               zero, what the orders record as paid from them must equal what left the
+               balances, and no cart row may be ordered twice.
+    replays    --replays clients send the same Idempotency-Key at once, as a client
+               retrying a timed-out request would. Exactly one checkout may be placed,
+               and every response must carry its order id.
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import uuid
+
+from benchmarks.app_database import add_database_argument, app_database
+
+EPSILON = 1e-6
+PASSWORD = 'password123'
+
+
+def make_employee(app_module, email, meal_allowance, credit_balance):
+    from db import db
+    from models import Employee
+
+    with app_module.app.app_context():
+        employee = Employee(email=email, name='Checkout Stress', password=None, meal_allowance=meal_allowance,
+                            credit_balance=credit_balance, credit_card={'last4': '4242'})
+        # Reuse a seeded hash; hashing is deliberately slow
+        employee.password_hash = Employee.query.filter_by(email='john@techcorp.com').first().password_hash
+        db.session.add(employee)
+        db.session.commit()
+        return employee.id
+
+
+def logged_in_client(app_module, email):
+    client = app_module.app.test_client()
+    client.post('/login', json={'email': email, 'password': PASSWORD})
+    return client
+
+
+def racing(app_module, email, threads, checkouts, seed_value):
+    """Every thread adds to the shared cart and checks out; returns (added quantity, status counts)"""
+    added = [0]
+    statuses = {}
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def run(number):
+        rng = random.Random(seed_value + number)
+        client = logged_in_client(app_module, email)
+        start.wait()
+        for _ in range(checkouts):
+            quantity = rng.randint(1, 3)
+            response = client.post('/api/cart/add', json={'product_id': rng.randint(1, 4), 'quantity': quantity})
+            if response.status_code == 200:
+                with lock:
+                    added[0] += quantity
+            response = client.post('/api/cart/place-order', headers={'Idempotency-Key': str(uuid.uuid4())})
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    workers = [threading.Thread(target=run, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return added[0], statuses
+
+
+def replays(app_module, email, clients):
+    """All clients post one Idempotency-Key at once; returns the order ids they got back"""
+    client = logged_in_client(app_module, email)
+    for product_id in (1, 2):
+        client.post('/api/cart/add', json={'product_id': product_id, 'quantity': 1})
+    key = str(uuid.uuid4())
+    order_ids, replayed = [], [0]
+    lock = threading.Lock()
+    start = threading.Barrier(clients)
+
+    def run():
+        own = logged_in_client(app_module, email)
+        start.wait()
+        response = own.post('/api/cart/place-order', headers={'Idempotency-Key': key})
+        with lock:
+            order_ids.append(response.get_json().get('order_id'))
+            replayed[0] += response.headers.get('Idempotent-Replayed') == 'true'
+
+    workers = [threading.Thread(target=run) for _ in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return order_ids, replayed[0]
+
+
+def check_balances(app_module, employee_id, meal_allowance, credit_balance, added):
+    from models import Employee, Order
+
+    failures = []
+    with app_module.app.app_context():
+        employee = Employee.query.get(employee_id)
+        orders = Order.query.filter(Order.employee_id == employee_id, Order.status != 'cancelled').all()
+        allowance_used = sum(order.allowance_used for order in orders)
+        credits_used = sum(order.credits_used for order in orders)
+        ordered = sum(order.quantity for order in orders)
+        print(f"racing: {len(orders)} orders for {ordered} items ({added} added to the cart); "
+              f"allowance {meal_allowance:.2f} -> {employee.meal_allowance:.2f}, "
+              f"credits {credit_balance:.2f} -> {employee.credit_balance:.2f}")
+        if employee.meal_allowance < -EPSILON or employee.credit_balance < -EPSILON:
+            failures.append('a balance went below zero')
+        if abs(meal_allowance - employee.meal_allowance - allowance_used) > EPSILON:
+            failures.append(f"orders used {allowance_used:.2f} allowance, "
+                            f"the balance fell by {meal_allowance - employee.meal_allowance:.2f}")
+        if abs(credit_balance - employee.credit_balance - credits_used) > EPSILON:
+            failures.append(f"orders used {credits_used:.2f} credits, "
+                            f"the balance fell by {credit_balance - employee.credit_balance:.2f}")
+        if ordered > added:
+            failures.append(f"{ordered} items ordered but only {added} added: a cart row was ordered twice")
+    return failures
+
+
+def check_replays(app_module, employee_id, order_ids, replayed):
+    from models import Order
+
+    failures = []
+    with app_module.app.app_context():
+        checkouts = {order_time for (order_time,) in
+                     Order.query.with_entities(Order.order_time).filter_by(employee_id=employee_id).all()}
+    print(f"replays: {len(order_ids)} requests with one key, {len(checkouts)} checkout(s) placed, "
+          f"{replayed} answered from the stored response, order ids {sorted(set(order_ids), key=str)}")
+    if len(checkouts) != 1:
+        failures.append(f"one key placed {len(checkouts)} checkouts")
+    if len(set(order_ids)) != 1 or order_ids[0] is None:
+        failures.append(f"responses disagree on the order: {sorted(set(order_ids), key=str)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--checkouts', type=int, default=20, help='checkouts per thread')
+    parser.add_argument('--replays', type=int, default=16, help='concurrent requests sharing one key')
+    parser.add_argument('--allowance', type=float, default=500.0, help="the racing employee's meal allowance")
+    parser.add_argument('--credits', type=float, default=100.0, help="the racing employee's credit balance")
+    parser.add_argument('--seed', type=int, default=7)
+    add_database_argument(parser)
+    args = parser.parse_args()
+
+    with app_database(args.database, prefix='checkout_stress_', quiet=True) as app_module:
+        # The app prints a line per cart request; keep the report readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            racer = make_employee(app_module, 'racing@techcorp.com', args.allowance, args.credits)
+            replayer = make_employee(app_module, 'replay@techcorp.com', 1000.0, 0.0)
+            added, statuses = racing(app_module, 'racing@techcorp.com', args.threads, args.checkouts, args.seed)
+            order_ids, replayed = replays(app_module, 'replay@techcorp.com', args.replays)
+        print(f"racing: responses by status {dict(sorted(statuses.items()))}")
+        failures = check_balances(app_module, racer, args.allowance, args.credits, added)
+        failures += check_replays(app_module, replayer, order_ids, replayed)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("OK: no overspend, no cart ordered twice, one checkout per key")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
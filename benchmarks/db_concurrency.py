@@ -0,0 +1,177 @@
+"""Concurrent order placement and ticket creation against one database.
+
+    python -m benchmarks.db_concurrency [--threads 16] [--ops 40] [--compare] [--database URL]
+
+Imports the app against a throwaway SQLite database (or --database, which is wiped),
+gives every thread its own logged-in employee and has all of them write at once: each
+operation is either a checkout (POST /api/cart/add, then /api/cart/place-order) or a
+support ticket (POST /api/support/tickets), picked at random with --ticket-share. It
+reports throughput, latency percentiles per operation and the errors, "database is
+locked" in particular.
+
+The database settings are read from the environment as the app reads them
+(SQLITE_JOURNAL_MODE, SQLITE_BUSY_TIMEOUT_MS, DB_POOL_SIZE, ...). --compare runs the
+benchmark twice in subprocesses, once with the settings the app used to have
+(rollback journal, synchronous=FULL, no pool) and once with the current defaults, and
+prints both side by side.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.app_database import add_database_argument, app_database
+from benchmarks.sparse_vs_faiss import percentile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'password123'
+# What the app ran with before the engine became configurable
+LEGACY_SETTINGS = {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'DB_POOL_SIZE': '0'}
+
+
+def seed(app_module, employees):
+    """Create the products and `employees` benchmark users with ample allowance"""
+    from db import db
+    from models import Employee
+
+    client = app_module.app.test_client()
+    client.get('/init_db')
+    emails = []
+    with app_module.app.app_context():
+        password_hash = Employee.query.filter_by(email='john@techcorp.com').first().password_hash
+        for number in range(employees):
+            employee = Employee(email=f"load{number}@techcorp.com", name=f"Load {number}", password=None,
+                                meal_allowance=1000000.0, credit_balance=0.0)
+            # Hashing a password per user would dominate the setup time
+            employee.password_hash = password_hash
+            db.session.add(employee)
+            emails.append(employee.email)
+        db.session.commit()
+    return emails
+
+
+def run_thread(app_module, email, ops, ticket_share, rng, results, errors, lock, start):
+    client = app_module.app.test_client()
+    client.post('/login', json={'email': email, 'password': PASSWORD})
+    start.wait()
+    for _ in range(ops):
+        if rng.random() < ticket_share:
+            kind = 'ticket'
+            calls = [('/api/support/tickets', {'customer_email': email, 'issue': 'Load test ticket',
+                                               'ticket_type': 'general'})]
+        else:
+            kind = 'checkout'
+            calls = [('/api/cart/add', {'product_id': rng.randint(1, 4), 'quantity': 1}),
+                     ('/api/cart/place-order', None)]
+        started = time.perf_counter()
+        error = None
+        for path, payload in calls:
+            response = client.post(path, json=payload)
+            if response.status_code >= 400:
+                body = response.get_json(silent=True) or {}
+                error = f"{path} HTTP {response.status_code}: {body.get('details') or body.get('error') or ''}"[:120]
+                break
+        seconds = time.perf_counter() - started
+        with lock:
+            results.setdefault(kind, []).append(seconds)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+
+def run(app_module, threads, ops, ticket_share, seed_value):
+    emails = seed(app_module, threads)
+    results, errors = {}, {}
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=run_thread, args=(app_module, email, ops, ticket_share,
+                                                  random.Random(seed_value + number), results, errors, lock, start))
+        for number, email in enumerate(emails)
+    ]
+    # The app prints a line per cart request; keep the report readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for worker in workers:
+            worker.start()
+        start.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+    config = app_module.app.config
+    report = {
+        'database': config['SQLALCHEMY_DATABASE_URI'],
+        'settings': {key: config[key] for key in ('SQLITE_JOURNAL_MODE', 'SQLITE_SYNCHRONOUS',
+                                                  'SQLITE_BUSY_TIMEOUT_MS', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW')},
+        'threads': threads,
+        'seconds': elapsed,
+        'operations': sum(len(timings) for timings in results.values()),
+        'errors': errors,
+        'locked_errors': sum(count for error, count in errors.items() if 'locked' in error),
+        'latency_ms': {}
+    }
+    report['ops_per_second'] = report['operations'] / elapsed if elapsed else 0.0
+    for kind, timings in sorted(results.items()):
+        report['latency_ms'][kind] = {name: percentile(timings, q) * 1000
+                                      for name, q in (('p50', 50), ('p95', 95), ('p99', 99))}
+    return report
+
+
+def print_report(report):
+    print(f"{report['database']}  {json.dumps(report['settings'])}")
+    print(f"  {report['operations']} operations on {report['threads']} threads in {report['seconds']:.1f}s: "
+          f"{report['ops_per_second']:.1f} ops/s, {sum(report['errors'].values())} errors "
+          f"({report['locked_errors']} 'database is locked')")
+    for kind, latency in report['latency_ms'].items():
+        print(f"  {kind:<10} p50 {latency['p50']:8.1f} ms   p95 {latency['p95']:8.1f} ms   p99 {latency['p99']:8.1f} ms")
+    for error, count in sorted(report['errors'].items(), key=lambda item: -item[1])[:5]:
+        print(f"  {count:5d} x {error}")
+
+
+def run_subprocess(args, settings):
+    """One benchmark run in a fresh interpreter, so the app reads `settings` at import"""
+    env = dict(os.environ, **settings)
+    command = [sys.executable, '-m', 'benchmarks.db_concurrency', '--json', '--threads', str(args.threads),
+               '--ops', str(args.ops), '--ticket-share', str(args.ticket_share), '--seed', str(args.seed)]
+    if args.database:
+        command += ['--database', args.database]
+    output = subprocess.run(command, cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    # The app logs to stdout while it starts; the report is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=40, help='operations per thread')
+    parser.add_argument('--ticket-share', type=float, default=0.3, help='fraction of operations that are tickets')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--compare', action='store_true', help='compare the legacy and current SQLite settings')
+    parser.add_argument('--json', action='store_true', help='print the report as one JSON line')
+    add_database_argument(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        # Each run gets its own temporary database
+        reports = [run_subprocess(args, settings) for settings in (LEGACY_SETTINGS, {})]
+        for label, report in zip(('legacy settings', 'current settings'), reports):
+            print(f"== {label}")
+            print_report(report)
+        return
+
+    # seed() runs /init_db itself
+    with app_database(args.database, prefix='db_concurrency_', seed=False) as app_module:
+        report = run(app_module, args.threads, args.ops, args.ticket_share, args.seed)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
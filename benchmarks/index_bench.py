@@ -0,0 +1,194 @@
+"""Order, ticket and cart lookup latency on large tables, without and with the indexes.
+
+    python -m benchmarks.index_bench [--orders 500000] [--employees 5000] [--repeat 200]
+
+Seeds a throwaway SQLite database (never shop.db) with synthetic employees, orders,
+support tickets and cart rows, drops the indexes declared in models.py and times the
+lookups the app makes, the same ORM queries as app.py and rag_engine.py, each with
+random keys. Then it adds the indexes with migrations.create_missing_indexes(), as an
+existing shop.db would get them, and times the lookups again. The SQLite query plans
+are printed for both runs.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from db import db
+from migrations import create_missing_indexes
+from models import Cart, Employee, Order, Product, SupportTicket
+
+TICKET_STATUSES = ['open'] * 5 + ['in_progress'] * 5 + ['resolved'] * 45 + ['closed'] * 45
+TICKET_TYPES = ['general', 'general', 'cancellation', 'refund']
+BATCH = 50000
+
+
+def _email(number):
+    return f"employee{number}@example.com"
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[start:start + BATCH])
+    db.session.commit()
+
+
+def seed(employees, products, orders, tickets, rng):
+    """Fill the tables with synthetic rows, spread over the last two years"""
+    now = datetime.utcnow()
+
+    def moment():
+        return now - timedelta(seconds=rng.randrange(2 * 365 * 24 * 3600))
+
+    _insert(Employee.__table__, [
+        {'email': _email(number), 'name': f"Employee {number}", 'password_hash': '-',
+         'meal_allowance': 50.0, 'credit_balance': 0.0, 'credit_card': {}, 'is_active': True,
+         'failed_login_attempts': 0}
+        for number in range(1, employees + 1)
+    ])
+    _insert(Product.__table__, [
+        {'name': f"Product {number}", 'description': 'Synthetic', 'price': 5.0 + number % 20,
+         'category': 'Test', 'available': True}
+        for number in range(1, products + 1)
+    ])
+    rows = []
+    for _ in range(orders):
+        employee_id = rng.randint(1, employees)
+        rows.append({'employee_id': employee_id, 'product_id': rng.randint(1, products), 'quantity': 1,
+                     'price': 10.0, 'order_time': moment(), 'status': 'order_delivered',
+                     'customer_email': _email(employee_id)})
+    _insert(Order.__table__, rows)
+    rows = []
+    for _ in range(tickets):
+        created = moment()
+        rows.append({'customer_email': _email(rng.randint(1, employees)), 'issue': 'Synthetic',
+                     'status': rng.choice(TICKET_STATUSES), 'ticket_type': rng.choice(TICKET_TYPES),
+                     'created_at': created, 'updated_at': created, 'order_id': rng.randint(1, orders)})
+    _insert(SupportTicket.__table__, rows)
+    _insert(Cart.__table__, [
+        {'employee_id': employee_id, 'product_id': product_id, 'quantity': 1, 'created_at': now}
+        for employee_id in range(1, employees + 1)
+        for product_id in rng.sample(range(1, products + 1), 3)
+    ])
+
+
+def lookups(employees, products):
+    """name -> function(rng) returning the ORM query the app runs, with random keys"""
+    return {
+        'order history': lambda rng: Order.query.filter_by(employee_id=rng.randint(1, employees))
+                                          .order_by(Order.order_time.desc()),
+        'last order by email': lambda rng: Order.query.join(Employee, Order.employee_id == Employee.id)
+                                                .filter(Employee.email == _email(rng.randint(1, employees)))
+                                                .order_by(Order.order_time.desc()).limit(1),
+        'open tickets': lambda rng: SupportTicket.query.filter_by(status='open')
+                                                 .order_by(SupportTicket.created_at.desc()),
+        'open tickets of a type': lambda rng: SupportTicket.query.filter_by(status='open',
+                                                                            ticket_type=rng.choice(TICKET_TYPES))
+                                                           .order_by(SupportTicket.created_at.desc()),
+        'cart contents': lambda rng: Cart.query.filter_by(employee_id=rng.randint(1, employees)),
+        'cart item': lambda rng: Cart.query.filter_by(employee_id=rng.randint(1, employees),
+                                                      product_id=rng.randint(1, products)).limit(1),
+    }
+
+
+def query_plan(query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return [row[-1] for row in rows]
+
+
+def time_lookups(queries, repeat, seed_value):
+    # A fresh session, so no connection predates the schema being measured
+    db.session.remove()
+    results = {}
+    for name, make_query in queries.items():
+        rng = random.Random(seed_value)
+        timings = []
+        for _ in range(repeat):
+            query = make_query(rng)
+            started = time.perf_counter()
+            query.all()
+            timings.append((time.perf_counter() - started) * 1000)
+            db.session.expunge_all()
+        timings.sort()
+        results[name] = {
+            'p50_ms': statistics.median(timings),
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+            'plan': query_plan(make_query(random.Random(seed_value)))
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=500000)
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--tickets', type=int, default=None, help='default: a quarter of --orders')
+    parser.add_argument('--repeat', type=int, default=200, help='lookups timed per query')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--keep', action='store_true', help='keep the database file and print its path')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+    tickets = args.tickets if args.tickets is not None else args.orders // 4
+
+    handle, path = tempfile.mkstemp(prefix='index_bench_', suffix='.db')
+    os.close(handle)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    try:
+        with app.app_context():
+            db.create_all()
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.drop(bind=db.engine)
+
+            started = time.perf_counter()
+            seed(args.employees, args.products, args.orders, tickets, random.Random(args.seed))
+            print(f"Seeded {args.orders} orders, {tickets} tickets, {args.employees} employees "
+                  f"in {time.perf_counter() - started:.1f}s")
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('ANALYZE')
+
+            queries = lookups(args.employees, args.products)
+            before = time_lookups(queries, args.repeat, args.seed)
+            started = time.perf_counter()
+            create_missing_indexes(db.engine, analyze=True)
+            index_seconds = time.perf_counter() - started
+            after = time_lookups(queries, args.repeat, args.seed)
+    finally:
+        if args.keep:
+            print(f"Database kept at {path}")
+        else:
+            os.remove(path)
+
+    if args.json:
+        print(json.dumps({'orders': args.orders, 'tickets': tickets, 'employees': args.employees,
+                          'index_seconds': index_seconds, 'before': before, 'after': after}, indent=2))
+        return
+
+    print(f"Indexes built in {index_seconds:.1f}s\n")
+    print(f"{'lookup':<24}{'before p50':>12}{'p95':>10}{'after p50':>12}{'p95':>10}{'speedup':>10}")
+    for name in queries:
+        b, a = before[name], after[name]
+        speedup = b['p50_ms'] / a['p50_ms'] if a['p50_ms'] else float('inf')
+        print(f"{name:<24}{b['p50_ms']:>10.2f}ms{b['p95_ms']:>8.2f}ms"
+              f"{a['p50_ms']:>10.2f}ms{a['p95_ms']:>8.2f}ms{speedup:>9.1f}x")
+    print("\nQuery plans (before -> after):")
+    for name in queries:
+        print(f"  {name}")
+        print(f"    before: {' / '.join(before[name]['plan'])}")
+        print(f"    after:  {' / '.join(after[name]['plan'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""SQL statement counts per endpoint, to catch N+1 query regressions.
+
+    python -m benchmarks.query_counts [--items 1 8] [--json] [--database URL]
+
+Imports the app against a throwaway SQLite database (or --database, which is wiped),
+seeds it through /init_db, logs in and calls each endpoint below with carts and order
+histories of every --items size, counting the SQL statements each request issues. An
+endpoint fails the check when its number of SELECTs grows with the number of items (one
+query per row) or exceeds its budget in QUERY_BUDGETS; writes are reported alongside.
+Exits with status 1 on any failure. tests/test_query_counts.py runs the same check
+under pytest.
+"""
+import argparse
+import json
+import sys
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.app_database import add_database_argument, app_database
+
+# SELECTs allowed per request, including the login manager's user lookup
+QUERY_BUDGETS = {
+    'GET /api/user/info': 2,
+    'GET /api/orders/history': 2,
+    'GET /api/orders/<id>': 2,
+    'GET /order-history': 1,
+    # Plus SELECT last_insert_rowid() after the orders' bulk insert on SQLite
+    'POST /api/cart/place-order': 3,
+    'POST /api/chat (last order status)': 2,
+}
+
+
+class QueryCounter:
+    """Counts SQL statements (reads and writes) executed by any engine while active"""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.statements = []
+        self._active = False
+        self._lock = threading.Lock()
+        event.listen(Engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self._active:
+            with self._lock:
+                if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    self.reads += 1
+                else:
+                    self.writes += 1
+                self.statements.append(' '.join(statement.split())[:160])
+
+    def __enter__(self):
+        self.reads = 0
+        self.writes = 0
+        self.statements = []
+        self._active = True
+        return self
+
+    def __exit__(self, *exc):
+        self._active = False
+        return False
+
+    def close(self):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+
+def seed(app_module, email, items):
+    """Give the employee `items` distinct products in the cart and `items` past orders"""
+    from db import db
+    from models import Cart, Employee, Order, Product
+
+    with app_module.app.app_context():
+        employee = Employee.query.filter_by(email=email).first()
+        Cart.query.filter_by(employee_id=employee.id).delete()
+        Order.query.filter_by(employee_id=employee.id).delete()
+        products = Product.query.order_by(Product.id).all()
+        for number in range(len(products), items):
+            product = Product(name=f"Query check item {number}", description='Seeded by query_counts',
+                              price=5.0, category='Test', available=True)
+            db.session.add(product)
+            products.append(product)
+        db.session.flush()
+        for product in products[:items]:
+            db.session.add(Cart(employee_id=employee.id, product_id=product.id, quantity=1))
+            db.session.add(Order(employee_id=employee.id, product_id=product.id, quantity=1, price=product.price,
+                                 customer_email=email))
+        employee.meal_allowance = 1000.0
+        db.session.commit()
+
+
+def measure(client, counter, app_module, email, items):
+    """(reads, writes) per endpoint for one data size, and the statements issued"""
+    seed(app_module, email, items)
+    counts, statements = {}, {}
+
+    def call(name, method, path, payload=None):
+        with counter:
+            response = client.open(path, method=method, json=payload)
+        if response.status_code >= 400:
+            print(f"{name}: HTTP {response.status_code}")
+        counts[name] = (counter.reads, counter.writes)
+        statements[name] = counter.statements
+        return response
+
+    call('GET /api/user/info', 'GET', '/api/user/info')
+    orders = call('GET /api/orders/history', 'GET', '/api/orders/history').get_json()
+    call('GET /api/orders/<id>', 'GET', f"/api/orders/{orders[0]['id']}")
+    call('GET /order-history', 'GET', '/order-history')
+    call('POST /api/chat (last order status)', 'POST', '/api/chat',
+         {'message': 'what is the status of my last order?'})
+    call('POST /api/cart/place-order', 'POST', '/api/cart/place-order')
+    return counts, statements
+
+
+def check(results, sizes):
+    """The budget and growth failures of measure() results keyed by size"""
+    failures = []
+    for name, budget in QUERY_BUDGETS.items():
+        reads = [results[items][name][0] for items in sizes]
+        if len(set(reads)) > 1:
+            failures.append(f"{name}: SELECT count grows with the data ({reads})")
+        if max(reads) > budget:
+            failures.append(f"{name}: {max(reads)} SELECTs, budget {budget}")
+    return failures
+
+
+def run(app_module, counter, sizes):
+    """Seed the database, log in and measure every size; returns (counts, statements) by size"""
+    client = app_module.app.test_client()
+    client.get('/init_db')
+    email = 'john@techcorp.com'
+    client.post('/login', json={'email': email, 'password': 'password123'})
+    results, statements = {}, {}
+    for items in sizes:
+        results[items], statements[items] = measure(client, counter, app_module, email, items)
+    return results, statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 8], help='cart and order sizes to compare')
+    parser.add_argument('--json', action='store_true', help='print the counts as JSON')
+    parser.add_argument('--verbose', action='store_true', help='list the statements of the largest size')
+    add_database_argument(parser)
+    args = parser.parse_args()
+
+    # run() seeds the database itself
+    with app_database(args.database, prefix='query_counts_', seed=False) as app_module:
+        counter = QueryCounter()
+        results, statements = run(app_module, counter, args.items)
+        counter.close()
+    failures = check(results, args.items)
+
+    if args.json:
+        print(json.dumps({'budgets': QUERY_BUDGETS, 'counts': results, 'failures': failures}, indent=2))
+    else:
+        print("SELECTs / writes per request")
+        print(f"{'endpoint':<38}" + ''.join(f"{f'{items} items':>12}" for items in args.items) + f"{'budget':>8}")
+        for name, budget in QUERY_BUDGETS.items():
+            print(f"{name:<38}" + ''.join(f"{'%d / %d' % results[items][name]:>12}" for items in args.items)
+                  + f"{budget:>8}")
+        if args.verbose:
+            largest = max(args.items)
+            for name in QUERY_BUDGETS:
+                print(f"\n{name} ({largest} items):")
+                for statement in statements[largest][name]:
+                    print(f"  {statement}")
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if not failures:
+            print("OK: no endpoint issues a query per row")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
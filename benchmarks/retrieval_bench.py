@@ -0,0 +1,127 @@
+"""Retrieval quality and latency benchmark over a labelled query set.
+
+    python -m benchmarks.retrieval_bench [RESOURCES_DIR ...] [--scoring cosine bm25] [--k 1 3 5]
+
+Every RESOURCES_DIR holds a published index build (default: resources/). To try a
+change, publish an alternative build elsewhere and compare the two side by side:
+
+    python index_builder.py --resources /tmp/chunk400 --chunk-size 400
+    python -m benchmarks.retrieval_bench resources /tmp/chunk400
+
+Per index and scoring it reports recall@k (share of the labelled sections found in the
+top k), MRR, p50/p95/p99 single-query latency, batched latency per query, Python heap
+allocated while loading and the size of the memory-mapped build files. The labels in
+benchmarks/support_queries.jsonl name SOP sections, so they stay valid when chunking
+changes. Runs offline; no OpenAI access is needed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.retrieval_eval import is_relevant, load_queries
+from benchmarks.sparse_vs_faiss import percentile
+from index_builder import current_build_dir
+from retrieval import RetrievalIndex
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'support_queries.jsonl')
+
+
+def quality(index, items, ks):
+    """recall@k for each k and MRR over the largest k"""
+    results = index.retrieve_batch([item['query'] for item in items], max(ks))
+    recall = {k: 0.0 for k in ks}
+    reciprocal_ranks = 0.0
+    for item, hits in zip(items, results):
+        labels = item['relevant']
+        for k in ks:
+            found = sum(1 for label in labels if any(is_relevant(hit, [label]) for hit in hits[:k]))
+            recall[k] += found / len(labels)
+        for rank, hit in enumerate(hits, 1):
+            if is_relevant(hit, labels):
+                reciprocal_ranks += 1 / rank
+                break
+    metrics = {f"recall@{k}": recall[k] / len(items) for k in ks}
+    metrics[f"mrr@{max(ks)}"] = reciprocal_ranks / len(items)
+    return metrics
+
+
+def latency(index, queries, k, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            index.search_ids(query, k)
+            timings.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        index.search_batch(queries, k)
+    batched = (time.perf_counter() - started) * 1000 / (repeat * len(queries))
+    return {
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'batched_ms_per_query': batched
+    }
+
+
+def memory_and_load(sop, resources_dir, scoring):
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = RetrievalIndex(sop, resources_dir=resources_dir, scoring=scoring)
+    load_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    build_dir = current_build_dir(resources_dir)
+    mapped = 0
+    if build_dir:
+        mapped = sum(os.path.getsize(os.path.join(build_dir, name)) for name in os.listdir(build_dir)
+                     if name.endswith(('.npy', '.bin', '.faiss')))
+    return index, {
+        'load_s': load_seconds,
+        'heap_peak_mb': peak / 2 ** 20,
+        'mapped_mb': mapped / 2 ** 20,
+        'chunks': len(index.chunks)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('resources', nargs='*', default=['resources'], help='resources directories to compare')
+    parser.add_argument('--queries', default=DEFAULT_QUERIES, help='labelled JSONL query set')
+    parser.add_argument('--sop', default='support_sop.txt')
+    parser.add_argument('--scoring', nargs='+', default=['cosine'], choices=('cosine', 'bm25'))
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5])
+    parser.add_argument('--latency-k', type=int, default=3, help='k used for the latency runs')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    items = [item for item in load_queries(args.queries) if item.get('relevant')]
+    if not items:
+        parser.error(f"{args.queries} has no labelled queries")
+
+    columns = {}
+    for resources_dir in args.resources:
+        for scoring in args.scoring:
+            index, metrics = memory_and_load(args.sop, resources_dir, scoring)
+            metrics.update(quality(index, items, sorted(args.k)))
+            metrics.update(latency(index, [item['query'] for item in items], args.latency_k, args.repeat))
+            columns[f"{resources_dir}:{scoring}"] = metrics
+
+    if args.json:
+        print(json.dumps(columns, indent=2))
+        return 0
+    names = list(columns)
+    print(f"{len(items)} labelled queries from {args.queries}")
+    print(f"{'':<22}" + ''.join(f"{name[-24:]:>26}" for name in names))
+    for metric in columns[names[0]]:
+        print(f"{metric:<22}" + ''.join(f"{columns[name][metric]:>26.3f}" for name in names))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
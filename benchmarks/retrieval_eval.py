@@ -0,0 +1,72 @@
+"""Offline retrieval evaluation: run a query file through RetrievalIndex.retrieve_batch.
+
+    python -m benchmarks.retrieval_eval QUERIES [--k 3] [--output results.jsonl]
+
+QUERIES is a text file with one query per line, or a JSONL file of
+{"query": ..., "relevant": ["Refund Processing", ...]} where `relevant` lists
+substrings of the citations of acceptable chunks. Every query is retrieved in a single
+batched call with no OpenAI access. Results (ids, scores, citations) are written as
+JSONL for diffing between index builds, and hit@k is reported when labels are given.
+"""
+import argparse
+import json
+import sys
+
+from index_builder import RESOURCES_DIR
+from retrieval import RetrievalIndex, read_query_file
+
+
+def load_queries(path):
+    """[{'query', 'relevant'}, ...] from a .jsonl or plain text query file"""
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return [{'query': query, 'relevant': []} for query in read_query_file(path)]
+
+
+def is_relevant(hit, relevant):
+    return any(label.lower() in hit['citation'].lower() for label in relevant)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('queries')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--sop', default='support_sop.txt')
+    parser.add_argument('--resources', default=RESOURCES_DIR)
+    parser.add_argument('--scoring', default='cosine', choices=('cosine', 'bm25'))
+    parser.add_argument('--output', help='write per-query results as JSONL')
+    args = parser.parse_args()
+
+    items = load_queries(args.queries)
+    index = RetrievalIndex(args.sop, resources_dir=args.resources, scoring=args.scoring)
+    results = index.retrieve_batch([item['query'] for item in items], args.k)
+
+    labelled = hits = 0
+    output = open(args.output, 'w') if args.output else None
+    try:
+        for item, hits_for_query in zip(items, results):
+            found = any(is_relevant(hit, item.get('relevant', [])) for hit in hits_for_query)
+            if item.get('relevant'):
+                labelled += 1
+                hits += found
+            if output:
+                output.write(json.dumps({'query': item['query'], 'results': [
+                    {'id': hit['id'], 'score': hit['score'], 'citation': hit['citation']} for hit in hits_for_query
+                ]}) + '\n')
+            else:
+                mark = '' if not item.get('relevant') else (' ok' if found else ' MISS')
+                print(f"{item['query']}{mark}")
+                for hit in hits_for_query:
+                    print(f"    {hit['score']:.3f}  {hit['citation']}")
+    finally:
+        if output:
+            output.close()
+
+    if labelled:
+        print(f"hit@{args.k}: {hits / labelled:.3f} ({hits}/{labelled} labelled queries)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
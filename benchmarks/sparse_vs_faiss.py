@@ -0,0 +1,135 @@
+"""Sparse inverted index vs. the dense FAISS flat L2 index, on recall and latency.
+
+    python -m benchmarks.sparse_vs_faiss [--sizes 1000 10000 30000] [--k 3]
+
+The SOP chunks are padded with synthetic chunks (shuffled SOP sentences) up to each
+corpus size. Recall@k is measured against exact cosine similarity on the TF-IDF
+vectors, which FAISS (L2 on unit vectors) and sparse-cosine both compute; for bm25 it
+only shows how far its ranking departs from cosine.
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+import faiss
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from index_builder import CHUNK_OVERLAP, CHUNK_SIZE, VECTORIZER_PARAMS
+from ingestion import iter_chunks, iter_sections
+from sparse_index import SparseRetriever, postings_from_counts, term_counts
+
+QUERIES = [
+    "how do I get a refund for a late delivery",
+    "can I cancel my order",
+    "my order is missing an item",
+    "when does my meal allowance refresh",
+    "how are credits earned",
+    "do credits expire",
+    "what are the support hours",
+    "my credit card was declined",
+    "which expense codes do I need",
+    "I forgot my password",
+    "my account is locked",
+    "allergen information for menu items",
+    "talk to a human agent",
+    "track my delivery",
+    "food arrived cold",
+    "premium support response time",
+]
+
+
+def corpus(sop_path, size, seed=0):
+    chunks = [record['text'] for record in iter_chunks(iter_sections([sop_path]), CHUNK_SIZE, CHUNK_OVERLAP)]
+    sentences = [s for s in re.split(r'[\n.]+', open(sop_path).read()) if len(s.split()) > 3]
+    rng = random.Random(seed)
+    while len(chunks) < size:
+        chunks.append(' '.join(rng.sample(sentences, 3)))
+    return chunks[:size]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def timed(search, queries, repeat):
+    """Per-query latencies (ms) and the per-query cost of one batched call"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            search([query])
+            latencies.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        search(queries)
+    batched = (time.perf_counter() - started) * 1000 / (repeat * len(queries))
+    return latencies, batched
+
+
+def recall(results, exact, k):
+    """Share of the true top-k found; a chunk tied with the k-th best score counts as found"""
+    values = []
+    for ids, scores in zip(results, exact):
+        relevant = np.sort(scores[scores > 0])[::-1][:k]
+        if not len(relevant):
+            continue
+        found = sum(1 for i in ids[:k] if scores[i] >= relevant[-1] - 1e-5)
+        values.append(min(found, len(relevant)) / len(relevant))
+    return statistics.mean(values)
+
+
+def run(sop_path, size, k, repeat):
+    chunks = corpus(sop_path, size)
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS).fit(chunks)
+    tfidf = vectorizer.transform(chunks)
+
+    # Exact cosine ranking; chunks without any vocabulary term never match
+    query_tfidf = vectorizer.transform(QUERIES)
+    exact = (query_tfidf @ tfidf.T).toarray()
+
+    started = time.perf_counter()
+    dense = tfidf.toarray().astype('float32')
+    index = faiss.IndexFlatL2(dense.shape[1])
+    index.add(dense)
+    faiss_build = time.perf_counter() - started
+
+    def faiss_search(queries):
+        _, ids = index.search(vectorizer.transform(queries).toarray().astype('float32'), k)
+        return [[int(i) for i in row if i >= 0] for row in ids]
+
+    started = time.perf_counter()
+    postings = postings_from_counts(term_counts(vectorizer, chunks), vectorizer.idf_)
+    sparse_build = time.perf_counter() - started
+    postings_bytes = sum(postings[name].nbytes for name in ('indptr', 'chunks', 'cosine'))
+
+    rows = [('faiss-flat-l2', faiss_build, dense.nbytes, faiss_search)]
+    for scoring in ('cosine', 'bm25'):
+        retriever = SparseRetriever(vectorizer, postings, scoring)
+        rows.append((f"sparse-{scoring}", sparse_build, postings_bytes,
+                     lambda queries, retriever=retriever: [ids for ids, _ in retriever.search(queries, k)]))
+
+    print(f"\n{size} chunks, {dense.shape[1]} terms, {tfidf.nnz} non-zeros, k={k}")
+    print(f"{'index':<16}{'build s':>9}{'index MB':>10}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}{'batched ms/q':>14}")
+    for name, build_seconds, nbytes, search in rows:
+        latencies, batched = timed(search, QUERIES, repeat)
+        print(f"{name:<16}{build_seconds:>9.3f}{nbytes / 2 ** 20:>10.2f}{recall(search(QUERIES), exact, k):>10.3f}"
+              f"{percentile(latencies, 50):>9.3f}{percentile(latencies, 95):>9.3f}{batched:>14.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sop', default='support_sop.txt')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 30000])
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(args.sop, size, args.k, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
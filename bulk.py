@@ -0,0 +1,54 @@
+"""Bulk inserts that return the new primary keys.
+
+Adding ORM objects one at a time costs an INSERT round trip and an identity-map entry
+per row, since the ORM needs each row's id back. bulk_insert() writes rows given as
+plain dicts in batches of up to BATCH_SIZE rows and still returns their ids, in the
+order of the rows:
+
+    PostgreSQL (and other dialects with RETURNING)   INSERT ... VALUES (...), (...)
+                                                     RETURNING id
+    SQLite                                           executemany, then last_insert_rowid():
+                                                     the transaction holds the write lock
+                                                     and SQLite gives each new row the
+                                                     largest rowid plus one, so the ids
+                                                     are the ones counting back from it
+    anything else                                    one INSERT per row
+
+(A multi-row VALUES statement is compiled afresh for every batch, which on SQLite
+makes it several times slower than the driver's executemany.)
+
+Column defaults declared on the model (status, created_at, ...) are applied as usual.
+The rows are written in the session's transaction; the caller commits.
+"""
+from db import db
+
+BATCH_SIZE = 500
+
+
+def bulk_insert(model, rows, batch_size=BATCH_SIZE):
+    """Insert rows (dicts of column values) into model's table; returns their ids in order"""
+    if not rows:
+        return []
+    table = model.__table__
+    primary_key = table.primary_key.columns.values()[0]
+    dialect = db.get_engine().dialect
+    # executemany and a multi-row VALUES clause both take their columns from the first
+    # row; a missing key can't mean "use the default" for some rows and not others
+    columns = set(rows[0])
+    if any(set(row) != columns for row in rows):
+        raise ValueError('bulk_insert rows must all have the same keys')
+
+    if dialect.name != 'sqlite' and not getattr(dialect, 'full_returning', False):
+        return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+    ids = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if dialect.name == 'sqlite':
+            db.session.execute(table.insert(), batch)
+            last_id = db.session.execute(db.text('SELECT last_insert_rowid()')).scalar()
+            ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+        else:
+            result = db.session.execute(table.insert().values(batch).returning(primary_key))
+            ids.extend(row[0] for row in result)
+    return ids
@@ -0,0 +1,202 @@
+"""Checkout: turn an employee's cart into orders in one short transaction.
+
+The allowance and credits are taken with a conditional
+
+    UPDATE employee SET meal_allowance = meal_allowance - :allowance, ...
+    WHERE id = :id AND meal_allowance >= :allowance AND credit_balance >= :credits
+
+so two concurrent checkouts can't both spend the same balance; the one that loses the
+race reads the balances again and retries. The cart rows are deleted as they were read
+(id, product and quantity) in the same transaction, which stops one cart from being
+ordered twice, and the orders are written with one multi-row INSERT whatever the size
+of the cart. The card is charged after the commit, outside any transaction; a failed
+charge gives the balances and the cart back and marks the orders cancelled.
+
+A request may carry an Idempotency-Key: the response of the checkout placed with it is
+stored in the same transaction, and a retry with the same key gets that response back
+instead of placing the cart again. Keys are kept for KEY_TTL_HOURS; a keyed checkout
+deletes the expired ones of every employee, and an expired key counts as new.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from bulk import bulk_insert
+from db import db
+from models import Cart, CheckoutRequest, Employee, Order, payment_breakdown
+
+MAX_ATTEMPTS = 5
+MAX_KEY_LENGTH = 100
+TAX_RATE = 0.08
+DELIVERY_MINUTES = 30
+KEY_TTL_HOURS = 24
+
+
+class CheckoutError(Exception):
+    """A checkout that can't be placed, with the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _stored_response(employee_id, idempotency_key, expires_before):
+    record = CheckoutRequest.query.filter_by(employee_id=employee_id, idempotency_key=idempotency_key)\
+        .filter(CheckoutRequest.created_at >= expires_before).first()
+    return record.response if record else None
+
+
+def prune_expired_keys(expires_before):
+    """Delete the idempotency keys stored before expires_before; returns how many (no commit)"""
+    return CheckoutRequest.query.filter(CheckoutRequest.created_at < expires_before)\
+        .delete(synchronize_session=False)
+
+
+def _reserve(employee_id, lines, breakdown, order_time, idempotency_key, expires_before):
+    """Clear the cart, take the balances and create the orders in one transaction.
+
+    Returns the checkout response, or None when a concurrent checkout changed the
+    cart or the balances first (the transaction is rolled back).
+    """
+    cart_total = sum(price * quantity for _, _, quantity, price in lines)
+    cart = Cart.__table__
+    # Only the rows as they were read: a row whose quantity grew since, or a new row that
+    # SQLite gave a deleted row's id, must not be ordered at the old quantity
+    deleted = db.session.execute(cart.delete().where(db.or_(*[
+        db.and_(cart.c.id == cart_id, cart.c.product_id == product_id, cart.c.quantity == quantity)
+        for cart_id, product_id, quantity, _ in lines
+    ]))).rowcount
+    if deleted != len(lines):
+        db.session.rollback()
+        return None
+
+    allowance, credits = breakdown['meal_allowance'], breakdown['credit_balance']
+    employee = Employee.__table__
+    taken = db.session.execute(
+        employee.update()
+        .where(employee.c.id == employee_id)
+        .where(employee.c.meal_allowance >= allowance)
+        .where(employee.c.credit_balance >= credits)
+        .values(meal_allowance=employee.c.meal_allowance - allowance,
+                credit_balance=employee.c.credit_balance - credits)
+    ).rowcount
+    if taken != 1:
+        db.session.rollback()
+        return None
+
+    estimated_delivery = order_time + timedelta(minutes=DELIVERY_MINUTES)
+    rows = [{
+        'employee_id': employee_id,
+        'product_id': product_id,
+        'quantity': quantity,
+        'price': price,
+        'order_time': order_time,
+        'estimated_delivery': estimated_delivery,
+        'allowance_used': allowance * (price * quantity / cart_total),
+        'credits_used': credits * (price * quantity / cart_total)
+    } for _, product_id, quantity, price in lines]
+    first_order_id = bulk_insert(Order, rows)[0]
+
+    response = {
+        'message': 'Order placed successfully',
+        'order_id': first_order_id,  # Return the first order's ID for tracking
+        'order_time': order_time.isoformat(),
+        'payment_breakdown': breakdown
+    }
+    if idempotency_key:
+        # Also frees this key if it expired, for the unique constraint
+        prune_expired_keys(expires_before)
+        db.session.add(CheckoutRequest(employee_id=employee_id, idempotency_key=idempotency_key,
+                                       response=response, created_at=order_time))
+        db.session.flush()
+    db.session.commit()
+    return response
+
+
+def _release(employee_id, lines, breakdown, order_time, idempotency_key):
+    """Undo a reserved checkout whose card payment failed"""
+    employee = Employee.__table__
+    db.session.execute(
+        employee.update()
+        .where(employee.c.id == employee_id)
+        .values(meal_allowance=employee.c.meal_allowance + breakdown['meal_allowance'],
+                credit_balance=employee.c.credit_balance + breakdown['credit_balance'])
+    )
+    orders = Order.__table__
+    db.session.execute(
+        orders.update()
+        .where(orders.c.employee_id == employee_id)
+        .where(orders.c.order_time == order_time)
+        .values(status='cancelled')
+    )
+    db.session.execute(Cart.__table__.insert(), [
+        {'employee_id': employee_id, 'product_id': product_id, 'quantity': quantity}
+        for _, product_id, quantity, _ in lines
+    ])
+    if idempotency_key:
+        CheckoutRequest.query.filter_by(employee_id=employee_id, idempotency_key=idempotency_key).delete()
+    db.session.commit()
+
+
+def place_order(employee, idempotency_key=None, charge_card=None, key_ttl_hours=KEY_TTL_HOURS):
+    """Place the employee's cart; returns (response, replayed).
+
+    charge_card(amount, card_info) is called for any amount the balances don't cover
+    and returns {'success': bool, ...}. A key stored more than key_ttl_hours ago is not
+    replayed. Raises CheckoutError for an empty cart, a failed payment or a checkout
+    that kept losing races to concurrent ones.
+    """
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise CheckoutError(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters')
+    employee_id = employee.id
+    card_info = employee.credit_card
+    # The first attempt trusts the balances loaded with the user; the UPDATE checks them
+    balances = (employee.meal_allowance, employee.credit_balance)
+    expires_before = datetime.utcnow() - timedelta(hours=key_ttl_hours)
+
+    for _ in range(MAX_ATTEMPTS):
+        if idempotency_key:
+            stored = _stored_response(employee_id, idempotency_key, expires_before)
+            if stored is not None:
+                return stored, True
+        cart_items = Cart.query.options(joinedload(Cart.product)).filter_by(employee_id=employee_id).all()
+        if not cart_items:
+            # A concurrent request with the same key may have just placed this cart
+            stored = _stored_response(employee_id, idempotency_key, expires_before) if idempotency_key else None
+            if stored is not None:
+                return stored, True
+            raise CheckoutError('Cart is empty')
+        # Plain values: the ORM objects of the deleted cart rows can't be read after the commit
+        lines = [(item.id, item.product_id, item.quantity, item.product.price) for item in cart_items]
+        cart_total = sum(price * quantity for _, _, quantity, price in lines)
+        grand_total = cart_total + cart_total * TAX_RATE
+        breakdown = payment_breakdown(grand_total, *balances)
+        order_time = datetime.utcnow()
+
+        try:
+            response = _reserve(employee_id, lines, breakdown, order_time, idempotency_key, expires_before)
+        except IntegrityError:
+            # The same key was placed by a concurrent request
+            db.session.rollback()
+            stored = _stored_response(employee_id, idempotency_key, expires_before) if idempotency_key else None
+            if stored is None:
+                raise
+            return stored, True
+        if response is not None:
+            break
+        balances = db.session.query(Employee.meal_allowance, Employee.credit_balance)\
+                             .filter_by(id=employee_id).one()
+    else:
+        raise CheckoutError('The cart or balance changed during checkout, please try again', 409)
+
+    if breakdown['credit_card'] > 0 and charge_card is not None:
+        try:
+            result = charge_card(breakdown['credit_card'], card_info)
+        except Exception as e:
+            print(f"Error charging card: {str(e)}")
+            result = {'success': False}
+        if not result['success']:
+            _release(employee_id, lines, breakdown, order_time, idempotency_key)
+            raise CheckoutError('Payment processing failed')
+    return response, False
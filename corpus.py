@@ -0,0 +1,77 @@
+"""Memory-mapped chunk texts of a retrieval corpus.
+
+A build directory stores the chunk texts as two flat files:
+
+    chunks.bin          chunk texts as UTF-8, back to back
+    chunk_offsets.npy   int64 byte offsets; chunk i is chunks.bin[offsets[i]:offsets[i + 1]]
+
+Both are opened read-only with mmap, so every worker process shares the same pages
+through the OS page cache, opening a build costs almost nothing, and only the chunks a
+search actually returns are decoded. The search structures live next to them (see
+sparse_index.py).
+"""
+import mmap
+import os
+
+import numpy as np
+
+TEXT_FILE = 'chunks.bin'
+OFFSETS_FILE = 'chunk_offsets.npy'
+
+
+def write_corpus(build_dir, texts, count):
+    """Write `count` chunk texts to chunks.bin and chunk_offsets.npy in build_dir"""
+    offsets = np.lib.format.open_memmap(os.path.join(build_dir, OFFSETS_FILE), mode='w+',
+                                        dtype='int64', shape=(count + 1,))
+    position = 0
+    written = 0
+    with open(os.path.join(build_dir, TEXT_FILE), 'wb') as f:
+        for text in texts:
+            data = text.encode('utf-8')
+            offsets[written] = position
+            f.write(data)
+            position += len(data)
+            written += 1
+    if written != count:
+        raise ValueError(f"Expected {count} chunks, got {written}")
+    offsets[count] = position
+    offsets.flush()
+    del offsets
+
+
+class MappedCorpus:
+    """Chunk texts of a build, read straight from memory-mapped files"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, chunk_id):
+        if not 0 <= chunk_id < len(self):
+            raise IndexError(chunk_id)
+        start, end = int(self.offsets[chunk_id]), int(self.offsets[chunk_id + 1])
+        return self._blob[start:end].decode('utf-8')
+
+    def __iter__(self):
+        for chunk_id in range(len(self)):
+            yield self[chunk_id]
+
+
+def open_corpus(build_dir):
+    """Map a build's corpus files read-only"""
+    offsets = np.load(os.path.join(build_dir, OFFSETS_FILE), mmap_mode='r')
+    with open(os.path.join(build_dir, TEXT_FILE), 'rb') as f:
+        # mmap can't map an empty file
+        blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+    return MappedCorpus(blob, offsets)
+
+
+def corpus_from_texts(texts):
+    """An in-memory MappedCorpus, for indexes built on the fly"""
+    data = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(data) + 1, dtype='int64')
+    offsets[1:] = np.cumsum([len(chunk) for chunk in data])
+    return MappedCorpus(b''.join(data), offsets)
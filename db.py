@@ -1,3 +1,69 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 
 db = SQLAlchemy()
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    Server databases get a connection pool sized by DB_POOL_SIZE and DB_MAX_OVERFLOW,
+    with pre-ping and recycling so connections dropped by the server are replaced.
+    File-based SQLite gets a pool too, instead of a new connection (and a new set of
+    pragmas) per checkout, and waits SQLITE_BUSY_TIMEOUT_MS for a lock instead of
+    failing with "database is locked".
+    """
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if not is_sqlite(uri):
+        options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        return options
+    if make_url(uri).database in (None, '', ':memory:'):
+        # One shared connection; Flask-SQLAlchemy sets that up for in-memory databases
+        return {}
+    # pysqlite's busy handler, in seconds
+    connect_args = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0}
+    if not config['DB_POOL_SIZE']:
+        # DB_POOL_SIZE=0: a connection per checkout (Flask-SQLAlchemy picks NullPool)
+        return {'connect_args': connect_args}
+    # Pooled connections move between request threads, one at a time
+    connect_args['check_same_thread'] = False
+    options['poolclass'] = QueuePool
+    options['connect_args'] = connect_args
+    return options
+
+
+def configure_sqlite(engine, config):
+    """Set the SQLITE_* pragmas on every new connection of a SQLite engine.
+
+    WAL lets readers run while a transaction writes and makes commits cheaper;
+    synchronous=NORMAL is durable across application crashes in WAL mode and only
+    risks the last transactions on power loss.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
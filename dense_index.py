@@ -0,0 +1,154 @@
+"""Optional dense (embedding) retrieval, fused with the lexical index.
+
+Chunks are embedded on CPU with a local sentence-transformers model and stored in an
+approximate nearest-neighbour FAISS index next to the lexical postings:
+
+    hnsw  graph index; no training, good recall, efSearch trades recall for latency
+    ivf   inverted lists over k-means cells; cheaper to build for millions of chunks,
+          nprobe (cells visited per query) trades recall for latency
+
+At query time both indexes return their candidates and the two rankings are merged
+with reciprocal rank fusion, so paraphrases outside the TF-IDF vocabulary still match.
+Without the sentence-transformers package everything stays lexical-only.
+"""
+import os
+
+import faiss
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # dense retrieval is optional
+    SentenceTransformer = None
+
+DEFAULT_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+INDEX_KINDS = ('hnsw', 'ivf')
+DENSE_INDEX_FILE = 'dense.faiss'
+DENSE_VECTORS_FILE = 'dense_vectors.npy'
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+RRF_K = 60
+EMBED_BATCH_SIZE = 1024
+
+
+def dense_available():
+    return SentenceTransformer is not None
+
+
+class DenseEncoder:
+    """Sentence embeddings on CPU, normalised so inner product is cosine similarity.
+
+    With workers > 1, large batches are spread over a pool of encoder processes.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, batch_size=64, workers=1):
+        if SentenceTransformer is None:
+            raise RuntimeError("Dense retrieval needs sentence-transformers: pip install sentence-transformers")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self._pool = None
+
+    def encode(self, texts):
+        texts = list(texts)
+        if self.workers > 1 and len(texts) > self.batch_size:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(['cpu'] * self.workers)
+            vectors = self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+        else:
+            vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                        show_progress_bar=False)
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+def embed_corpus(texts, count, path, encoder, copies=(), previous_vectors=None):
+    """Embed `count` chunk texts into a float32 .npy at `path`, a batch at a time.
+
+    `copies` lists (start, previous_start, count) row ranges taken from previous_vectors
+    instead of being embedded again. Returns (vectors, number of embedded chunks).
+    """
+    vectors = np.lib.format.open_memmap(path, mode='w+', dtype='float32', shape=(count, encoder.dimension))
+    copied = set()
+    if previous_vectors is not None:
+        for start, previous_start, length in copies:
+            vectors[start:start + length] = previous_vectors[previous_start:previous_start + length]
+            copied.update(range(start, start + length))
+
+    rows, batch = [], []
+    for row, text in enumerate(texts):
+        if row in copied:
+            continue
+        rows.append(row)
+        batch.append(text)
+        if len(batch) == EMBED_BATCH_SIZE:
+            vectors[rows] = encoder.encode(batch)
+            rows, batch = [], []
+    if batch:
+        vectors[rows] = encoder.encode(batch)
+    vectors.flush()
+    return vectors, count - len(copied)
+
+
+def build_dense_index(vectors, kind='hnsw', nlist=None):
+    """FAISS inner-product index over the rows of `vectors`, added in batches"""
+    count, dimension = vectors.shape
+    if kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind == 'ivf':
+        # ~4 * sqrt(n) cells, with enough training points per cell
+        nlist = nlist or max(1, min(count // 39, int(4 * np.sqrt(count))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        sample = np.sort(np.random.RandomState(0).choice(count, min(count, nlist * 256), replace=False))
+        index.train(np.ascontiguousarray(vectors[sample]))
+    else:
+        raise ValueError(f"Unknown dense index {kind!r}; expected one of {', '.join(INDEX_KINDS)}")
+    for start in range(0, count, EMBED_BATCH_SIZE):
+        index.add(np.ascontiguousarray(vectors[start:start + EMBED_BATCH_SIZE]))
+    return index
+
+
+def open_dense_index(build_dir):
+    """Read a build's dense index, memory-mapped where FAISS supports it for the index type"""
+    path = os.path.join(build_dir, DENSE_INDEX_FILE)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class DenseRetriever:
+    """Top-k search over a dense index with tunable recall/latency"""
+
+    def __init__(self, encoder, index, nprobe=16, ef_search=64):
+        self.encoder = encoder
+        self.index = index
+        if hasattr(index, 'nprobe'):
+            index.nprobe = nprobe
+        if hasattr(index, 'hnsw'):
+            index.hnsw.efSearch = ef_search
+
+    def search(self, queries, k=3):
+        """Return one (chunk ids, cosine scores) pair per query, best first"""
+        scores, ids = self.index.search(self.encoder.encode(queries), k)
+        return [([int(i) for i in row_ids if i >= 0], [float(s) for s, i in zip(row_scores, row_ids) if i >= 0])
+                for row_scores, row_ids in zip(scores, ids)]
+
+
+def reciprocal_rank_fusion(rankings, k=3, rrf_k=RRF_K):
+    """Merge ranked id lists with score(chunk) = sum of 1 / (rrf_k + rank); returns (ids, scores)"""
+    scores = {}
+    for ids in rankings:
+        for rank, chunk_id in enumerate(ids, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    fused = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return [chunk_id for chunk_id, _ in fused], [score for _, score in fused]
@@ -0,0 +1,410 @@
+"""Offline build of the knowledge-base retrieval index.
+
+    python index_builder.py [PATH ...] [--full] [--dense [--dense-index hnsw|ivf]]
+
+PATH is any mix of documents (.txt, .md, .pdf) and directories to walk; by default
+only support_sop.txt is indexed. Documents are ingested as a stream (see ingestion.py):
+chunks are spooled to disk and counted in batches, so large corpora never sit in
+memory as a whole. Workers memory-map the published chunk texts (corpus.py) and the
+sparse inverted index over them (sparse_index.py). With --dense, the chunks are also
+embedded into an approximate nearest-neighbour index (dense_index.py).
+
+Each build goes into its own directory under resources/builds/ together with a
+manifest.json that records per-document and per-section content hashes, the
+chunker and vectorizer parameters and the library versions it was built with. Sections
+whose hash is unchanged since the previous build keep their chunks and term counts;
+only edited sections are re-chunked and counted with the previous vocabulary. A full refit
+happens when parameters or library versions change, when too much of the corpus is new,
+or when an edited section uses terms the previous vocabulary doesn't have. The finished build is published by atomically replacing resources/CURRENT, so
+workers never see a half-written index.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+import faiss
+import numpy as np
+import scipy
+import scipy.sparse as sp
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from corpus import open_corpus, write_corpus
+from dense_index import (DEFAULT_MODEL, DENSE_INDEX_FILE, DENSE_VECTORS_FILE, INDEX_KINDS, DenseEncoder,
+                         build_dense_index, dense_available, embed_corpus)
+from ingestion import iter_chunks, iter_documents, iter_sections, sha256_file, source_name
+from sparse_index import chunk_counts, open_postings, postings_from_counts, term_counts, write_postings
+
+FORMAT_VERSION = 4
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 40
+VECTORIZER_PARAMS = {'max_features': 1000, 'stop_words': 'english'}
+DEFAULT_SOURCES = ['support_sop.txt']
+BATCH_SIZE = 1024
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+CURRENT_POINTER = 'CURRENT'
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def library_versions():
+    return {
+        'python': platform.python_version(),
+        'sklearn': sklearn.__version__,
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'faiss': getattr(faiss, '__version__', 'unknown')
+    }
+
+
+def read_chunks(path):
+    """Yield the chunk records of a chunks.jsonl file one at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class IndexBuild:
+    """Chunks (spooled to a work directory), fitted vectorizer, postings and manifest of one build"""
+
+    def __init__(self, work_dir, vectorizer, postings, manifest, dense_index=None):
+        self.work_dir = work_dir
+        self.vectorizer = vectorizer
+        self.postings = postings
+        self.manifest = manifest
+        self.dense_index = dense_index
+
+    def iter_chunks(self):
+        return read_chunks(os.path.join(self.work_dir, 'chunks.jsonl'))
+
+    def save(self, build_dir):
+        with open(os.path.join(build_dir, 'vectorizer.pkl'), 'wb') as f:
+            pickle.dump(self.vectorizer, f)
+        write_corpus(build_dir, (record['text'] for record in self.iter_chunks()), self.manifest['chunk_count'])
+        write_postings(build_dir, self.postings)
+        if self.dense_index is not None:
+            faiss.write_index(self.dense_index, os.path.join(build_dir, DENSE_INDEX_FILE))
+            shutil.copyfile(os.path.join(self.work_dir, DENSE_VECTORS_FILE), os.path.join(build_dir, DENSE_VECTORS_FILE))
+        # The manifest goes last: a build directory without one is incomplete
+        with open(os.path.join(build_dir, 'manifest.json'), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def cleanup(self):
+        """Remove the work directory (the spooled chunks)"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class PublishedBuild:
+    """A published build opened for incremental reuse; chunks and postings are read on demand"""
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.manifest = read_manifest(build_dir)
+        with open(os.path.join(build_dir, 'vectorizer.pkl'), 'rb') as f:
+            self.vectorizer = pickle.load(f)
+        self.corpus = open_corpus(build_dir)
+        self.postings = open_postings(build_dir, self.manifest['chunk_count'])
+
+    def chunk_texts(self, start, count):
+        return [self.corpus[i] for i in range(start, start + count)]
+
+    def dense_vectors(self, model_name):
+        """The build's chunk embeddings if they were made with `model_name`, else None"""
+        if self.manifest.get('dense', {}).get('model') != model_name:
+            return None
+        return np.load(os.path.join(self.build_dir, DENSE_VECTORS_FILE), mmap_mode='r')
+
+
+def read_manifest(build_dir):
+    with open(os.path.join(build_dir, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def load_build(build_dir):
+    """Open a published build for an incremental rebuild"""
+    return PublishedBuild(build_dir)
+
+
+def current_build_dir(resources_dir=RESOURCES_DIR):
+    """Directory of the published build, or None if there is none"""
+    try:
+        with open(os.path.join(resources_dir, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    build_dir = os.path.join(resources_dir, 'builds', name)
+    if not os.path.exists(os.path.join(build_dir, 'manifest.json')):
+        return None
+    return build_dir
+
+
+def load_incompatibility(manifest):
+    """Why a build can't be loaded with this code and these libraries, or None if it can"""
+    if manifest.get('format_version') != FORMAT_VERSION:
+        return 'index format changed'
+    versions = manifest.get('versions', {})
+    current = library_versions()
+    for library in ('sklearn', 'numpy', 'scipy'):
+        if versions.get(library) != current[library]:
+            return f"{library} version changed ({versions.get(library)} -> {current[library]})"
+    return None
+
+
+def incompatibility(manifest, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, vectorizer_params=VECTORIZER_PARAMS):
+    """Why a previous build can't be reused incrementally, or None if it can"""
+    problem = load_incompatibility(manifest)
+    if problem:
+        return problem
+    if manifest.get('chunker') != {'chunk_size': chunk_size, 'overlap': overlap}:
+        return 'chunker parameters changed'
+    if manifest.get('vectorizer', {}).get('params') != vectorizer_params:
+        return 'vectorizer parameters changed'
+    return None
+
+
+def build_index(paths, previous=None, full=False, refit_threshold=0.3, chunk_size=CHUNK_SIZE,
+                overlap=CHUNK_OVERLAP, vectorizer_params=VECTORIZER_PARAMS, work_dir=None, dense=None):
+    """Build an index for documents and directories, reusing unchanged sections of `previous`.
+
+    `dense` ({'model', 'index', 'workers'}) also embeds the chunks into a dense index.
+
+    Chunks are spooled to `work_dir` (a new temporary directory by default);
+    call cleanup() on the returned build when done with it.
+    Returns (IndexBuild, report) where report summarises what was reused.
+    """
+    reason = 'full rebuild requested' if full else None
+    if previous is None and reason is None:
+        reason = 'no previous build'
+    if previous is not None and reason is None:
+        reason = incompatibility(previous.manifest, chunk_size, overlap, vectorizer_params)
+
+    # Sections of the previous build by content hash -> (chunk_start, chunk_count)
+    reusable = {}
+    if reason is None:
+        for section in previous.manifest['sections']:
+            reusable.setdefault(section['sha256'], (section['chunk_start'], section['chunk_count']))
+        # Terms of edited sections that the previous vocabulary would silently drop
+        analyze = previous.vectorizer.build_analyzer()
+        vocabulary = previous.vectorizer.vocabulary_
+    new_terms = set()
+
+    documents = list(iter_documents(paths))
+    sources = [{'path': source_name(path), 'sha256': sha256_file(path), 'bytes': os.path.getsize(path)}
+               for path in documents]
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix='index-build-')
+    chunks_path = os.path.join(work_dir, 'chunks.jsonl')
+    sections, copies = [], []
+    total = 0
+    new_chunks = 0
+    with open(chunks_path, 'w', encoding='utf-8') as spool:
+        for section in iter_sections(documents):
+            section_hash = sha256_text('\0'.join((section['source'], section['heading'], section['text'])))
+            if section_hash in reusable:
+                previous_start, count = reusable[section_hash]
+                records = [{'text': text, 'source': section['source'], 'section': section['heading']}
+                           for text in previous.chunk_texts(previous_start, count)]
+                copies.append((total, previous_start, count))
+            else:
+                records = list(iter_chunks([section], chunk_size, overlap))
+                new_chunks += len(records)
+                if reason is None:
+                    new_terms.update(term for record in records for term in analyze(record['text'])
+                                     if term not in vocabulary)
+            sections.append({
+                'source': section['source'],
+                'heading': section['heading'][:200],
+                'sha256': section_hash,
+                'chunk_start': total,
+                'chunk_count': len(records)
+            })
+            for record in records:
+                spool.write(json.dumps(record) + '\n')
+            total += len(records)
+
+    if not total:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise ValueError(f"No text found to index in {', '.join(paths)}")
+    if reason is None and new_chunks / total > refit_threshold:
+        reason = f"{new_chunks} of {total} chunks changed; refitting vocabulary"
+    if reason is None and new_terms:
+        reason = f"{len(new_terms)} new terms in changed sections; refitting vocabulary"
+
+    # Embeddings don't depend on the vocabulary, so they survive a refit
+    section_copies = list(copies)
+    if reason is not None:
+        vectorizer = TfidfVectorizer(**vectorizer_params)
+        vectorizer.fit(record['text'] for record in read_chunks(chunks_path))
+        copies = []
+    else:
+        # Keep the fitted vocabulary and idf weights so unchanged term counts stay valid
+        vectorizer = previous.vectorizer
+        previous_counts = chunk_counts(previous.postings)
+    copied = set(row for start, _, count in copies for row in range(start, start + count))
+
+    # Count the terms of everything that wasn't copied, a batch at a time
+    batches, texts = [], []
+    for row, record in enumerate(read_chunks(chunks_path)):
+        if row in copied:
+            continue
+        texts.append(record['text'])
+        if len(texts) == BATCH_SIZE:
+            batches.append(term_counts(vectorizer, texts))
+            texts = []
+    if texts:
+        batches.append(term_counts(vectorizer, texts))
+    new_counts = sp.vstack(batches).tocsr() if batches else None
+
+    # Put copied and newly counted rows back in chunk order
+    pieces, position, new_position = [], 0, 0
+    for start, previous_start, count in copies + [(total, 0, 0)]:
+        if start > position:
+            pieces.append(new_counts[new_position:new_position + start - position])
+            new_position += start - position
+        if count:
+            pieces.append(previous_counts[previous_start:previous_start + count])
+        position = start + count
+    postings = postings_from_counts(sp.vstack(pieces).tocsr(), vectorizer.idf_)
+    reused = len(copied)
+
+    dense_index, dense_manifest = None, None
+    if dense is not None:
+        previous_vectors = previous.dense_vectors(dense['model']) if previous is not None else None
+        encoder = DenseEncoder(dense['model'], workers=dense.get('workers', 1))
+        try:
+            vectors, embedded = embed_corpus((record['text'] for record in read_chunks(chunks_path)), total,
+                                             os.path.join(work_dir, DENSE_VECTORS_FILE), encoder,
+                                             section_copies, previous_vectors)
+        finally:
+            encoder.close()
+        dense_index = build_dense_index(vectors, dense['index'])
+        dense_manifest = {'model': dense['model'], 'index': dense['index'], 'dimension': encoder.dimension}
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.utcnow().isoformat(),
+        'sources': sources,
+        'corpus_sha256': sha256_text(json.dumps([(s['path'], s['sha256']) for s in sources])),
+        'chunker': {'chunk_size': chunk_size, 'overlap': overlap},
+        'vectorizer': {
+            'class': type(vectorizer).__name__,
+            'params': vectorizer_params,
+            'vocabulary_size': len(vectorizer.vocabulary_),
+            'fitted_at': previous.manifest['vectorizer']['fitted_at'] if reason is None
+            else datetime.utcnow().isoformat()
+        },
+        'versions': library_versions(),
+        'sections': sections,
+        'chunk_count': total,
+        'postings': {'terms': int(postings['shape'][0]), 'nnz': int(len(postings['chunks']))}
+    }
+    if dense_manifest is not None:
+        manifest['dense'] = dense_manifest
+    report = {
+        'mode': 'full' if reason is not None else 'incremental',
+        'reason': reason,
+        'documents': len(sources),
+        'sections': len(sections),
+        'chunks': total,
+        'reused_chunks': reused,
+        'rechunked_chunks': new_chunks,
+        'counted_chunks': total - reused,
+        'new_terms': len(new_terms)
+    }
+    if dense is not None:
+        report['dense_embedded_chunks'] = embedded
+    return IndexBuild(work_dir, vectorizer, postings, manifest, dense_index), report
+
+
+def publish_build(build, resources_dir=RESOURCES_DIR, keep=3):
+    """Write a build to its own directory and atomically make it the current one"""
+    builds_dir = os.path.join(resources_dir, 'builds')
+    os.makedirs(builds_dir, exist_ok=True)
+    name = f"build-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    # Write everything under a temporary name, then rename into place
+    tmp_dir = os.path.join(builds_dir, f".tmp-{name}")
+    os.makedirs(tmp_dir)
+    try:
+        build.save(tmp_dir)
+        os.rename(tmp_dir, os.path.join(builds_dir, name))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(resources_dir, f".{CURRENT_POINTER}.{uuid.uuid4().hex[:8]}")
+    with open(pointer_tmp, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(resources_dir, CURRENT_POINTER))
+
+    # Keep a few previous builds so running workers and rollbacks still find theirs
+    previous_builds = sorted(d for d in os.listdir(builds_dir) if d.startswith('build-') and d != name)
+    for old in previous_builds[:max(0, len(previous_builds) - (keep - 1))]:
+        shutil.rmtree(os.path.join(builds_dir, old), ignore_errors=True)
+    return os.path.join(builds_dir, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', default=DEFAULT_SOURCES,
+                        help='documents (.txt, .md, .pdf) and directories to index')
+    parser.add_argument('--resources', default=RESOURCES_DIR, help='resources directory')
+    parser.add_argument('--full', action='store_true', help='ignore the previous build and refit everything')
+    parser.add_argument('--refit-threshold', type=float, default=0.3,
+                        help='refit the vectorizer when more than this fraction of chunks changed')
+    parser.add_argument('--keep', type=int, default=3, help='number of builds to keep')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='target chunk length in characters')
+    parser.add_argument('--overlap', type=int, default=CHUNK_OVERLAP,
+                        help='characters of each chunk repeated at the start of the next')
+    parser.add_argument('--dense', action='store_true',
+                        help='also build a dense embedding index (needs sentence-transformers)')
+    parser.add_argument('--dense-model', default=DEFAULT_MODEL, help='sentence-transformers model')
+    parser.add_argument('--dense-index', choices=INDEX_KINDS, default='hnsw', help='approximate index type')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='encoder processes for the dense embeddings')
+    args = parser.parse_args()
+    dense = None
+    if args.dense:
+        if not dense_available():
+            parser.error('--dense needs sentence-transformers: pip install sentence-transformers')
+        dense = {'model': args.dense_model, 'index': args.dense_index, 'workers': args.workers}
+
+    previous = None
+    previous_dir = current_build_dir(args.resources)
+    if previous_dir and not args.full:
+        try:
+            previous = load_build(previous_dir)
+        except Exception as e:
+            print(f"Could not load previous build {previous_dir}: {str(e)}")
+
+    build, report = build_index(args.paths, previous=previous, full=args.full,
+                                refit_threshold=args.refit_threshold, chunk_size=args.chunk_size,
+                                overlap=args.overlap, dense=dense)
+    try:
+        if previous is not None and report['mode'] == 'incremental' \
+                and previous.manifest['sections'] == build.manifest['sections'] \
+                and previous.manifest.get('dense') == build.manifest.get('dense'):
+            print(f"Index is up to date ({previous_dir})")
+            return 0
+        build_dir = publish_build(build, args.resources, keep=args.keep)
+    finally:
+        build.cleanup()
+    print(f"Published {build_dir}")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
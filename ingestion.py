@@ -0,0 +1,138 @@
+"""Streaming ingestion of knowledge-base documents (.txt, .md, .pdf).
+
+Documents are read line by line (PDFs page by page), split into sections at their
+headings and chunked inside each section with a small word overlap, so a corpus of
+many thousands of pages is never held in memory at once. Every chunk records the
+document and section it came from so answers can cite it.
+"""
+import hashlib
+import os
+import re
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF support is optional
+    PdfReader = None
+
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.pdf')
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+# Very long sections are cut into several so one section never dominates memory
+MAX_SECTION_CHARS = 20000
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_name(path):
+    """Name a document is recorded under: relative to the app directory when inside it"""
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, BASE_DIR]) == BASE_DIR:
+        return os.path.relpath(path, BASE_DIR)
+    return path
+
+
+def sha256_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_documents(paths):
+    """Yield the supported documents among files and directories, in a stable order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith('.'):
+                        yield os.path.join(root, name)
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            yield path
+        else:
+            print(f"Skipping {path}: unsupported document type")
+
+
+def _pdf_pages(path):
+    """Yield the text of each PDF page; nothing when pypdf isn't installed"""
+    if PdfReader is None:
+        print(f"Skipping {path}: install pypdf to index PDF documents")
+        return
+    try:
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield page.extract_text() or ''
+    except Exception as e:
+        print(f"Error reading {path}: {str(e)}")
+
+
+def _text_sections(path):
+    """Split a text/markdown file into (heading path, text) at its markdown headings"""
+    headings = []  # (level, title) of the enclosing headings
+    lines, size = [], 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = HEADING_PATTERN.match(line)
+            if match or size >= MAX_SECTION_CHARS:
+                if lines:
+                    yield ' > '.join(title for _, title in headings), ''.join(lines)
+                lines, size = [], 0
+            if match:
+                level = len(match.group(1))
+                headings = [h for h in headings if h[0] < level] + [(level, match.group(2))]
+            lines.append(line)
+            size += len(line)
+    if lines:
+        yield ' > '.join(title for _, title in headings), ''.join(lines)
+
+
+def iter_sections(paths):
+    """Yield {'source', 'heading', 'text'} for every section of every document"""
+    for path in iter_documents(paths):
+        source = source_name(path)
+        if path.lower().endswith('.pdf'):
+            # PDFs have no reliable heading markup; cite them by page
+            sections = ((f"page {number}", text) for number, text in enumerate(_pdf_pages(path), 1))
+        else:
+            sections = _text_sections(path)
+        for heading, text in sections:
+            if text.strip():
+                yield {'source': source, 'heading': heading, 'text': text}
+
+
+def chunk_text(text, chunk_size=200, overlap=40):
+    """Split text into ~chunk_size character chunks of whole words.
+
+    Each chunk after the first starts with the last ~overlap characters of the previous
+    one, so a sentence cut at a chunk boundary is still retrievable as a whole.
+    """
+    chunks = []
+    current = []
+    length = 0
+    fresh = 0  # words in `current` that aren't overlap from the previous chunk
+
+    for word in text.split():
+        current.append(word)
+        length += len(word) + 1
+        fresh += 1
+
+        if length >= chunk_size:
+            chunks.append(' '.join(current))
+            carried = []
+            carried_length = 0
+            for previous in reversed(current[1:]):
+                if carried_length + len(previous) + 1 > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_length += len(previous) + 1
+            current, length, fresh = carried, carried_length, 0
+
+    if fresh:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def iter_chunks(sections, chunk_size=200, overlap=40):
+    """Yield {'text', 'source', 'section'} chunks for a stream of sections"""
+    for section in sections:
+        for text in chunk_text(section['text'], chunk_size, overlap):
+            yield {'text': text, 'source': section['source'], 'section': section['heading']}
@@ -0,0 +1,242 @@
+import os
+import re
+import threading
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+OTHER = 'other'
+
+# Example utterances per intent; 'other' holds policy questions the LLM should answer
+INTENT_EXAMPLES = {
+    'get_available_allowance': [
+        "what's my allowance",
+        "what is my meal allowance",
+        "how much allowance do I have left",
+        "how much meal allowance do I have",
+        "check my allowance",
+        "show my remaining allowance",
+        "my current meal allowance balance",
+        "how much can I still spend on meals",
+    ],
+    'get_available_credits': [
+        "how many credits do I have",
+        "what is my credit balance",
+        "check my credits",
+        "how much credit do I have left",
+        "show my available credits",
+        "what's my current credit balance",
+        "do I have any credits",
+    ],
+    'get_order_status': [
+        "status of order 42",
+        "what is the status of order 17",
+        "where is order 8",
+        "track order number 23",
+        "has order 5 been delivered",
+        "is order #12 on the way",
+        "when will order 31 arrive",
+    ],
+    'get_last_order_status': [
+        "where is my order",
+        "what is the status of my order",
+        "track my order",
+        "has my last order shipped",
+        "status of my recent order",
+        "is my food on the way",
+        "when will my order arrive",
+    ],
+    OTHER: [
+        "what is the refund policy",
+        "how does meal allowance work",
+        "when does my allowance refresh",
+        "how are credits earned",
+        "do credits expire",
+        "can I cancel my order",
+        "I want to cancel order 42",
+        "my order was late and I want a refund",
+        "order 42 was missing an item",
+        "my food arrived cold",
+        "what are the support hours",
+        "which menu items are gluten free",
+        "my credit card was declined",
+        "update the card on file",
+        "do new employees get an allowance",
+        "what happens to unused allowance",
+        "does unused allowance roll over to next month",
+        "can I give my credits to someone else",
+        "how do I fill in the expense code",
+        "I need to speak to a human",
+        "hello",
+        "thanks for your help",
+    ],
+}
+
+# Whole-question lookups that are routed without consulting the classifier. The
+# question is lowercased, with runs of whitespace and trailing punctuation removed,
+# before matching; anything beyond the lookup phrase goes to the classifier.
+_ASK = r"(?:what(?:'s| is)|check|show(?: me)?|tell me)"
+_OWNED = r"my\s+(?:remaining\s+|available\s+|current\s+)?"
+REGEX_RULES = [
+    (rf"^{_ASK}\s+{_OWNED}(?:meal\s+)?allowance(?:\s+balance)?$", 'get_available_allowance'),
+    (r"^how much (?:meal )?allowance do i (?:have|have left|still have)$", 'get_available_allowance'),
+    (rf"^{_ASK}\s+{_OWNED}credits?(?:\s+balance)?$", 'get_available_credits'),
+    (r"^how many credits do i (?:have|have left|still have)$", 'get_available_credits'),
+    (r"^(?:what(?:'s| is) the status of|where(?:'s| is)|track)\s+my\s+(?:last\s+|latest\s+|recent\s+)?order$",
+     'get_last_order_status'),
+]
+
+# What each tool answers about; a question touching two of them needs both tools
+TOPIC_PATTERNS = {
+    'allowance': re.compile(r"\ballowances?\b"),
+    'credits': re.compile(r"\bcredits?\b"),
+    'order': re.compile(r"\borders?\b"),
+}
+# A lookup followed by a second request ("... and when does it refresh")
+FOLLOW_ON_PATTERN = re.compile(r"\b(?:and|also|plus)\b")
+
+# Words that mean the customer wants an explanation or an action, not a lookup
+LLM_ONLY_PATTERN = re.compile(
+    r"\b(?:cancel|refund|policy|policies|how does|how do|why|work|works|earn|earned|expire|"
+    r"refresh|reset|late|missing|wrong|cold|complain|declined|human|agent|escalate|"
+    r"credit\s+cards?|transfer|taxable|taxed|tax)\b"
+)
+
+RESPONSE_TEMPLATES = {
+    'get_available_allowance': "Your current meal allowance is ${allowance:.2f}.",
+    'get_available_credits': "Your current credit balance is ${credits:.2f}.",
+    'get_order_status': "Order #{order_id} is currently {status_display} (placed {created_at}).",
+    'get_last_order_status': "Your last order (#{order_id}) is currently {status_display} (placed {created_at}).",
+}
+FOLLOW_UP = " Is there anything else I can help you with?"
+
+
+def _normalize(text):
+    # Order numbers all look alike to the classifier
+    return re.sub(r'\d+', ' num ', text.lower())
+
+
+def _lookup_phrase(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation, for the regex rules"""
+    return re.sub(r'\s+', ' ', text.lower()).strip().rstrip('?.! ')
+
+
+class IntentRouter:
+    """Local classifier that answers balance and order-status questions without the LLM.
+
+    A question is routed when it matches an unambiguous regex rule, or when its TF-IDF
+    vector is closest to a tool intent's centroid with at least `threshold` cosine
+    similarity. Order-status intents also need the order context extracted by
+    RAGEngine._extract_order_context. Anything else falls back to the LLM.
+    """
+
+    def __init__(self, threshold=0.45, examples=None):
+        self.threshold = threshold
+        self.examples = examples or INTENT_EXAMPLES
+        self.intents = list(self.examples)
+        self.regex_rules = [(re.compile(pattern), intent) for pattern, intent in REGEX_RULES]
+
+        # Keep stop words: "my" is what separates "my allowance" from "allowance policy"
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+        vectors = self.vectorizer.fit_transform(
+            [_normalize(utterance) for intent in self.intents for utterance in self.examples[intent]]
+        )
+        centroids = []
+        row = 0
+        for intent in self.intents:
+            count = len(self.examples[intent])
+            centroid = np.asarray(vectors[row:row + count].mean(axis=0)).ravel()
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            row += count
+        self.centroids = np.vstack(centroids)
+
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        self.routed_by_intent = {intent: 0 for intent in self.intents if intent != OTHER}
+
+    def classify(self, query):
+        """Return (intent, confidence) from the regex rules or the nearest centroid"""
+        lowered = query.lower()
+        if sum(1 for pattern in TOPIC_PATTERNS.values() if pattern.search(lowered)) > 1:
+            # Several lookups in one question: let the LLM call the tools together
+            return OTHER, 1.0
+        phrase = _lookup_phrase(query)
+        for pattern, intent in self.regex_rules:
+            if pattern.match(phrase):
+                return intent, 1.0
+        if FOLLOW_ON_PATTERN.search(lowered):
+            # More than one request; a canned answer would only cover the first
+            return OTHER, 1.0
+        scores = self.centroids @ self.vectorizer.transform([_normalize(query)]).toarray().ravel()
+        best = int(np.argmax(scores))
+        return self.intents[best], float(scores[best])
+
+    def route(self, query, order_context=None):
+        """Return (tool name, arguments) to answer directly, or None to use the LLM"""
+        lowered = query.lower()
+        decision = None
+        if not LLM_ONLY_PATTERN.search(lowered):
+            intent, confidence = self.classify(query)
+            if intent != OTHER and confidence >= self.threshold:
+                decision = self._resolve(intent, order_context)
+
+        with self._lock:
+            if decision is None:
+                self.fallbacks += 1
+            else:
+                self.routed += 1
+                self.routed_by_intent[decision[0]] += 1
+        return decision
+
+    def _resolve(self, intent, order_context):
+        if intent in ('get_order_status', 'get_last_order_status'):
+            if order_context and order_context.get('order_id'):
+                return 'get_order_status', {'order_id': order_context['order_id']}
+            if intent == 'get_order_status':
+                # Classified as a specific order but no order number was found
+                return None
+            return 'get_last_order_status', {}
+        return intent, {}
+
+    def render(self, tool_name, result):
+        """Turn a tool result into the customer-facing answer"""
+        if not isinstance(result, dict):
+            return str(result)
+        fields = dict(result)
+        if fields.get('status'):
+            fields['status_display'] = fields['status'].replace('_', ' ')
+        try:
+            return RESPONSE_TEMPLATES[tool_name].format(**fields) + FOLLOW_UP
+        except (KeyError, ValueError):
+            # e.g. order not found: the tool's own message says so
+            return result.get('message', '')
+
+    def stats(self):
+        with self._lock:
+            total = self.routed + self.fallbacks
+            return {
+                'routed': self.routed,
+                'fallbacks': self.fallbacks,
+                'routed_ratio': self.routed / total if total else 0.0,
+                'routed_by_intent': dict(self.routed_by_intent)
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    """Return the process-wide IntentRouter, or None when INTENT_ROUTER_ENABLED=0.
+
+    INTENT_ROUTER_THRESHOLD sets the minimum centroid similarity for a routed answer.
+    """
+    global _router
+    if os.environ.get('INTENT_ROUTER_ENABLED', '1') == '0':
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = IntentRouter(threshold=float(os.environ.get('INTENT_ROUTER_THRESHOLD', 0.45)))
+    return _router
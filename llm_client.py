@@ -0,0 +1,249 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+# How often a coroutine waiting for a free slot checks again
+ASYNC_SLOT_POLL_SECONDS = 0.01
+
+
+class LLMUnavailableError(Exception):
+    """Raised when a completion can't be obtained within its deadline or retry budget"""
+
+
+class RetryBudget:
+    """Caps retries to a fraction of recent traffic so an upstream outage isn't amplified.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so sustained
+    retries stay below ratio * requests; `reserve` caps the burst allowed after a quiet period.
+    """
+
+    def __init__(self, ratio=0.2, reserve=10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.reserve)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Shared, pooled OpenAI client with a concurrency cap, per-call deadlines and retries.
+
+    One instance per process: the underlying HTTP clients keep their connection pools
+    across requests, at most `max_concurrency` completions (blocking, streaming and
+    awaited ones together) are in flight at once, and
+    429/5xx/connection errors are retried with jittered exponential backoff until the
+    call's deadline or the shared retry budget runs out.
+    """
+
+    def __init__(self, api_key, base_url=None, max_concurrency=8, timeout=30.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, retry_budget=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget or RetryBudget()
+
+        # Retries are ours to budget, so turn off the SDK's own
+        self._client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        # An async client is bound to the event loop it first ran on; one per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _backoff(self, attempt, error):
+        delay = _retry_after(error)
+        if delay is None:
+            # Full jitter: spreads retries from many workers instead of synchronising them
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return delay
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _should_retry(self, attempt, error, deadline):
+        if not _is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= deadline or not self.retry_budget.withdraw():
+            return None
+        self._count('retries')
+        return delay
+
+    def chat_completion(self, timeout=None, **kwargs):
+        """Blocking chat.completions.create with the pool's limits applied"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count('requests')
+        self.retry_budget.deposit()
+        if not self._semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+            self._count('failures')
+            raise LLMUnavailableError("Timed out waiting for a free LLM connection")
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return self._client.chat.completions.create(
+                        timeout=max(0.1, deadline - time.monotonic()), **kwargs
+                    )
+                except Exception as e:
+                    delay = self._should_retry(attempt, e, deadline)
+                    if delay is None:
+                        self._count('failures')
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            self._semaphore.release()
+
+    def stream_chat_completion(self, timeout=None, **kwargs):
+        """Streaming variant; yields chunks and holds a concurrency slot until the stream ends.
+
+        Retries only happen before the first chunk, since a partially delivered answer
+        can't be replayed.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count('requests')
+        self.retry_budget.deposit()
+        if not self._semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+            self._count('failures')
+            raise LLMUnavailableError("Timed out waiting for a free LLM connection")
+        try:
+            attempt = 0
+            while True:
+                try:
+                    stream = self._client.chat.completions.create(
+                        timeout=max(0.1, deadline - time.monotonic()), stream=True, **kwargs
+                    )
+                    break
+                except Exception as e:
+                    delay = self._should_retry(attempt, e, deadline)
+                    if delay is None:
+                        self._count('failures')
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+            with stream:
+                for chunk in stream:
+                    yield chunk
+        finally:
+            self._semaphore.release()
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                     timeout=self.timeout, max_retries=0)
+                self._async_clients[loop] = client
+            return client
+
+    async def _acquire_async(self, deadline):
+        """Take a slot of the shared semaphore without blocking the event loop"""
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(ASYNC_SLOT_POLL_SECONDS)
+        return True
+
+    async def achat_completion(self, timeout=None, **kwargs):
+        """Awaitable chat.completions.create with the same limits as chat_completion"""
+        client = self._async_client()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count('requests')
+        self.retry_budget.deposit()
+        if not await self._acquire_async(deadline):
+            self._count('failures')
+            raise LLMUnavailableError("Timed out waiting for a free LLM connection")
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return await client.chat.completions.create(
+                        timeout=max(0.1, deadline - time.monotonic()), **kwargs
+                    )
+                except Exception as e:
+                    delay = self._should_retry(attempt, e, deadline)
+                    if delay is None:
+                        self._count('failures')
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        finally:
+            self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'failures': self.failures,
+                'max_concurrency': self.max_concurrency,
+                'timeout': self.timeout
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client(api_key):
+    """Return the process-wide LLMClient, creating it on first use.
+
+    Tunables come from the environment: OPENAI_BASE_URL, LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT_SECONDS and LLM_MAX_RETRIES.
+    """
+    global _client
+    if _client is None or _client.api_key != api_key:
+        with _client_lock:
+            if _client is None or _client.api_key != api_key:
+                _client = LLMClient(
+                    api_key=api_key,
+                    base_url=os.environ.get('OPENAI_BASE_URL') or None,
+                    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+                    timeout=float(os.environ.get('LLM_TIMEOUT_SECONDS', 30)),
+                    max_retries=int(os.environ.get('LLM_MAX_RETRIES', 3))
+                )
+    return _client
@@ -0,0 +1,279 @@
+"""In-process metrics for the chat pipeline, served in the Prometheus text format.
+
+Stages of a chat turn are timed with spans:
+
+    with metrics.span('retrieve'):
+        ...
+
+Each span adds its duration to the chat_stage_seconds histogram and to the trace of
+the chat request in progress on this thread. When the request finishes, its total
+time, outcome, LLM token usage and tool-call count are recorded too, and with
+METRICS_LOG_REQUESTS=1 the trace is printed as one JSON line.
+
+METRICS_ENABLED=0 turns spans into a shared no-op and every record call into a
+single flag check. Metrics are per process: scrape /metrics on every worker.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+LOG_REQUESTS = os.environ.get('METRICS_LOG_REQUESTS', '0') == '1'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 8000, 16000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13)
+
+_NOOP = nullcontext()
+_local = threading.local()
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations per label combination; buckets are cumulative on output only"""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_label_text(names, labels + (_number(bound),))} {cumulative}")
+                label_text = _label_text(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        metric = Histogram(name, documentation, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns (name, type, documentation, value) tuples read at scrape time"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+                continue
+            for name, kind, documentation, value in samples:
+                lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}",
+                              f"{name} {_number(value)}"])
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+CHAT_REQUESTS = REGISTRY.counter('chat_requests_total', 'Chat turns by endpoint and outcome',
+                                 ('endpoint', 'outcome'))
+CHAT_SECONDS = REGISTRY.histogram('chat_request_seconds', 'Wall time of a chat turn', LATENCY_BUCKETS,
+                                  ('endpoint',))
+STAGE_SECONDS = REGISTRY.histogram('chat_stage_seconds', 'Time spent in each stage of a chat turn',
+                                   LATENCY_BUCKETS, ('stage',))
+LLM_TOKENS = REGISTRY.counter('chat_llm_tokens_total', 'Tokens reported by the LLM API', ('kind',))
+PROMPT_TOKENS = REGISTRY.histogram('chat_prompt_tokens', 'Locally counted prompt tokens per completion call',
+                                   TOKEN_BUCKETS)
+TOOL_CALLS = REGISTRY.counter('chat_tool_calls_total', 'Tool calls by tool and outcome', ('tool', 'outcome'))
+REQUEST_TOOL_CALLS = REGISTRY.histogram('chat_request_tool_calls', 'Tool calls per chat turn', COUNT_BUCKETS)
+REQUEST_LLM_CALLS = REGISTRY.histogram('chat_request_llm_calls', 'Completion calls per chat turn', COUNT_BUCKETS)
+
+
+class _Span:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(seconds, self.stage)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            stages = trace['stages']
+            stages[self.stage] = stages.get(self.stage, 0.0) + seconds
+        return False
+
+
+def span(stage):
+    """Context manager timing one stage of the current chat turn"""
+    if not ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+def start_request(endpoint):
+    """Begin the trace of a chat turn on this thread"""
+    if ENABLED:
+        _local.trace = {'endpoint': endpoint, 'started': time.perf_counter(), 'outcome': None, 'stages': {},
+                        'llm_calls': 0, 'tool_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+
+def set_outcome(outcome):
+    """How the turn was answered: routed, cached, llm or error"""
+    trace = getattr(_local, 'trace', None) if ENABLED else None
+    if trace is not None:
+        trace['outcome'] = outcome
+
+
+def record_llm_call(usage=None):
+    """Count a completion call and the token usage the API reported for it, if any"""
+    if not ENABLED:
+        return
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace['llm_calls'] += 1
+    record_usage(usage)
+
+
+def record_usage(usage):
+    """Add reported token usage (for streams it arrives with the last chunk)"""
+    if not ENABLED or usage is None:
+        return
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    LLM_TOKENS.inc(prompt_tokens, 'prompt')
+    LLM_TOKENS.inc(completion_tokens, 'completion')
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace['prompt_tokens'] += prompt_tokens
+        trace['completion_tokens'] += completion_tokens
+
+
+def record_prompt_tokens(tokens):
+    if ENABLED:
+        PROMPT_TOKENS.observe(tokens)
+
+
+def record_tool_calls(names):
+    """Count the tool calls the model asked for in one completion"""
+    if not ENABLED:
+        return
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace['tool_calls'] += len(names)
+
+
+def record_tool_result(name, error=False):
+    if ENABLED:
+        TOOL_CALLS.inc(1, name, 'error' if error else 'ok')
+
+
+def finish_request(outcome=None):
+    """Close the trace of the current chat turn and record it"""
+    trace = getattr(_local, 'trace', None) if ENABLED else None
+    if trace is None:
+        return
+    _local.trace = None
+    seconds = time.perf_counter() - trace['started']
+    outcome = outcome or trace['outcome'] or 'llm'
+    CHAT_REQUESTS.inc(1, trace['endpoint'], outcome)
+    CHAT_SECONDS.observe(seconds, trace['endpoint'])
+    REQUEST_TOOL_CALLS.observe(trace['tool_calls'])
+    REQUEST_LLM_CALLS.observe(trace['llm_calls'])
+    if LOG_REQUESTS:
+        print(json.dumps({
+            'event': 'chat_request',
+            'endpoint': trace['endpoint'],
+            'outcome': outcome,
+            'seconds': round(seconds, 4),
+            'stages': {stage: round(value, 4) for stage, value in trace['stages'].items()},
+            'llm_calls': trace['llm_calls'],
+            'tool_calls': trace['tool_calls'],
+            'prompt_tokens': trace['prompt_tokens'],
+            'completion_tokens': trace['completion_tokens']
+        }))
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,72 @@
+"""Schema upgrades for databases created before a model gained an index.
+
+db.create_all() only creates missing tables, so an existing shop.db keeps the
+indexes it was created with. create_missing_indexes() adds every index declared in
+models.py that the database does not have yet. Building an index on a large table
+takes a while and locks it for writes, so this is a deploy step, run once before the
+new workers start:
+
+    python migrations.py [--database sqlite:///shop.db] [--analyze]
+
+(--database defaults to DATABASE_URL.) With DB_CREATE_INDEXES_ON_START=1 the app runs
+it at startup instead, after create_all(); convenient for a development database.
+"""
+import argparse
+import os
+import time
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import DBAPIError
+
+from db import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+
+
+def missing_indexes(engine):
+    """Indexes declared on the models that the database lacks, for tables it has"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def create_missing_indexes(engine, analyze=False):
+    """Create the missing indexes; with analyze, refresh the planner statistics too"""
+    created = []
+    for index in missing_indexes(engine):
+        started = time.perf_counter()
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except DBAPIError as e:
+            # Another process created it between the check and the CREATE INDEX
+            if 'already exists' not in str(e.orig):
+                raise
+            continue
+        print(f"Created index {index.name} on {index.table.name} in {time.perf_counter() - started:.2f}s")
+        created.append(index.name)
+    if analyze:
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add missing model indexes to an existing database")
+    parser.add_argument('--database', default=os.environ.get('DATABASE_URL', 'sqlite:///shop.db'),
+                        help='SQLAlchemy database URL (default: DATABASE_URL or sqlite:///shop.db)')
+    parser.add_argument('--analyze', action='store_true', help='run ANALYZE afterwards')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database)
+    created = create_missing_indexes(engine, analyze=args.analyze)
+    if not created:
+        print("All model indexes are present")
+
+
+if __name__ == '__main__':
+    main()
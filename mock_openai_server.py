@@ -0,0 +1,274 @@
+"""Local stand-in for the OpenAI chat-completions API.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1 to exercise the
+chat pipeline (including streaming and tool calls) without network access or cost:
+
+    python mock_openai_server.py --port 8001 --latency 0.2 --token-delay 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (pattern, tool name, argument template) matched against the user question.
+# Argument values may reference regex groups, e.g. "{1}".
+DEFAULT_TOOL_RULES = [
+    (r'allowance', 'get_available_allowance', {}),
+    (r'credit', 'get_available_credits', {}),
+    (r'order (?:number |#)?#?(\d+)', 'get_order_status', {'order_id': '{1}'}),
+    (r'(?:last|recent) order', 'get_last_order_status', {}),
+    (r'escalate|human|speak to (?:an? )?(?:agent|person)', 'escalate_to_support',
+     {'issue': 'Customer asked for a human agent', 'ticket_type': 'general'}),
+]
+
+DEFAULT_ANSWER = ("Thanks for reaching out. Based on our support policy, "
+                  "I can help you with that. Is there anything else you need?")
+
+# Two-turn cancellation flow: ask for a reason, then escalate it to support (the app
+# doesn't run create_support_ticket_for_cancellation)
+CANCEL_PATTERN = re.compile(r'cancel\w*\b.*?order (?:number |#)?#?(\d+)', re.IGNORECASE)
+REASON_QUESTION = "Could you please tell me the reason for cancellation?"
+
+
+class MockConfig:
+    def __init__(self, latency=0.0, token_delay=0.0, tool_rules=None, answer=DEFAULT_ANSWER,
+                 error_rate=0.0, error_status=500):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tool_rules = [(re.compile(p, re.IGNORECASE), name, args)
+                           for p, name, args in (tool_rules or DEFAULT_TOOL_RULES)]
+        self.answer = answer
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+def _question(messages):
+    """The user's question, pulled out of the RAG prompt when present"""
+    content = (messages[-1].get('content') or '') if messages else ''
+    match = re.search(r'User Question:\s*(.*?)\s*\n', content)
+    return match.group(1) if match else content
+
+
+def _pending_tool_results(messages):
+    """Tool results sent back since the model last asked for them"""
+    results = []
+    for message in reversed(messages[:-1]):
+        if message.get('role') not in ('function', 'tool'):
+            break
+        results.append(message.get('content') or '')
+    return list(reversed(results))
+
+
+def _cancellation_order(messages):
+    """Order id if the previous assistant turn asked why the customer wants to cancel it"""
+    history = [m for m in messages[:-1] if m.get('role') in ('user', 'assistant') and m.get('content')]
+    if len(history) < 2 or history[-1]['role'] != 'assistant' or REASON_QUESTION not in history[-1]['content']:
+        return None
+    match = CANCEL_PATTERN.search(history[-2]['content'])
+    return match.group(1) if match else None
+
+
+def _tool_call(name, arguments):
+    return {'id': f"call_{uuid.uuid4().hex[:12]}", 'type': 'function',
+            'function': {'name': name, 'arguments': json.dumps(arguments)}}
+
+
+def plan_response(config, messages, tools_enabled=True):
+    """Decide what the mock model says: either (tool_calls, None) or (None, text)"""
+    tool_results = _pending_tool_results(messages)
+    if tool_results:
+        parts = []
+        for result in tool_results:
+            try:
+                parts.append(json.loads(result).get('message') or result)
+            except (ValueError, AttributeError):
+                parts.append(result)
+        return None, ' '.join(parts)
+
+    question = _question(messages)
+    order_id = _cancellation_order(messages)
+    if order_id and tools_enabled:
+        return [_tool_call('escalate_to_support',
+                           {'issue': f"Cancellation of order #{order_id}: {question}"})], None
+    if CANCEL_PATTERN.search(question):
+        return None, REASON_QUESTION
+
+    if tools_enabled:
+        # Every matching rule becomes a tool call, so compound questions get parallel calls
+        tool_calls = []
+        for pattern, name, args in config.tool_rules:
+            match = pattern.search(question)
+            if match and name not in [call['function']['name'] for call in tool_calls]:
+                groups = (match.group(0),) + match.groups()
+                arguments = {key: value.format(*groups) if isinstance(value, str) else value
+                             for key, value in args.items()}
+                tool_calls.append(_tool_call(name, arguments))
+        if tool_calls:
+            return tool_calls, None
+    return None, config.answer
+
+
+def _tokens(text):
+    return re.findall(r'\S+\s*|\s+', text)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.config.count_request()
+
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self._send_json(self.config.error_status, {'error': {'message': 'Injected mock failure'}})
+            return
+
+        tools_enabled = bool(body.get('tools')) and body.get('tool_choice') != 'none'
+        tool_calls, text = plan_response(self.config, body.get('messages', []), tools_enabled)
+        model = body.get('model', 'mock-model')
+        try:
+            if body.get('stream'):
+                usage = None
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    usage = self._completion(model, tool_calls, text, body.get('messages', []))['usage']
+                self._stream(model, tool_calls, text, usage)
+            else:
+                if text and self.config.token_delay:
+                    # Generation time grows with the answer, as it would upstream
+                    time.sleep(self.config.token_delay * len(_tokens(text)))
+                self._send_json(200, self._completion(model, tool_calls, text, body.get('messages', [])))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. its deadline passed); nothing left to do
+            self.close_connection = True
+
+    def _completion(self, model, tool_calls, text, messages):
+        prompt_tokens = sum(len(_tokens(m.get('content') or '')) for m in messages)
+        completion_tokens = len(_tokens(text or '')) + len(tool_calls or [])
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': text, 'tool_calls': tool_calls},
+                'finish_reason': 'tool_calls' if tool_calls else 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+    def _stream(self, model, tool_calls, text, usage=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(delta, finish_reason=None, usage=None):
+            chunk = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else []
+            }
+            if usage:
+                chunk['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        send({'role': 'assistant', 'content': ''})
+        if tool_calls:
+            for index, call in enumerate(tool_calls):
+                send({'tool_calls': [{'index': index, 'id': call['id'], 'type': 'function',
+                                      'function': {'name': call['function']['name'], 'arguments': ''}}]})
+                send({'tool_calls': [{'index': index,
+                                      'function': {'arguments': call['function']['arguments']}}]})
+            send({}, 'tool_calls')
+        else:
+            for token in _tokens(text):
+                if self.config.token_delay:
+                    time.sleep(self.config.token_delay)
+                send({'content': token})
+            send({}, 'stop')
+        if usage:
+            # stream_options.include_usage: a final chunk with usage and no choices
+            send(None, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_mock_server(host='127.0.0.1', port=0, config=None):
+    """Start the mock server on a background thread; returns (server, base_url)"""
+    handler = type('ConfiguredMockOpenAIHandler', (MockOpenAIHandler,), {'config': config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before the first byte of each response')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds per generated token, streamed or not')
+    parser.add_argument('--tool-rules', help='JSON file with [pattern, tool name, arguments] rules')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status for injected errors, e.g. 429')
+    args = parser.parse_args()
+
+    tool_rules = None
+    if args.tool_rules:
+        with open(args.tool_rules) as f:
+            tool_rules = json.load(f)
+    config = MockConfig(latency=args.latency, token_delay=args.token_delay, tool_rules=tool_rules,
+                        error_rate=args.error_rate, error_status=args.error_status)
+
+    handler = type('ConfiguredMockOpenAIHandler', (MockOpenAIHandler,), {'config': config})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
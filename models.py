@@ -2,6 +2,21 @@ from datetime import datetime
 from db import db
 from flask_login import UserMixin
 
+def payment_breakdown(total_amount, meal_allowance, credit_balance):
+    """Split an amount into meal allowance, then credit balance, then credit card"""
+    remaining = total_amount
+    meal_allowance_used = min(remaining, meal_allowance)
+    remaining -= meal_allowance_used
+
+    credit_balance_used = min(remaining, credit_balance)
+    remaining -= credit_balance_used
+
+    return {
+        'meal_allowance': meal_allowance_used,
+        'credit_balance': credit_balance_used,
+        'credit_card': remaining
+    }
+
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -10,6 +25,11 @@ class Company(db.Model):
     default_meal_allowance = db.Column(db.Float, default=0.0)
 
 class Cart(db.Model):
+    # Carts are read per employee, and per (employee, product) when adding an item
+    __table_args__ = (
+        db.Index('ix_cart_employee_product', 'employee_id', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -48,18 +68,7 @@ class Employee(UserMixin, db.Model):
 
     def calculate_payment_breakdown(self, total_amount):
         """Calculate how much to charge from meal allowance vs credit balance vs credit card"""
-        remaining = total_amount
-        meal_allowance_used = min(remaining, self.meal_allowance)
-        remaining -= meal_allowance_used
-
-        credit_balance_used = min(remaining, self.credit_balance)
-        remaining -= credit_balance_used
-
-        return {
-            'meal_allowance': meal_allowance_used,
-            'credit_balance': credit_balance_used,
-            'credit_card': remaining
-        }
+        return payment_breakdown(total_amount, self.meal_allowance, self.credit_balance)
 
     def set_password(self, password):
         """Set password hash for user"""
@@ -103,6 +112,12 @@ class Product(db.Model):
     available = db.Column(db.Boolean, default=True)
 
 class SupportTicket(db.Model):
+    # The ticket list filters on status (and optionally type), newest first
+    __table_args__ = (
+        db.Index('ix_support_ticket_status_created', 'status', 'created_at'),
+        db.Index('ix_support_ticket_status_type_created', 'status', 'ticket_type', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     customer_email = db.Column(db.String(120), nullable=False)
     issue = db.Column(db.Text, nullable=False)
@@ -112,8 +127,10 @@ class SupportTicket(db.Model):
     ticket_type = db.Column(db.String(50), nullable=False, default='general')  # general, cancellation, refund, etc.
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
 
-    def to_dict(self):
-        return {
+    API_FIELDS = ('id', 'customer_email', 'issue', 'status', 'created_at', 'updated_at', 'ticket_type', 'order_id')
+
+    def to_dict(self, fields=None):
+        data = {
             'id': self.id,
             'customer_email': self.customer_email,
             'issue': self.issue,
@@ -123,8 +140,17 @@ class SupportTicket(db.Model):
             'ticket_type': self.ticket_type,
             'order_id': self.order_id
         }
+        if fields is not None:
+            data = {field: data[field] for field in fields}
+        return data
 
 class Order(db.Model):
+    # Order history and the chat's "last order" lookup read one employee's orders newest
+    # first; the index is scanned backwards, so it needs no DESC of its own
+    __table_args__ = (
+        db.Index('ix_order_employee_time', 'employee_id', 'order_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -153,10 +179,13 @@ class Order(db.Model):
     def get_status_display(self):
         return self.status.replace('_', ' ').title()
 
-    def to_dict(self):
-        return {
+    API_FIELDS = ('id', 'product_name', 'quantity', 'total_price', 'order_time', 'status', 'status_display',
+                  'estimated_delivery', 'payment_breakdown')
+
+    def to_dict(self, fields=None):
+        """Serialize the order, limited to fields if given; only product_name loads the product"""
+        data = {
             'id': self.id,
-            'product_name': self.product.name,
             'quantity': self.quantity,
             'total_price': self.price * self.quantity,
             'order_time': self.order_time.isoformat(),
@@ -169,6 +198,25 @@ class Order(db.Model):
                 'card_charged': (self.price * self.quantity) - self.allowance_used - self.credits_used
             }
         }
+        if fields is None or 'product_name' in fields:
+            data['product_name'] = self.product.name
+        if fields is not None:
+            data = {field: data[field] for field in fields}
+        return data
+
+class CheckoutRequest(db.Model):
+    """A checkout placed with an Idempotency-Key, and the response it returned"""
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'idempotency_key', name='uq_checkout_request_employee_key'),
+        # Expired keys are pruned by age
+        db.Index('ix_checkout_request_created', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    idempotency_key = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class Refund(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,105 @@
+"""Keyset pagination, field projection and NDJSON export for list endpoints.
+
+Lists are ordered newest first on (timestamp, id). A page is requested with ?limit=N
+and continued with ?cursor=<token>, where the token (from the X-Next-Cursor response
+header) encodes the (timestamp, id) of the last row returned. The next page is then
+read with WHERE (timestamp, id) < (:timestamp, :id), which an index on the timestamp
+answers without counting past the rows already sent, unlike OFFSET.
+
+?fields=a,b,c limits each row to the named keys. ?format=ndjson (or an Accept header
+of application/x-ndjson) streams every row after the cursor as one JSON object per
+line, fetched from the database in batches instead of built up as one list.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+NDJSON_BATCH = 500
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+class PaginationError(ValueError):
+    """A malformed limit, cursor or field list; reported to the client as a 400"""
+
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be a number')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_fields(value, allowed):
+    """The requested field names in order, or None for all of them"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}; available: {', '.join(allowed)}")
+    return fields
+
+
+def wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == NDJSON_MIMETYPE)
+
+
+def keyset_query(query, timestamp_column, id_column, cursor=None):
+    """Order query newest first and start it after the row the cursor points at"""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(timestamp_column, id_column) < tuple_(timestamp, row_id))
+    return query.order_by(timestamp_column.desc(), id_column.desc())
+
+
+def paginated_response(query, timestamp_column, id_column, serialize):
+    """Respond with one page of query, or with all of it as NDJSON.
+
+    serialize(row) turns a row into a dict. The page is a JSON array, as the
+    unpaginated endpoints returned; X-Next-Cursor is set when more rows follow.
+    """
+    query = keyset_query(query, timestamp_column, id_column, request.args.get('cursor'))
+    if wants_ndjson():
+        limit = parse_limit(request.args['limit']) if 'limit' in request.args else None
+        if limit is not None:
+            query = query.limit(limit)
+
+        def generate():
+            for row in query.yield_per(NDJSON_BATCH):
+                yield json.dumps(serialize(row)) + '\n'
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    limit = parse_limit(request.args.get('limit'))
+    # One extra row tells whether there is a next page
+    rows = query.limit(limit + 1).all()
+    response = jsonify([serialize(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor(getattr(last, timestamp_column.key), last.id)
+    return response
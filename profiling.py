@@ -0,0 +1,309 @@
+"""Opt-in request profiling: stack samples and SQL timings of sampled or slow requests.
+
+Enable it with PROFILE_SAMPLE_RATE (fraction of requests always captured) and/or
+PROFILE_SLOW_MS (any request slower than this is captured). While a request is being
+captured, a background thread samples its Python stack every PROFILE_INTERVAL_MS and
+every SQL statement it issues is timed. Captured requests are written to PROFILE_DIR
+as a pair of files named after the start time, route and duration:
+
+    <name>.json     request, status, duration, SQL statements with timings, top frames
+    <name>.folded   collapsed stacks ("outer;inner;leaf count" per line), readable by
+                    flamegraph.pl, speedscope and inferno
+
+Only the newest PROFILE_MAX_FILES captures are kept. Summarise a directory with:
+
+    python profiling.py instance/profiles
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ENVIRON_KEY = 'profiling.capture'
+MAX_STACK_DEPTH = 128
+MAX_STATEMENT_CHARS = 2000
+TOP_FRAMES = 15
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+def _fold(frame):
+    """Collapsed stack of a frame, outermost call first"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Capture:
+    def __init__(self, thread_id, sampled):
+        self.thread_id = thread_id
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+        self.stacks = {}
+        self.samples = 0
+        self.queries = []
+        self.status = None
+        self._lock = threading.Lock()
+
+    def add_query(self, statement, seconds, rows, executemany):
+        # Tool calls run queries on pool threads with a copy of the request context
+        with self._lock:
+            self.queries.append({
+                'statement': statement[:MAX_STATEMENT_CHARS],
+                'ms': round(seconds * 1000, 3),
+                'rows': rows,
+                'executemany': executemany
+            })
+
+    def add_sample(self, stack):
+        # The sampler thread may still hold this capture after finish() removed it
+        with self._lock:
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def snapshot(self):
+        """(stacks, samples, queries) copied under the lock"""
+        with self._lock:
+            return dict(self.stacks), self.samples, list(self.queries)
+
+
+class RequestProfiler:
+    """Captures stack samples and SQL of a fraction of requests and of slow requests"""
+
+    def __init__(self, directory, sample_rate=0.0, slow_ms=0, interval_ms=5, max_files=200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000.0
+        self.max_files = max_files
+        self._active = {}  # thread id -> _Capture
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        self.captured = 0
+        self.discarded = 0
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    def start(self):
+        """Begin capturing the current request if it is sampled or may turn out slow"""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_ms <= 0:
+            return None
+        capture = _Capture(threading.get_ident(), sampled)
+        with self._lock:
+            self._active[capture.thread_id] = capture
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        return capture
+
+    def _sample_loop(self):
+        while True:
+            if not self._active:
+                # Sleep until a request is being captured
+                self._wake.clear()
+                if not self._active:
+                    self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                captures = list(self._active.values())
+            for capture in captures:
+                frame = frames.get(capture.thread_id)
+                if frame is None:
+                    continue
+                capture.add_sample(_fold(frame))
+            del frames
+
+    def finish(self, capture, status=None):
+        """Stop capturing; write the capture out if the request was sampled or slow"""
+        duration_ms = (time.perf_counter() - capture.started) * 1000
+        slow = self.slow_ms > 0 and duration_ms >= self.slow_ms
+        with self._lock:
+            self._active.pop(capture.thread_id, None)
+            if not (capture.sampled or slow):
+                self.discarded += 1
+                return None
+        try:
+            path = self._write(capture, duration_ms, 'slow' if slow else 'sampled', status)
+        except OSError as e:
+            print(f"Error writing request profile: {str(e)}")
+            return None
+        with self._lock:
+            self.captured += 1
+        self._rotate()
+        return path
+
+    def _write(self, capture, duration_ms, reason, status):
+        os.makedirs(self.directory, exist_ok=True)
+        route = (request.endpoint or 'unknown') if has_request_context() else 'unknown'
+        name = f"{capture.started_at.strftime('%Y%m%d-%H%M%S-%f')}_{route}_{int(duration_ms)}ms"
+
+        stacks, samples, queries = capture.snapshot()
+        leaves = {}
+        for stack, count in stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        statements = {}
+        for query in queries:
+            statements[query['statement']] = statements.get(query['statement'], 0) + 1
+
+        report = {
+            'reason': reason,
+            'method': request.method if has_request_context() else None,
+            'path': request.full_path.rstrip('?') if has_request_context() else None,
+            'endpoint': route,
+            'status': status,
+            'started_at': capture.started_at.isoformat(),
+            'duration_ms': round(duration_ms, 3),
+            'interval_ms': self.interval * 1000,
+            'samples': samples,
+            'top_frames': [{'frame': frame, 'samples': count}
+                           for frame, count in sorted(leaves.items(), key=lambda item: -item[1])[:TOP_FRAMES]],
+            'sql': {
+                'count': len(queries),
+                'total_ms': round(sum(query['ms'] for query in queries), 3),
+                # Statements issued more than once usually mean an N+1 pattern
+                'repeated': {statement: count for statement, count in statements.items() if count > 1},
+                'queries': queries
+            },
+            'profile': f"{name}.folded"
+        }
+        with open(os.path.join(self.directory, f"{name}.folded"), 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{name}.json"), 'w') as f:
+            json.dump(report, f, indent=2)
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _rotate(self):
+        try:
+            reports = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        except OSError:
+            return
+        for name in reports[:max(0, len(reports) - self.max_files)]:
+            for path in (name, name[:-len('.json')] + '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'slow_ms': self.slow_ms,
+                'active': len(self._active),
+                'captured': self.captured,
+                'discarded': self.discarded
+            }
+
+
+def _current_capture():
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_capture() is not None:
+        conn.info.setdefault('profiling.started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _current_capture()
+    starts = conn.info.get('profiling.started')
+    if capture is None or not starts:
+        return
+    capture.add_query(statement, time.perf_counter() - starts.pop(), cursor.rowcount, executemany)
+
+
+def init_profiling(app):
+    """Install the profiler on a Flask app when PROFILE_SAMPLE_RATE or PROFILE_SLOW_MS is set"""
+    profiler = RequestProfiler(
+        directory=app.config.get('PROFILE_DIR', 'instance/profiles'),
+        sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0.0),
+        slow_ms=app.config.get('PROFILE_SLOW_MS', 0),
+        interval_ms=app.config.get('PROFILE_INTERVAL_MS', 5),
+        max_files=app.config.get('PROFILE_MAX_FILES', 200)
+    )
+    app.extensions['profiler'] = profiler
+    if not profiler.enabled:
+        return profiler
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_profile():
+        capture = profiler.start()
+        if capture is not None:
+            request.environ[ENVIRON_KEY] = capture
+
+    @app.after_request
+    def _record_status(response):
+        capture = request.environ.get(ENVIRON_KEY)
+        if capture is not None:
+            capture.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        capture = request.environ.pop(ENVIRON_KEY, None)
+        if capture is not None:
+            profiler.finish(capture, capture.status or (500 if exc else None))
+
+    print(f"Request profiling on: sample rate {profiler.sample_rate}, slow threshold {profiler.slow_ms} ms, "
+          f"writing to {profiler.directory}")
+    return profiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise captured request profiles")
+    parser.add_argument('directory', nargs='?', default='instance/profiles')
+    parser.add_argument('--top', type=int, default=10, help='requests and frames to list')
+    args = parser.parse_args()
+
+    reports = []
+    for name in sorted(os.listdir(args.directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(args.directory, name)) as f:
+                reports.append(json.load(f))
+    if not reports:
+        print(f"No profiles in {args.directory}")
+        return
+
+    print(f"{len(reports)} captured requests; slowest:")
+    for report in sorted(reports, key=lambda r: -r['duration_ms'])[:args.top]:
+        print(f"  {report['duration_ms']:9.1f} ms  {report['method']} {report['path']}  "
+              f"{report['sql']['count']} SQL ({report['sql']['total_ms']:.1f} ms)  {report['profile']}")
+
+    frames = {}
+    for report in reports:
+        for entry in report['top_frames']:
+            frames[entry['frame']] = frames.get(entry['frame'], 0) + entry['samples']
+    print("Most sampled frames:")
+    for frame, count in sorted(frames.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {count:6d}  {frame}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Token-budgeted assembly of the chat-completion messages.
+
+Every completion request is fitted into a fixed token budget, counted locally:
+
+    fixed      system text, tool schemas, the prompt around the question and the tool
+               calls/results of the turn in progress (each result capped)
+    context    retrieved SOP passages in rank order, duplicates removed
+    summary    a running summary of turns that were rolled out of the history
+    history    the most recent whole exchanges that still fit
+
+Finished turns are stored as plain user/assistant pairs; raw tool results are dropped
+once the answer that used them is in the history. Turns beyond the history limit are
+rolled into the summary instead of being sent in full.
+"""
+import json
+import os
+import re
+import threading
+
+import metrics
+
+try:
+    import tiktoken
+except ImportError:  # exact counts are optional; the estimate errs on the high side
+    tiktoken = None
+
+# Per-message framing tokens in the chat format, plus the reply primer
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# Without tiktoken: a token per punctuation mark and per 4 characters of a word
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class TokenCounter:
+    """Counts tokens with the model's tiktoken encoding, or estimates them without it"""
+
+    def __init__(self, model='gpt-3.5-turbo'):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                try:
+                    self.encoding = tiktoken.get_encoding('cl100k_base')
+                except Exception as e:
+                    print(f"Error loading tiktoken encoding, estimating tokens instead: {str(e)}")
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return len(_TOKEN_PATTERN.findall(text))
+
+    def truncate(self, text, max_tokens):
+        """The longest prefix of text within max_tokens, marked with '...' when cut"""
+        if max_tokens <= 0:
+            return ''
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max(max_tokens - 1, 0)]) + '...'
+        # The estimate counts each '.' of the marker as a token
+        keep = max_tokens - self.count('...')
+        if keep <= 0:
+            return ''
+        end = 0
+        for number, match in enumerate(_TOKEN_PATTERN.finditer(text), 1):
+            if number > keep:
+                break
+            end = match.end()
+        return text[:end] + '...'
+
+    def count_message(self, message):
+        tokens = MESSAGE_OVERHEAD + self.count(message.get('content'))
+        for call in message.get('tool_calls') or []:
+            tokens += self.count(call['function']['name']) + self.count(call['function']['arguments'])
+        return tokens
+
+
+def _normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def _exchanges(history):
+    """Completed (user text, assistant text) pairs; tool calls and results are left out"""
+    exchanges = []
+    question = None
+    for message in history:
+        if message['role'] == 'user':
+            question = message.get('content') or ''
+        elif message['role'] == 'assistant' and message.get('content') and question is not None:
+            exchanges.append((question, message['content']))
+            question = None
+    return exchanges
+
+
+def _pending_tool_messages(history):
+    """Tool calls and results after the last answer: the turn in progress"""
+    for position in range(len(history) - 1, -1, -1):
+        if history[position]['role'] == 'assistant' and history[position].get('content'):
+            return history[position + 1:]
+    return [m for m in history if m['role'] == 'tool' or m.get('tool_calls')]
+
+
+class PromptBuilder:
+    """Builds completion messages within a token budget and keeps histories compact"""
+
+    def __init__(self, counter=None, budget=3000, context_tokens=1500, history_tokens=1000,
+                 summary_tokens=200, tool_result_tokens=400):
+        self.counter = counter or TokenCounter()
+        self.budget = budget
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.tool_result_tokens = tool_result_tokens
+        self._tools_cache = (None, 0)
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_budget = 0
+        self.passages_dropped = 0
+        self.exchanges_dropped = 0
+        self.turns_summarized = 0
+
+    def _tools_tokens(self, tools):
+        # The schemas are the same on every call; count them once
+        cached_tools, tokens = self._tools_cache
+        if tools is not cached_tools:
+            tokens = self.counter.count(json.dumps(tools)) if tools else 0
+            self._tools_cache = (tools, tokens)
+        return tokens
+
+    def _fit_passages(self, passages, available):
+        """Context text from (citation, text) passages: unique, in rank order, within available"""
+        kept, seen = [], []
+        used = 0
+        for citation, text in passages:
+            normalized = _normalize(text)
+            if any(normalized in other for other in seen):
+                continue
+            passage = f"[{citation}] {text}"
+            tokens = self.counter.count(passage) + 1
+            if used + tokens > available:
+                if not kept:
+                    # Better part of the best passage than none at all
+                    kept.append(self.counter.truncate(passage, available))
+                break
+            kept.append(passage)
+            seen.append(normalized)
+            used += tokens
+        return '\n'.join(kept), len(passages) - len(kept)
+
+    def build(self, system, render_prompt, passages, history, summary=None, tools=None):
+        """Return the completion messages for one request.
+
+        render_prompt(context) renders the final user message around the SOP context;
+        passages are (citation, text) pairs, best first; history is the stored
+        conversation, including the tool calls and results of the turn in progress.
+        """
+        pending = []
+        for message in _pending_tool_messages(history):
+            if message['role'] == 'tool':
+                message = dict(message, content=self.counter.truncate(message.get('content') or '',
+                                                                      self.tool_result_tokens))
+            pending.append(message)
+
+        fixed = (REPLY_OVERHEAD + self._tools_tokens(tools)
+                 + self.counter.count_message({'content': system})
+                 + self.counter.count_message({'content': render_prompt('')})
+                 + sum(self.counter.count_message(m) for m in pending))
+        remaining = self.budget - fixed
+
+        context, dropped = self._fit_passages(passages, max(0, min(self.context_tokens, remaining)))
+        remaining -= self.counter.count(context)
+
+        system_content = system
+        if summary:
+            summary = self.counter.truncate(summary, max(0, min(self.summary_tokens, remaining)))
+            if summary:
+                system_content = f"{system}\n\nSummary of the earlier conversation:\n{summary}"
+                remaining -= self.counter.count(system_content) - self.counter.count(system)
+
+        recent = []
+        available = max(0, min(self.history_tokens, remaining))
+        exchanges = _exchanges(history)
+        for question, answer in reversed(exchanges):
+            pair = [{'role': 'user', 'content': question}, {'role': 'assistant', 'content': answer}]
+            tokens = sum(self.counter.count_message(m) for m in pair)
+            if tokens > available:
+                break
+            recent = pair + recent
+            available -= tokens
+            remaining -= tokens
+
+        messages = [{'role': 'system', 'content': system_content}] + recent + pending + [
+            {'role': 'user', 'content': render_prompt(context)}
+        ]
+        tokens = self.budget - remaining
+        metrics.record_prompt_tokens(tokens)
+        with self._lock:
+            self.prompts += 1
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+            self.over_budget += int(remaining < 0)
+            self.passages_dropped += dropped
+            self.exchanges_dropped += len(exchanges) - len(recent) // 2
+        return messages
+
+    def _summary_line(self, question, answer):
+        return (f"- Customer: {self.counter.truncate(' '.join(question.split()), 40)}"
+                f" | Agent: {self.counter.truncate(' '.join(answer.split()), 60)}")
+
+    def compact(self, history, summary, max_turns):
+        """Return (history, summary) after a finished turn.
+
+        The history keeps at most max_turns exchanges within the history token budget,
+        as plain user/assistant messages; older exchanges become summary lines, and the
+        oldest summary lines go once the summary outgrows its own budget.
+        """
+        exchanges = _exchanges(history)
+        costs = [self.counter.count(q) + self.counter.count(a) + 2 * MESSAGE_OVERHEAD for q, a in exchanges]
+        lines = summary.split('\n') if summary else []
+        rolled = 0
+        while exchanges and (len(exchanges) > max_turns or sum(costs) > self.history_tokens):
+            lines.append(self._summary_line(*exchanges.pop(0)))
+            costs.pop(0)
+            rolled += 1
+        while len(lines) > 1 and self.counter.count('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        if rolled:
+            with self._lock:
+                self.turns_summarized += rolled
+
+        history = []
+        for question, answer in exchanges:
+            history.append({'role': 'user', 'content': question})
+            history.append({'role': 'assistant', 'content': answer})
+        return history, '\n'.join(lines) or None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'budget': self.budget,
+                'exact_counts': self.counter.encoding is not None,
+                'prompts': self.prompts,
+                'avg_tokens': self.total_tokens / self.prompts if self.prompts else 0.0,
+                'max_tokens': self.max_tokens,
+                'over_budget': self.over_budget,
+                'passages_dropped': self.passages_dropped,
+                'exchanges_dropped': self.exchanges_dropped,
+                'turns_summarized': self.turns_summarized
+            }
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def get_prompt_builder():
+    """Return the process-wide PromptBuilder.
+
+    Budgets come from the environment: PROMPT_TOKEN_BUDGET, PROMPT_CONTEXT_TOKENS,
+    PROMPT_HISTORY_TOKENS, PROMPT_SUMMARY_TOKENS and PROMPT_TOOL_RESULT_TOKENS.
+    """
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                _builder = PromptBuilder(
+                    budget=int(os.environ.get('PROMPT_TOKEN_BUDGET', 3000)),
+                    context_tokens=int(os.environ.get('PROMPT_CONTEXT_TOKENS', 1500)),
+                    history_tokens=int(os.environ.get('PROMPT_HISTORY_TOKENS', 1000)),
+                    summary_tokens=int(os.environ.get('PROMPT_SUMMARY_TOKENS', 200)),
+                    tool_result_tokens=int(os.environ.get('PROMPT_TOOL_RESULT_TOKENS', 400))
+                )
+    return _builder
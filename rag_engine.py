@@ -1,214 +1,190 @@
-import numpy as np
-from openai import OpenAI
 import os
 from db import db
 from models import Order, SupportTicket
-
-# Global OpenAI client that will be initialized in __init__
-client = None
-import faiss
-from sklearn.feature_extraction.text import TfidfVectorizer
+from intent_router import get_intent_router
+from llm_client import get_llm_client
+import metrics
+from prompt_builder import get_prompt_builder
+from response_cache import get_response_cache, is_cacheable_query
+from retrieval import get_retrieval_index
+from session_store import ConversationState
+from tool_executor import get_tool_executor
 import re
-from datetime import datetime
 import json
-import pickle
-import os
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "create_support_ticket_for_cancellation",
+            "description": "Create a support ticket for order cancellation",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_id": {
+                        "type": "integer",
+                        "description": "ID of the order to cancel"
+                    },
+                    "issue": {
+                        "type": "string",
+                        "description": "Reason for cancellation"
+                    }
+                },
+                "required": ["order_id", "issue"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_available_credits",
+            "description": "Get the user's current available credit balance",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_last_order_status",
+            "description": "Get the status of the user's most recent order",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_order_status",
+            "description": "Get the status of a specific order by its ID",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_id": {
+                        "type": "string",
+                        "description": "The ID of the order to look up"
+                    }
+                },
+                "required": ["order_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "escalate_to_support",
+            "description": "Create a support ticket and escalate the issue to the customer support team",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "issue": {
+                        "type": "string",
+                        "description": "Description of the issue to escalate"
+                    },
+                    "ticket_type": {
+                        "type": "string",
+                        "description": "Type of support ticket",
+                        "enum": ["general", "order", "technical", "billing"]
+                    }
+                },
+                "required": ["issue", "ticket_type"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_available_allowance",
+            "description": "Get the user's current available meal allowance",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    }
+]
+
+SYSTEM_PROMPT = "You are a helpful customer support agent with access to the conversation history."
+
+# Answer for a turn whose model still asks for tools after LLM_MAX_TOOL_ROUNDS rounds
+TOOL_LIMIT_MESSAGE = ("I'm sorry, I couldn't finish looking that up. "
+                      "Please try again, or ask to speak to a support agent.")
+
+# MCP patterns for order-related queries
+ORDER_PATTERNS = [
+    r'order (?:number|#)?\s*[#]?(\d+)',
+    r'my (?:recent )?order',
+    r'order status',
+    r'track (?:my )?order',
+    r'where is my order'
+]
+
 
 class RAGEngine:
-    def __init__(self, sop_file_path, api_key=None, max_history=10):
-        # Initialize OpenAI client with provided API key
-        global client
+    def __init__(self, sop_file_path, api_key=None, max_history=10, state=None, max_tool_rounds=None):
         if not api_key:
             raise ValueError("API key is required for RAGEngine")
-        client = OpenAI(api_key=api_key)
+        # Shared, pooled LLM client; created once per process
+        self.llm = get_llm_client(api_key)
         
-        # Initialize conversation state
+        # Conversation state lives in the session store; the engine only borrows it
+        self.state = state or ConversationState()
         self.conversation_state = None
-        self.pending_order_id = None
         self.pending_customer_email = None
-        self.tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "create_support_ticket_for_cancellation",
-                    "description": "Create a support ticket for order cancellation",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "order_id": {
-                                "type": "integer",
-                                "description": "ID of the order to cancel"
-                            },
-                            "issue": {
-                                "type": "string",
-                                "description": "Reason for cancellation"
-                            }
-                        },
-                        "required": ["order_id", "issue"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_available_credits",
-                    "description": "Get the user's current available credit balance",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_last_order_status",
-                    "description": "Get the status of the user's most recent order",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_order_status",
-                    "description": "Get the status of a specific order by its ID",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "order_id": {
-                                "type": "string",
-                                "description": "The ID of the order to look up"
-                            }
-                        },
-                        "required": ["order_id"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "escalate_to_support",
-                    "description": "Create a support ticket and escalate the issue to the customer support team",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "issue": {
-                                "type": "string",
-                                "description": "Description of the issue to escalate"
-                            },
-                            "ticket_type": {
-                                "type": "string",
-                                "description": "Type of support ticket",
-                                "enum": ["general", "order", "technical", "billing"]
-                            }
-                        },
-                        "required": ["issue", "ticket_type"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_available_allowance",
-                    "description": "Get the user's current available meal allowance",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                }
-            }
-        ]
-        self.sop_content = self._load_sop_file(sop_file_path)
+        self.tools = TOOLS
+        self.tool_executor = get_tool_executor()
         self.max_history = max_history
-        self.conversation_history = []
-        self.current_order_context = None
+        # Guards the completion/tool-call loop against a model that keeps calling tools
+        self.max_tool_rounds = max_tool_rounds or int(os.environ.get('LLM_MAX_TOOL_ROUNDS', 3))
         
-        # Try to load existing resources, if not found, create new ones
-        if self._resources_exist():
-            self._load_resources()
-        else:
-            # Process content and create new resources
-            self.chunks = self._chunk_content(self.sop_content)
-            self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-            self.vectors = self.vectorizer.fit_transform(self.chunks).toarray()
-            
-            # Initialize FAISS index
-            dimension = self.vectors.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(self.vectors.astype('float32'))
-            
-            # Save the vectorizer and chunks mapping
-            self._save_resources()
+        # The retrieval corpus is immutable and shared by every session in this process
+        self.retrieval = get_retrieval_index(sop_file_path)
+        self.response_cache = get_response_cache(sop_file_path)
+        self.intent_router = get_intent_router()
+        self.prompt_builder = get_prompt_builder()
         
         # MCP patterns for order-related queries
-        self.order_patterns = [
-            r'order (?:number|#)?\s*[#]?(\d+)',
-            r'my (?:recent )?order',
-            r'order status',
-            r'track (?:my )?order',
-            r'where is my order'
-        ]
+        self.order_patterns = ORDER_PATTERNS
     
-    def _load_sop_file(self, file_path):
-        with open(file_path, 'r') as file:
-            return file.read()
+    @property
+    def conversation_history(self):
+        return self.state.conversation_history
     
-    def _chunk_content(self, content, chunk_size=200):
-        # Split content into sections based on headers
-        sections = re.split(r'\n##? ', content)
-        chunks = []
-        
-        for section in sections:
-            # Split section into smaller chunks while preserving context
-            words = section.split()
-            current_chunk = []
-            current_length = 0
-            
-            for word in words:
-                current_chunk.append(word)
-                current_length += len(word) + 1
-                
-                if current_length >= chunk_size:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = []
-                    current_length = 0
-            
-            if current_chunk:
-                chunks.append(' '.join(current_chunk))
-        
-        return chunks
+    @conversation_history.setter
+    def conversation_history(self, value):
+        self.state.conversation_history = value
     
-    def _create_vectors(self):
-        # This method is now just a placeholder since we create vectors in __init__
-        pass
-        self.index = faiss.IndexFlatL2(dimension)
-        
-        # Add vectors to the index
-        self.index.add(self.vectors.astype('float32'))
+    @property
+    def cancellation_state(self):
+        return self.state.cancellation_state
+    
+    @cancellation_state.setter
+    def cancellation_state(self, value):
+        self.state.cancellation_state = value
+    
+    @property
+    def pending_order_id(self):
+        return self.state.pending_order_id
+    
+    @pending_order_id.setter
+    def pending_order_id(self, value):
+        self.state.pending_order_id = value
+    
+    @property
+    def current_order_context(self):
+        return self.state.current_order_context
+    
+    @current_order_context.setter
+    def current_order_context(self, value):
+        self.state.current_order_context = value
     
-    def _resources_exist(self):
-        """Check if saved resources exist and are compatible with current scikit-learn version"""
-        try:
-            if not (os.path.exists('resources/vectorizer.pkl') and \
-                    os.path.exists('resources/chunks.pkl') and \
-                    os.path.exists('resources/faiss_index.bin')):
-                return False
-            
-            # Try to load the vectorizer to check its version
-            with open('resources/vectorizer.pkl', 'rb') as f:
-                vectorizer = pickle.load(f)
-                if not hasattr(vectorizer, '_sklearn_version') or vectorizer._sklearn_version != '1.6.1':
-                    return False
-            return True
-        except Exception:
-            return False
-
     def _create_cancellation_ticket(self, order_id, customer_email, reason):
         """Create a support ticket for order cancellation"""
         from app import SupportTicket, db, app, Order, current_app
@@ -245,21 +221,28 @@ class RAGEngine:
             print(f"Error creating cancellation ticket: {str(e)}")
             return False
 
-    def _get_order_details(self, order_id=None, customer_email=None):
-        """Get order details from the database"""
+    def _get_order_details(self, order_id=None, customer_email=None, employee_id=None):
+        """Get order details from the database.
+
+        With an order_id, only an order of employee_id (or of the employee with
+        customer_email) is returned; without one, the customer's most recent order.
+        """
         from app import Order, Employee, db, app
         try:
-            with app.app_context():
+            with app.app_context(), metrics.span('order_lookup'):
                 if order_id:
-                    order = Order.query.get(order_id)
+                    query = Order.query.filter(Order.id == order_id)
+                    if employee_id is not None:
+                        query = query.filter(Order.employee_id == employee_id)
+                    elif customer_email:
+                        query = query.join(Employee, Order.employee_id == Employee.id)\
+                            .filter(Employee.email == customer_email)
+                    order = query.first()
                 elif customer_email:
-                    # Get most recent order for the customer by their employee email
-                    employee = Employee.query.filter_by(email=customer_email).first()
-                    if employee:
-                        order = Order.query.filter_by(employee_id=employee.id)\
-                            .order_by(Order.order_time.desc()).first()
-                    else:
-                        return None
+                    # Most recent order of the employee with this email, in one query
+                    order = Order.query.join(Employee, Order.employee_id == Employee.id)\
+                        .filter(Employee.email == customer_email)\
+                        .order_by(Order.order_time.desc()).first()
                 else:
                     return None
 
@@ -280,49 +263,6 @@ class RAGEngine:
             print(f"Error getting order details: {str(e)}")
             return None
 
-    def _resources_exist(self):
-        """Check if saved resources exist"""
-        return os.path.exists('resources/vectorizer.pkl') and \
-               os.path.exists('resources/chunks.pkl') and \
-               os.path.exists('resources/faiss_index.bin')
-
-    def _save_resources(self):
-        """Save vectorizer, chunks, and FAISS index"""
-        # Create a directory for resources if it doesn't exist
-        os.makedirs('resources', exist_ok=True)
-        
-        # Save the vectorizer
-        with open('resources/vectorizer.pkl', 'wb') as f:
-            pickle.dump(self.vectorizer, f)
-        
-        # Save the chunks mapping
-        with open('resources/chunks.pkl', 'wb') as f:
-            pickle.dump(self.chunks, f)
-            
-        # Save the FAISS index
-        faiss.write_index(self.index, 'resources/faiss_index.bin')
-
-    def _load_resources(self):
-        """Load saved vectorizer, chunks, and FAISS index"""
-        try:
-            # Load the vectorizer
-            with open('resources/vectorizer.pkl', 'rb') as f:
-                self.vectorizer = pickle.load(f)
-            
-            # Load the chunks
-            with open('resources/chunks.pkl', 'rb') as f:
-                self.chunks = pickle.load(f)
-                
-            # Load the FAISS index
-            self.index = faiss.read_index('resources/faiss_index.bin')
-            
-            # Get vectors from the index
-            self.vectors = self.index.reconstruct_n(0, self.index.ntotal)
-            return True
-        except Exception as e:
-            print(f"Error loading resources: {str(e)}")
-            return False
-
     def _extract_order_context(self, query):
         """Extract order context from the query using MCP patterns"""
         # Check for order number in query
@@ -361,23 +301,6 @@ class RAGEngine:
             print(f"Error handling cancellation: {str(e)}")
             return "I'm sorry, there was an error processing your request. Please try again later."
 
-    def get_available_allowance(self):
-        """Get the user's current available meal allowance"""
-        from app import Employee
-        from flask_login import current_user
-        try:
-            if not current_user or not current_user.is_authenticated:
-                return "Please log in to check your meal allowance."
-            
-            employee = Employee.query.get(current_user.id)
-            if not employee:
-                return "Could not find your account information."
-            
-            return f"Your current meal allowance is ${employee.meal_allowance:.2f}"
-        except Exception as e:
-            print(f"Error getting meal allowance: {str(e)}")
-            return "Sorry, there was an error retrieving your meal allowance."
-
     def get_available_allowance(self):
         """Get the user's current available meal allowance"""
         from app import current_user
@@ -408,8 +331,10 @@ class RAGEngine:
         return {"message": "No recent orders found"}
 
     def get_order_status(self, order_id):
-        """Get the status of a specific order"""
-        order_details = self._get_order_details(order_id=order_id)
+        """Get the status of a specific order of the logged-in user"""
+        from app import current_user
+        # Someone else's order reads as not found
+        order_details = self._get_order_details(order_id=order_id, employee_id=current_user.id)
         if order_details:
             return {
                 "order_id": order_details['order_id'],
@@ -439,80 +364,6 @@ class RAGEngine:
             print(f"Error creating support ticket: {str(e)}")
             return {"message": "Failed to create support ticket. Please try again later."}
 
-    def generate_response(self, user_query, customer_email=None):
-        """Generate a response using the RAG engine and OpenAI functions"""
-        # Add query to conversation history
-        self.conversation_history.append({"role": "user", "content": user_query})
-        
-        # Initialize state if not exists
-        if not hasattr(self, 'cancellation_state'):
-            self.cancellation_state = None
-            self.pending_order_id = None
-        
-        # Create base system message
-        system_message = {
-            "role": "system",
-            "content": "You are a helpful customer support agent. When handling order cancellations:\n"
-            "1. If user mentions 'cancel' and no order number, just ask 'Could you please provide the order number you want to cancel?'\n"
-            "2. Once you have the order number, just ask 'Could you please tell me the reason for cancellation?'\n"
-            "3. Once you have both order number and reason, immediately create the support ticket.\n"
-            "DO NOT ask for additional confirmation. DO NOT rephrase these questions."
-        }
-        
-        # Check for cancellation intent
-        if 'cancel' in user_query.lower() and not self.cancellation_state:
-            self.cancellation_state = 'need_order_number'
-            return "Could you please provide the order number you want to cancel?"
-        
-        # Check for order number in response
-        elif self.cancellation_state == 'need_order_number':
-            order_match = re.search(r'(?:order\s*)?(?:number|#)?\s*[#]?(\d+)', user_query)
-            if order_match:
-                order_id = int(order_match.group(1))
-                # Validate order exists
-                order_details = self._get_order_details(order_id=order_id)
-                if not order_details:
-                    # Reset state and inform user
-                    self.cancellation_state = None
-                    return f"I couldn't find order #{order_id} in our system. Please check the order number and try again."
-                
-                # Check if order is already cancelled
-                if order_details.get('status') == 'cancelled':
-                    self.cancellation_state = None
-                    return f"Order #{order_id} has already been cancelled."
-                
-                self.pending_order_id = order_id
-                self.cancellation_state = 'need_reason'
-                return "Could you please tell me the reason for cancellation before I log your cancellation request?"
-        
-        # If we have order number and this is the reason
-        elif self.cancellation_state == 'need_reason' and self.pending_order_id:
-            # Create support ticket with the reason
-            result = self.create_support_ticket_for_cancellation(order_id=self.pending_order_id, issue=user_query)
-            
-            # Reset state
-            self.cancellation_state = None
-            self.pending_order_id = None
-            
-            return "I've submitted your cancellation request. A customer service representative will confirm once the cancellation has been processed successfully."
-        
-        # Create messages array
-        messages = [system_message] + self.conversation_history[-3:]
-        
-        # Generate response using OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            tools=self.tools,
-            tool_choice="auto"
-        )
-        
-        message = response.choices[0].message
-        
-        # Add response to conversation history
-        self.conversation_history.append({"role": "assistant", "content": message.content})
-        return message.content
-
     def create_support_ticket_for_cancellation(self, order_id, issue):
         """Create a support ticket for order cancellation"""
         try:
@@ -548,131 +399,298 @@ class RAGEngine:
             db.session.rollback()
             return {"message": "Failed to create support ticket. Please try again later."}
 
-    def get_relevant_context(self, query, k=3, customer_email=None):
+    def _context_query(self, query, customer_email=None, k=3):
+        """Build the retrieval query, enriched with order details or recent conversation"""
         # Check for order-related context first
         order_context = self._extract_order_context(query)
         if order_context:
             self.current_order_context = order_context
             if order_context['type'] == 'order_lookup':
-                order_details = self._get_order_details(order_id=order_context['order_id'])
+                order_details = self._get_order_details(order_id=order_context['order_id'],
+                                                       customer_email=customer_email)
             else:
                 order_details = self._get_order_details(customer_email=customer_email)
             
             if order_details:
                 # Add order details to conversation context
-                context_query = f"Order Details: {json.dumps(order_details)}\n{query}"
-            else:
-                context_query = f"Order not found\n{query}"
-        else:
-            # Regular context handling
-            context_query = query
-            if self.conversation_history:
-                recent_context = ' '.join([f"{msg['role']}: {msg['content']}" 
-                                         for msg in self.conversation_history[-2:]])
-                context_query = f"{recent_context}\n{query}"
+                return f"Order Details: {json.dumps(order_details)}\n{query}"
+            return f"Order not found\n{query}"
         
-        # Convert query to vector using the same vectorizer
-        query_vector = self.vectorizer.transform([context_query]).toarray().astype('float32')
+        # Regular context handling; a warmed FAQ stands on its own and keeps its warm
+        # results, which are keyed on the bare question
+        context_query = query
+        if self.conversation_history and not self.retrieval.is_warm(query, k):
+            recent_context = ' '.join([f"{msg['role']}: {msg['content']}" 
+                                     for msg in self.conversation_history[-2:]])
+            context_query = f"{recent_context}\n{query}"
+        return context_query
+    
+    def get_relevant_context(self, query, k=3, customer_email=None):
+        # Search the shared retrieval index for the relevant chunks
+        passages, _ = self._retrieve(query, customer_email=customer_email, k=k)
         
-        # Search for similar vectors
-        distances, indices = self.index.search(query_vector, k)
+        return '\n'.join(f"[{citation}] {text}" for citation, text in passages)
+    
+    def _retrieve(self, user_query, customer_email=None, k=3):
+        """Return ((citation, chunk text) passages, chunk ids) for a question, best first"""
+        context_query = self._context_query(user_query, customer_email, k)
+        with metrics.span('retrieve'):
+            chunk_ids, _ = self.retrieval.search_ids(context_query, k)
+            passages = [(self.retrieval.citation(i), self.retrieval.chunks[i]) for i in chunk_ids]
+        return passages, chunk_ids
+    
+    def _route_locally(self, user_query):
+        """Answer balance and order-status questions without the LLM; None to fall back"""
+        if self.intent_router is None or self.cancellation_state:
+            return None
+        with metrics.span('route'):
+            decision = self.intent_router.route(user_query, self._extract_order_context(user_query))
+        if decision is None:
+            return None
+        function_name, function_args = decision
+        metrics.set_outcome('routed')
+        metrics.record_tool_calls([function_name])
+        with metrics.span('tools'):
+            result = self._run_tool(function_name, function_args)
+        return self.intent_router.render(function_name, result)
+    
+    def _cache_lookup(self, user_query, chunk_ids):
+        """Return (cached answer or None, whether the answer may be cached)"""
+        if self.response_cache is None:
+            return None, False
+        # Answers are keyed on the question alone, but a follow-up is answered in the
+        # light of the earlier turns; only a conversation's first question is shared
+        if self.conversation_history or self.state.summary or self.cancellation_state \
+                or not is_cacheable_query(user_query) or self._extract_order_context(user_query):
+            self.response_cache.record_bypass()
+            return None, False
+        with metrics.span('cache'):
+            answer = self.response_cache.get(self.retrieval.fingerprint, user_query, chunk_ids,
+                                             query_vector=self.retrieval.embed(user_query))
+        if answer is not None:
+            metrics.set_outcome('cached')
+        return answer, answer is None
+    
+    def _cache_store(self, user_query, chunk_ids, ai_response):
+        self.response_cache.put(self.retrieval.fingerprint, user_query, chunk_ids, ai_response,
+                                query_vector=self.retrieval.embed(user_query))
+    
+    def _build_prompt(self, user_query, context):
+        """Build the RAG prompt for a user question and its retrieved SOP context"""
+        # The conversation itself is sent as messages, so it isn't repeated here
+        return f"""As a customer support AI, use the following context from our support SOP and the conversation history to answer the user's question.
+If the context doesn't contain relevant information, provide a general helpful response.
+Each context passage starts with its source in brackets; mention the source when you rely on a specific policy.
+
+Context from SOP:
+{context}
+
+User Question: {user_query}
+
+Please provide a helpful, professional response that maintains conversation continuity:"""
+    
+    def _completion_messages(self, user_query, passages):
+        """System text, summary, recent history, this turn's tool results and the prompt, within the token budget"""
+        with metrics.span('prompt'):
+            return self.prompt_builder.build(
+            SYSTEM_PROMPT,
+            lambda context: self._build_prompt(user_query, context),
+            passages,
+            self.conversation_history,
+            summary=self.state.summary,
+            tools=self.tools
+        )
+    
+    def _run_tool(self, function_name, function_args):
+        """Dispatch a tool call by name and return its result"""
+        if function_name == "get_available_allowance":
+            function_response = self.get_available_allowance()
+        elif function_name == "get_available_credits":
+            function_response = self.get_available_credits()
+        elif function_name == "get_last_order_status":
+            function_response = self.get_last_order_status()
+        elif function_name == "get_order_status":
+            function_response = self.get_order_status(function_args.get("order_id"))
+        elif function_name == "escalate_to_support":
+            function_response = self.escalate_to_support(function_args.get("issue"))
+        else:
+            function_response = {"error": "Unknown function"}
+        return function_response
+    
+    def _call_tools(self, tool_calls):
+        """Run every tool call of a completion turn and record calls and results in one batch.
         
-        # Get the relevant chunks
-        relevant_chunks = [self.chunks[i] for i in indices[0]]
+        tool_calls is a list of {"id", "name", "arguments"} dicts; the calls run concurrently.
+        """
+        calls = []
+        for tool_call in tool_calls:
+            try:
+                function_args = json.loads(tool_call["arguments"] or "{}")
+            except:
+                function_args = {}
+            calls.append((tool_call["name"],
+                          lambda name=tool_call["name"], args=function_args: self._run_tool(name, args)))
         
-        return '\n'.join(relevant_chunks)
-    
-    def generate_response(self, user_query, customer_email=None):
-        # Get relevant context from the SOP and order history
-        context = self.get_relevant_context(user_query, customer_email=customer_email)
+        metrics.record_tool_calls([tool_call["name"] for tool_call in tool_calls])
+        with metrics.span('tools'):
+            results = self.tool_executor.run_all(calls)
         
-        # Prepare conversation history for the prompt
-        history_context = ""
-        if self.conversation_history:
-            history_context = "\n\nRecent conversation:\n" + "\n".join(
-                [f"{msg['role']}: {msg['content']}" for msg in self.conversation_history[-2:]]
+        # Append the tool calls and their results to the conversation
+        self.conversation_history.append(
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": tool_call["id"],
+                        "type": "function",
+                        "function": {"name": tool_call["name"], "arguments": tool_call["arguments"] or "{}"}
+                    }
+                    for tool_call in tool_calls
+                ]
+            }
+        )
+        for tool_call, function_response in zip(tool_calls, results):
+            self.conversation_history.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "content": json.dumps(function_response)
+                }
             )
+    
+    def _tool_choice(self, tool_round):
+        """Let the model call tools until the round limit, then insist on an answer"""
+        return "auto" if tool_round < self.max_tool_rounds else "none"
+    
+    def _finish_turn(self, user_query, ai_response):
+        """Record the final exchange and trim the history"""
+        self.conversation_history.append({"role": "user", "content": user_query})
+        self.conversation_history.append({"role": "assistant", "content": ai_response})
         
-        # Create prompt with context and conversation history
-        prompt = f"""As a customer support AI, use the following context from our support SOP and the conversation history to answer the user's question.
-        If the context doesn't contain relevant information, provide a general helpful response.
+        # Drop this turn's tool results and roll turns beyond max_history into the summary
+        self.conversation_history, self.state.summary = self.prompt_builder.compact(
+            self.conversation_history, self.state.summary, self.max_history)
+    
+    def _complete(self, messages, tool_choice, tool_calls):
+        """One blocking completion round: yield its text and collect the tools it calls"""
+        with metrics.span('llm'):
+            response = self.llm.chat_completion(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                tools=self.tools,
+                tool_choice=tool_choice
+            )
+        metrics.record_llm_call(response.usage)
         
-        Context from SOP:
-        {context}
-        {history_context}
+        message = response.choices[0].message
+        tool_calls.extend(
+            {"id": tool_call.id, "name": tool_call.function.name, "arguments": tool_call.function.arguments}
+            for tool_call in message.tool_calls or []
+        )
+        if message.content:
+            yield message.content
+    
+    def _stream_completion(self, messages, tool_choice, tool_calls):
+        """One streamed completion round: yield text deltas and assemble the tools it calls"""
+        stream = self.llm.stream_chat_completion(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            tools=self.tools,
+            tool_choice=tool_choice,
+            stream_options={"include_usage": True}
+        )
+        metrics.record_llm_call()
         
-        User Question: {user_query}
+        calls = {}  # index -> {"id": ..., "name": ..., "arguments": ...}
+        # Includes handing each delta to the client, which is cheap next to generation
+        with metrics.span('llm'):
+            for chunk in stream:
+                if not chunk.choices:
+                    # The usage-only chunk at the end of the stream
+                    metrics.record_usage(getattr(chunk, 'usage', None))
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield delta.content
+                for tool_delta in delta.tool_calls or []:
+                    call = calls.setdefault(tool_delta.index, {"id": "", "name": "", "arguments": ""})
+                    if tool_delta.id:
+                        call["id"] = tool_delta.id
+                    if tool_delta.function and tool_delta.function.name:
+                        call["name"] += tool_delta.function.name
+                    if tool_delta.function and tool_delta.function.arguments:
+                        call["arguments"] += tool_delta.function.arguments
+        tool_calls.extend(calls[index] for index in sorted(calls))
+    
+    def _completion_rounds(self, user_query, passages, complete):
+        """Yield the answer text of a turn's completion rounds; return (answer, whether tools ran).
         
-        Please provide a helpful, professional response that maintains conversation continuity:"""
+        complete(messages, tool_choice, tool_calls) is one round (_complete or
+        _stream_completion). The model gets max_tool_rounds rounds of tool calls and one
+        more to answer; if it still asks for tools, the turn ends with TOOL_LIMIT_MESSAGE.
+        """
+        for tool_round in range(self.max_tool_rounds + 1):
+            content_parts, tool_calls = [], []
+            for text in complete(self._completion_messages(user_query, passages),
+                                 self._tool_choice(tool_round), tool_calls):
+                content_parts.append(text)
+                yield text
+            if not tool_calls:
+                return ''.join(content_parts), tool_round > 0
+            if tool_round < self.max_tool_rounds:
+                self._call_tools(tool_calls)
+        print(f"Model kept calling tools after {self.max_tool_rounds} rounds; giving up on the turn")
+        yield TOOL_LIMIT_MESSAGE
+        return TOOL_LIMIT_MESSAGE, True
+    
+    def generate_response(self, user_query, customer_email=None):
+        routed = self._route_locally(user_query)
+        if routed is not None:
+            self._finish_turn(user_query, routed)
+            return routed
+        passages, chunk_ids = self._retrieve(user_query, customer_email=customer_email)
+        cached, cacheable = self._cache_lookup(user_query, chunk_ids)
+        if cached is not None:
+            self._finish_turn(user_query, cached)
+            return cached
         
         # Generate response using OpenAI with function calling
+        rounds = self._completion_rounds(user_query, passages, self._complete)
         while True:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful customer support agent with access to the conversation history."}
-                ] + self.conversation_history + [
-                    {"role": "user", "content": prompt}
-                ],
-                tools=self.tools,
-                tool_choice="auto"
-            )
-            
-            message = response.choices[0].message
-            
-            # Check if OpenAI wants to call a function
-            if message.tool_calls:
-                tool_call = message.tool_calls[0]  # We only handle one tool call at a time
-                function_name = tool_call.function.name
-                try:
-                    function_args = json.loads(tool_call.function.arguments)
-                except:
-                    function_args = {}
-                
-                # Call the appropriate function
-                if function_name == "get_available_allowance":
-                    function_response = self.get_available_allowance()
-                elif function_name == "get_available_credits":
-                    function_response = self.get_available_credits()
-                elif function_name == "get_last_order_status":
-                    function_response = self.get_last_order_status()
-                elif function_name == "get_order_status":
-                    function_response = self.get_order_status(function_args.get("order_id"))
-                elif function_name == "escalate_to_support":
-                    function_response = self.escalate_to_support(function_args.get("issue"))
-                else:
-                    function_response = {"error": "Unknown function"}
-                
-                # Append function call and result to conversation
-                self.conversation_history.append(
-                    {
-                        "role": "assistant",
-                        "content": None,
-                        "function_call": {
-                            "name": function_name,
-                            "arguments": json.dumps(function_args)
-                        }
-                    }
-                )
-                self.conversation_history.append(
-                    {
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps(function_response)
-                    }
-                )
-                
-                # Continue conversation to get final response
-                continue
-            
-            # No function call, we have our final response
-            self.conversation_history.append({"role": "user", "content": user_query})
-            ai_response = message.content
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
-            break
-        
-        # Maintain history size
-        if len(self.conversation_history) > self.max_history * 2:  # *2 because each exchange has 2 messages
-            self.conversation_history = self.conversation_history[-self.max_history * 2:]
+            try:
+                next(rounds)
+            except StopIteration as done:
+                ai_response, used_tools = done.value
+                break
         
+        # Tool results are personal, so the answer can't be shared
+        if cacheable and not used_tools:
+            self._cache_store(user_query, chunk_ids, ai_response)
+        self._finish_turn(user_query, ai_response)
         return ai_response
+    
+    def stream_response(self, user_query, customer_email=None):
+        """Like generate_response, but yield the answer text as completion deltas arrive.
+        
+        Tool calls are assembled from the streamed deltas, executed, and the follow-up
+        completion is streamed in turn; the history is updated once the answer is complete.
+        """
+        routed = self._route_locally(user_query)
+        if routed is not None:
+            yield routed
+            self._finish_turn(user_query, routed)
+            return
+        passages, chunk_ids = self._retrieve(user_query, customer_email=customer_email)
+        cached, cacheable = self._cache_lookup(user_query, chunk_ids)
+        if cached is not None:
+            yield cached
+            self._finish_turn(user_query, cached)
+            return
+        
+        ai_response, used_tools = yield from self._completion_rounds(user_query, passages,
+                                                                      self._stream_completion)
+        
+        if cacheable and not used_tools:
+            self._cache_store(user_query, chunk_ids, ai_response)
+        self._finish_turn(user_query, ai_response)
@@ -0,0 +1,174 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Questions that mention the customer, an order number or contact details get
+# personal answers (balances, order status) and must never be served from cache
+PERSONAL_PATTERNS = [
+    r"\b(?:my|me|mine|i|i'm|i've|we|our)\b",
+    r'\d',
+    r'@',
+]
+
+
+def normalize_query(query):
+    """Lower-case, strip punctuation and collapse whitespace"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', query.lower()).split())
+
+
+def is_cacheable_query(query):
+    """True for generic policy questions that don't depend on who is asking"""
+    lowered = query.lower()
+    return not any(re.search(pattern, lowered) for pattern in PERSONAL_PATTERNS)
+
+
+class ResponseCache:
+    """Answer cache for repeated SOP questions.
+
+    Entries are keyed on the SOP fingerprint, the normalised question and the ids of
+    the retrieved chunks, so an answer is only reused when it was generated from the
+    same context. Questions that are worded differently can still hit through a cosine
+    match on their TF-IDF vectors, restricted to entries with the same retrieved chunks.
+    The whole cache is dropped when the SOP file changes on disk.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, similarity_threshold=0.9,
+                 source_path=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.source_path = source_path
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (response, query_vector, created_at)
+        self._by_context = {}  # (fingerprint, chunk ids) -> set of keys
+        self._source_stamp = self._stat_source()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _stat_source(self):
+        if not self.source_path:
+            return None
+        try:
+            stat = os.stat(self.source_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _check_source(self):
+        """Drop everything if the SOP file changed since the entries were cached"""
+        stamp = self._stat_source()
+        if stamp != self._source_stamp:
+            self._entries.clear()
+            self._by_context.clear()
+            self._source_stamp = stamp
+            self.invalidations += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        context = key[0], key[2]
+        keys = self._by_context.get(context)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[context]
+
+    def _is_expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, fingerprint, query, chunk_ids, query_vector=None):
+        """Return a cached answer for the question and retrieved chunks, or None"""
+        key = (fingerprint, normalize_query(query), tuple(chunk_ids))
+        with self._lock:
+            self._check_source()
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._is_expired(entry[2], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+
+            if query_vector is not None and self.similarity_threshold:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in self._by_context.get((key[0], key[2]), ()):
+                    response, vector, created_at = self._entries[candidate]
+                    if vector is None or self._is_expired(created_at, now):
+                        continue
+                    # TF-IDF rows are L2-normalised, so the dot product is the cosine
+                    score = query_vector.multiply(vector).sum()
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.near_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint, query, chunk_ids, response, query_vector=None):
+        key = (fingerprint, normalize_query(query), tuple(chunk_ids))
+        with self._lock:
+            self._check_source()
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, query_vector, self._clock())
+            self._by_context.setdefault((key[0], key[2]), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(source_path):
+    """Return the process-wide ResponseCache, or None when RESPONSE_CACHE_ENABLED=0.
+
+    Tunables come from the environment: RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS and RESPONSE_CACHE_SIMILARITY (0 disables near matches).
+    """
+    global _cache
+    if os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '0':
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000)),
+                    ttl_seconds=int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 3600)),
+                    similarity_threshold=float(os.environ.get('RESPONSE_CACHE_SIMILARITY', 0.9)),
+                    source_path=source_path
+                )
+    return _cache
@@ -0,0 +1,285 @@
+import bisect
+import os
+import pickle
+import re
+import threading
+
+import faiss
+
+from corpus import corpus_from_texts, open_corpus
+from dense_index import DenseEncoder, DenseRetriever, dense_available, open_dense_index, reciprocal_rank_fusion
+from index_builder import (RESOURCES_DIR, build_index, current_build_dir, load_incompatibility,
+                           read_manifest, sha256_text)
+from ingestion import source_name
+import metrics
+from sparse_index import SparseRetriever, open_postings
+
+# Candidates taken from each retriever before rank fusion
+FUSION_CANDIDATES = 20
+
+
+def _legacy_chunks(content, chunk_size=200):
+    """Chunks as the unversioned resources were built: per '#'/'##' section, no overlap"""
+    chunks = []
+    for section in re.split(r'\n##? ', content):
+        current_chunk = []
+        current_length = 0
+        for word in section.split():
+            current_chunk.append(word)
+            current_length += len(word) + 1
+            if current_length >= chunk_size:
+                chunks.append(' '.join(current_chunk))
+                current_chunk = []
+                current_length = 0
+        if current_chunk:
+            chunks.append(' '.join(current_chunk))
+    return chunks
+
+
+class RetrievalIndex:
+    """Immutable knowledge-base retrieval corpus: chunk texts, TF-IDF vectorizer and inverted index.
+
+    Loaded once per worker process and shared by every chat session. The index is
+    built offline by index_builder.py; workers only map the published build, so its
+    chunks and postings live in the OS page cache rather than in each process.
+    `scoring` picks the weighting of the sparse index, 'cosine' (TF-IDF) or 'bm25'. When
+    the build has a dense index and `dense` is set, results of both are fused (see
+    dense_index.py); nprobe / ef_search tune its IVF / HNSW recall against latency.
+    """
+
+    def __init__(self, sop_file_path, resources_dir=RESOURCES_DIR, scoring='cosine', dense=True,
+                 nprobe=16, ef_search=64):
+        self.sop_file_path = sop_file_path
+        self.resources_dir = resources_dir
+        self.scoring = scoring
+        self.use_dense = dense
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.retriever = None
+        self.dense = None
+        self._warm = {}  # (query, k) -> (chunk ids, scores), see warm()
+        self.sop_content = self._load_sop_file(sop_file_path)
+        self.fingerprint = sha256_text(self.sop_content)
+        self.manifest = None
+        self.index = None  # only the legacy resources search through a FAISS index
+
+        build_dir = current_build_dir(resources_dir)
+        if build_dir and self._load_build(build_dir):
+            self.fingerprint = self.manifest['corpus_sha256']
+            indexed = {source['path']: source['sha256'] for source in self.manifest['sources']}
+            indexed_hash = indexed.get(source_name(sop_file_path))
+            if indexed_hash is None:
+                print(f"Warning: {sop_file_path} is not part of the published index")
+            elif indexed_hash != sha256_text(self.sop_content):
+                print(f"Warning: {sop_file_path} changed since the index was built; "
+                      f"run `python index_builder.py` to refresh it")
+        elif self._resources_exist() and self._load_resources() and not self._legacy_is_stale():
+            print("Warning: using an unversioned index; run `python index_builder.py` to build one")
+        else:
+            # Nothing usable on disk: build in memory so the worker can still serve
+            print("Warning: no usable index found, building one in memory; "
+                  "run `python index_builder.py` to publish one")
+            build, _ = build_index([sop_file_path])
+            try:
+                self.chunks = corpus_from_texts(record['text'] for record in build.iter_chunks())
+                self.vectorizer = build.vectorizer
+                self.retriever = SparseRetriever(build.vectorizer, build.postings, scoring)
+                self._set_manifest(build.manifest)
+            finally:
+                build.cleanup()
+
+    def _load_sop_file(self, file_path):
+        with open(file_path, 'r') as file:
+            return file.read()
+
+    def _set_manifest(self, manifest):
+        self.manifest = manifest
+        # Chunk ranges of every section, to cite the document and heading of a chunk
+        self._section_starts = [section['chunk_start'] for section in manifest['sections']]
+
+    def _load_build(self, build_dir):
+        """Map a published build, unless it was made with incompatible library versions"""
+        try:
+            manifest = read_manifest(build_dir)
+            problem = load_incompatibility(manifest)
+            if problem:
+                print(f"Not loading index {build_dir}: {problem}")
+                return False
+            with open(os.path.join(build_dir, 'vectorizer.pkl'), 'rb') as f:
+                self.vectorizer = pickle.load(f)
+            self.chunks = open_corpus(build_dir)
+            self.retriever = SparseRetriever(self.vectorizer, open_postings(build_dir, manifest['chunk_count']),
+                                             self.scoring)
+            self._set_manifest(manifest)
+            if self.use_dense and 'dense' in manifest:
+                self._load_dense(build_dir, manifest['dense'])
+            return True
+        except Exception as e:
+            print(f"Error loading index build {build_dir}: {str(e)}")
+            return False
+
+    def _load_dense(self, build_dir, dense_manifest):
+        """Add the build's dense index; without it (or its model) retrieval stays lexical"""
+        if not dense_available():
+            print("Warning: the index has dense embeddings but sentence-transformers isn't installed; "
+                  "using lexical retrieval only")
+            return
+        try:
+            self.dense = DenseRetriever(DenseEncoder(dense_manifest['model']), open_dense_index(build_dir),
+                                        nprobe=self.nprobe, ef_search=self.ef_search)
+        except Exception as e:
+            print(f"Error loading dense index {build_dir}: {str(e)}")
+
+    def _resources_exist(self):
+        """Check if the legacy, unversioned resources exist"""
+        return all(os.path.exists(os.path.join(self.resources_dir, name))
+                   for name in ('vectorizer.pkl', 'chunks.pkl', 'faiss_index.bin'))
+
+    def _legacy_is_stale(self):
+        """The legacy files carry no manifest, so compare their chunks with the SOP itself"""
+        return _legacy_chunks(self.sop_content) != self.chunks
+
+    def _load_resources(self):
+        """Load the legacy vectorizer, chunks, and FAISS index"""
+        try:
+            # Load the vectorizer
+            with open(os.path.join(self.resources_dir, 'vectorizer.pkl'), 'rb') as f:
+                self.vectorizer = pickle.load(f)
+
+            # Load the chunks
+            with open(os.path.join(self.resources_dir, 'chunks.pkl'), 'rb') as f:
+                self.chunks = pickle.load(f)
+
+            # Load the FAISS index; searches run on it directly
+            self.index = faiss.read_index(os.path.join(self.resources_dir, 'faiss_index.bin'))
+            return True
+        except Exception as e:
+            print(f"Error loading resources: {str(e)}")
+            return False
+
+    def embed(self, query):
+        """TF-IDF vector for a query (sparse, L2-normalised)"""
+        return self.vectorizer.transform([query])
+
+    def _search(self, queries, k):
+        if self.dense is not None:
+            # Rank fusion needs more than k candidates from each side
+            candidates = max(k, FUSION_CANDIDATES)
+            with metrics.span('retrieval_lexical'):
+                lexical = self.retriever.search(queries, candidates)
+            with metrics.span('retrieval_dense'):
+                dense = self.dense.search(queries, candidates)
+            return [reciprocal_rank_fusion([lexical_ids, dense_ids], k)
+                    for (lexical_ids, _), (dense_ids, _) in zip(lexical, dense)]
+        if self.retriever is not None:
+            with metrics.span('retrieval_lexical'):
+                return self.retriever.search(queries, k)
+
+        # Legacy resources: dense L2 search; on unit-length TF-IDF vectors cosine = 1 - d/2
+        query_vectors = self.vectorizer.transform(queries).toarray().astype('float32')
+        distances, indices = self.index.search(query_vectors, k)
+        results = []
+        for row_distances, row_ids in zip(distances, indices):
+            ids = [int(i) for i in row_ids if i >= 0]
+            results.append((ids, [1 - float(d) / 2 for d in row_distances[:len(ids)]]))
+        return results
+
+    def is_warm(self, query, k=3):
+        """True when warm() precomputed this query, so searching it costs a dict lookup"""
+        return (_warm_key(query), k) in self._warm
+
+    def search_batch(self, queries, k=3):
+        """Return (chunk ids, scores) for each query, best first; all misses are searched in one call"""
+        queries = list(queries)
+        warm = self._warm
+        results = [warm.get((_warm_key(query), k)) for query in queries]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            for i, result in zip(pending, self._search([queries[i] for i in pending], k)):
+                results[i] = result
+        return results
+
+    def search_ids(self, query, k=3):
+        """Return (chunk ids, scores) of the k chunks that best match the query text, best first"""
+        return self.search_batch([query], k)[0]
+
+    def retrieve_batch(self, queries, k=3):
+        """Retrieve for many queries at once: a list of {'id', 'score', 'text', 'citation'} per query.
+
+        Only reads the immutable index, so it is safe to call from evaluation scripts and
+        warmers as well as from chat sessions.
+        """
+        return [
+            [{'id': chunk_id, 'score': score, 'text': self.chunks[chunk_id], 'citation': self.citation(chunk_id)}
+             for chunk_id, score in zip(ids, scores)]
+            for ids, scores in self.search_batch(queries, k)
+        ]
+
+    def warm(self, queries, k=3):
+        """Precompute results for frequent queries (e.g. FAQs) so they skip the search"""
+        queries = [query for query in dict.fromkeys(queries) if query]
+        if not queries:
+            return 0
+        warm = dict(self._warm)
+        warm.update(((_warm_key(query), k), result) for query, result in zip(queries, self._search(queries, k)))
+        # Swap in a new dict so concurrent readers never see it half-built
+        self._warm = warm
+        return len(queries)
+
+    def citation(self, chunk_id):
+        """Where a chunk comes from, e.g. 'support_sop.txt > Refund Processing'"""
+        if self.manifest is None:
+            return os.path.basename(self.sop_file_path)
+        section = self.manifest['sections'][bisect.bisect_right(self._section_starts, chunk_id) - 1]
+        source, section = section['source'], section['heading']
+        if not section:
+            return os.path.basename(source)
+        # Only the innermost heading of the section path
+        return f"{os.path.basename(source)} > {section.rsplit(' > ', 1)[-1]}"
+
+    def search(self, query, k=3):
+        """Return the k chunks closest to the query text"""
+        ids, _ = self.search_ids(query, k)
+        return [self.chunks[i] for i in ids]
+
+
+def _warm_key(query):
+    # Case and spacing don't change what a warmed FAQ retrieves
+    return ' '.join(query.lower().split())
+
+
+def read_query_file(path):
+    """Queries listed one per line (blank lines and # comments skipped); [] if the file is missing"""
+    try:
+        with open(path, 'r') as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    except OSError:
+        return []
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_retrieval_index(sop_file_path):
+    """Return the process-wide RetrievalIndex for an SOP file, loading it on first use.
+
+    RETRIEVAL_SCORING selects the weighting of the sparse index: 'cosine' or 'bm25'.
+    RETRIEVAL_DENSE=0 ignores a build's dense index; RETRIEVAL_NPROBE and
+    RETRIEVAL_EF_SEARCH tune it.
+    """
+    key = os.path.abspath(sop_file_path)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = RetrievalIndex(
+                    sop_file_path,
+                    scoring=os.environ.get('RETRIEVAL_SCORING', 'cosine'),
+                    dense=os.environ.get('RETRIEVAL_DENSE', '1') != '0',
+                    nprobe=int(os.environ.get('RETRIEVAL_NPROBE', 16)),
+                    ef_search=int(os.environ.get('RETRIEVAL_EF_SEARCH', 64))
+                )
+                _indexes[key] = index
+    return index
@@ -0,0 +1,285 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class ConversationState:
+    """Per-session chat state: history plus the cancellation flow"""
+
+    def __init__(self):
+        self.conversation_history = []
+        self.cancellation_state = None
+        self.pending_order_id = None
+        self.current_order_context = None
+        self.summary = None  # earlier turns, rolled out of the history
+
+    def to_dict(self):
+        return {
+            'history': self.conversation_history,
+            'cancellation_state': self.cancellation_state,
+            'pending_order_id': self.pending_order_id,
+            'order_context': self.current_order_context,
+            'summary': self.summary
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.conversation_history = data.get('history') or []
+        state.cancellation_state = data.get('cancellation_state')
+        state.pending_order_id = data.get('pending_order_id')
+        state.current_order_context = data.get('order_context')
+        state.summary = data.get('summary')
+        return state
+
+    def serialize(self):
+        """Compact, compressed encoding for external backends"""
+        payload = json.dumps(self.to_dict(), separators=(',', ':'))
+        return zlib.compress(payload.encode('utf-8'))
+
+    @classmethod
+    def deserialize(cls, blob):
+        return cls.from_dict(json.loads(zlib.decompress(blob).decode('utf-8')))
+
+
+class SessionStore:
+    """Interface for conversation-state backends keyed by the Flask session_id.
+
+    Callers load the state with get_or_create() at the start of a chat turn and
+    write it back with put() once the turn is done, so any worker can serve the
+    next turn when the backend is shared.
+    """
+
+    def get(self, session_id):
+        """Return the state for a session, or None if it is unknown or expired"""
+        raise NotImplementedError
+
+    def put(self, session_id, state):
+        """Store the state for a session"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def get_or_create(self, session_id):
+        """Return the state for a session, or a fresh one on a miss"""
+        state = self.get(session_id)
+        if state is None:
+            state = ConversationState()
+        return state
+
+
+class InMemorySessionStore(SessionStore):
+    """Bounded in-process store with idle TTL and LRU eviction.
+
+    Entries are kept in least-recently-used order, so expired entries are always
+    found at the front and can be purged without scanning the whole store.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=1800, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # session_id -> (state, last_access)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_expired(self, last_access, now):
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _purge_expired(self, now):
+        while self._entries:
+            session_id, (state, last_access) = next(iter(self._entries.items()))
+            if not self._is_expired(last_access, now):
+                break
+            del self._entries[session_id]
+            self.expirations += 1
+
+    def get(self, session_id):
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(session_id)
+            if entry is None or self._is_expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[session_id]
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries[session_id] = (entry[0], now)
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, session_id, state):
+        with self._lock:
+            now = self._clock()
+            self._entries[session_id] = (state, now)
+            self._entries.move_to_end(session_id)
+            self._purge_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Conversation state in a SQLite file shared by every worker on the host.
+
+    Idle TTL is enforced on read; the LRU size limit is enforced by a periodic
+    prune so that a normal turn costs a single upsert.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, db_path, max_entries=100000, ttl_seconds=1800, clock=time.time):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_sessions ('
+                'session_id TEXT PRIMARY KEY, '
+                'state BLOB NOT NULL, '
+                'updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated_at '
+                'ON chat_sessions (updated_at)'
+            )
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, session_id):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT state, updated_at FROM chat_sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        if self.ttl_seconds is not None and self._clock() - row[1] > self.ttl_seconds:
+            with conn:
+                conn.execute('DELETE FROM chat_sessions WHERE session_id = ?', (session_id,))
+            self._count('expirations')
+            self._count('misses')
+            return None
+        self._count('hits')
+        return ConversationState.deserialize(row[0])
+
+    def put(self, session_id, state):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO chat_sessions (session_id, state, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, '
+                'updated_at = excluded.updated_at',
+                (session_id, state.serialize(), self._clock())
+            )
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired sessions and the least recently used ones above max_entries"""
+        conn = self._connection()
+        with conn:
+            if self.ttl_seconds is not None:
+                cursor = conn.execute(
+                    'DELETE FROM chat_sessions WHERE updated_at < ?',
+                    (self._clock() - self.ttl_seconds,)
+                )
+                with self._lock:
+                    self.expirations += cursor.rowcount
+            cursor = conn.execute(
+                'DELETE FROM chat_sessions WHERE session_id IN ('
+                'SELECT session_id FROM chat_sessions ORDER BY updated_at DESC '
+                'LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            with self._lock:
+                self.evictions += cursor.rowcount
+
+    def delete(self, session_id):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM chat_sessions WHERE session_id = ?', (session_id,))
+
+    def stats(self):
+        entries = self._connection().execute('SELECT COUNT(*) FROM chat_sessions').fetchone()[0]
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+def create_session_store(backend='memory', max_entries=10000, ttl_seconds=1800, db_path=None):
+    """Build the conversation-state backend named in the app config"""
+    if backend == 'memory':
+        return InMemorySessionStore(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == 'sqlite':
+        if not db_path:
+            raise ValueError("db_path is required for the sqlite session backend")
+        return SQLiteSessionStore(db_path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown chat session backend: {backend}")
@@ -0,0 +1,117 @@
+"""Sparse inverted index for lexical retrieval.
+
+The corpus is stored term-major: for every vocabulary term, the ids of the chunks that
+contain it and a weight per chunk (a CSR matrix of shape terms x chunks). A query only
+touches the posting lists of its own terms, so search cost grows with the number of
+matching postings rather than with the size of the corpus, and nothing is ever turned
+into a dense vector. Two weightings share the same postings:
+
+    cosine  L2-normalised TF-IDF, scored against the TF-IDF query vector
+    bm25    Okapi BM25 term weights, scored against the query's term counts
+
+A build directory holds postings_indptr.npy, postings_chunks.npy, postings_counts.npy,
+postings_cosine.npy and postings_bm25.npy, all opened read-only with mmap.
+"""
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+
+SCORINGS = ('cosine', 'bm25')
+BM25_K1 = 1.5
+BM25_B = 0.75
+POSTINGS_FILES = ('indptr', 'chunks', 'counts', 'cosine', 'bm25')
+
+
+def term_counts(vectorizer, texts):
+    """Raw term counts (chunks x terms) over a fitted TfidfVectorizer's vocabulary"""
+    # TfidfVectorizer is a CountVectorizer; its base transform skips the idf weighting
+    return CountVectorizer.transform(vectorizer, texts)
+
+
+def postings_from_counts(counts, idf):
+    """Posting arrays (term-major CSR) for a chunks x terms count matrix and the vectorizer idf"""
+    counts = sp.csr_matrix(counts, dtype='float32')
+    counts.sum_duplicates()
+    n_chunks = counts.shape[0]
+
+    # TF-IDF exactly as TfidfVectorizer.transform computes it: tf * idf, L2-normalised rows
+    tfidf = counts.multiply(np.asarray(idf, dtype='float32')).tocsr()
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    tfidf = sp.diags(1 / np.where(norms > 0, norms, 1)).dot(tfidf).tocsr()
+
+    # BM25 with idf from the current corpus (the vectorizer's idf may predate it)
+    lengths = np.asarray(counts.sum(axis=1)).ravel()
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    bm25_idf = np.log1p((n_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+    bm25 = counts.copy()
+    row_lengths = np.repeat(lengths / (lengths.mean() or 1), np.diff(bm25.indptr))
+    bm25.data = (bm25.data * (BM25_K1 + 1) / (bm25.data + BM25_K1 * (1 - BM25_B + BM25_B * row_lengths))
+                 * bm25_idf[bm25.indices]).astype('float32')
+
+    # Transposing to term-major keeps all three matrices on the same sparsity pattern
+    counts_t, tfidf_t, bm25_t = (m.T.tocsr() for m in (counts, tfidf, bm25))
+    for m in (counts_t, tfidf_t, bm25_t):
+        m.sort_indices()
+    index_dtype = 'int32' if max(counts_t.nnz, n_chunks) < 2 ** 31 else 'int64'
+    return {
+        'indptr': counts_t.indptr.astype(index_dtype),
+        'chunks': counts_t.indices.astype(index_dtype),
+        'counts': counts_t.data.astype('float32'),
+        'cosine': tfidf_t.data.astype('float32'),
+        'bm25': bm25_t.data.astype('float32'),
+        'shape': counts_t.shape
+    }
+
+
+def write_postings(build_dir, postings):
+    for name in POSTINGS_FILES:
+        np.save(os.path.join(build_dir, f"postings_{name}.npy"), postings[name])
+
+
+def open_postings(build_dir, n_chunks):
+    """Map a build's posting arrays read-only"""
+    postings = {name: np.load(os.path.join(build_dir, f"postings_{name}.npy"), mmap_mode='r')
+                for name in POSTINGS_FILES}
+    postings['shape'] = (len(postings['indptr']) - 1, n_chunks)
+    return postings
+
+
+def chunk_counts(postings):
+    """The chunks x terms count matrix back from the postings (for incremental rebuilds)"""
+    return sp.csr_matrix((postings['counts'], postings['chunks'], postings['indptr']),
+                         shape=postings['shape']).T.tocsr()
+
+
+class SparseRetriever:
+    """Batched top-k search over the posting lists of one weighting"""
+
+    def __init__(self, vectorizer, postings, scoring='cosine'):
+        if scoring not in SCORINGS:
+            raise ValueError(f"Unknown scoring {scoring!r}; expected one of {', '.join(SCORINGS)}")
+        self.vectorizer = vectorizer
+        self.scoring = scoring
+        self.postings = sp.csr_matrix((postings[scoring], postings['chunks'], postings['indptr']),
+                                      shape=postings['shape'], copy=False)
+
+    def embed(self, queries):
+        """Sparse query matrix (queries x terms) for this weighting"""
+        if self.scoring == 'bm25':
+            return term_counts(self.vectorizer, queries)
+        return self.vectorizer.transform(queries)
+
+    def search(self, queries, k=3):
+        """Return one (chunk ids, scores) pair per query, best first"""
+        scores = (self.embed(queries).astype('float32') @ self.postings).tocsr()
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data, ids = scores.data[start:end], scores.indices[start:end]
+            if len(data) > k:
+                top = np.argpartition(-data, k - 1)[:k]
+                data, ids = data[top], ids[top]
+            # Highest score first; ties go to the earlier chunk
+            order = np.lexsort((ids, -data))
+            results.append(([int(i) for i in ids[order]], [float(s) for s in data[order]]))
+        return results
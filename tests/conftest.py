@@ -0,0 +1,43 @@
+import contextlib
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The app, imported once against a throwaway SQLite database.
+
+    app.py reads its configuration at import, so the environment is set first; the
+    development shop.db is never touched.
+    """
+    directory = tmp_path_factory.mktemp('app')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory / 'shop.db'}"
+    os.environ['CHAT_SESSION_DB_PATH'] = str(directory / 'chat_sessions.db')
+    # Nothing under test reaches the LLM, but the chat engine insists on a key
+    os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+    with contextlib.redirect_stdout(None):
+        import app
+    return app
+
+
+@pytest.fixture
+def seeded(app_module):
+    """The app with the /init_db employees, products and orders, freshly re-seeded"""
+    with contextlib.redirect_stdout(None):
+        app_module.app.test_client().get('/init_db')
+    return app_module
+
+
+@pytest.fixture(scope='session')
+def query_counter():
+    """Counts the SQL statements run inside `with query_counter:`, via before_cursor_execute"""
+    from benchmarks.query_counts import QueryCounter
+
+    counter = QueryCounter()
+    yield counter
+    counter.close()
@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def session(seeded):
+    from db import db
+
+    with seeded.app.app_context():
+        yield db.session
+        db.session.rollback()
+
+
+def _rows(count, prefix):
+    return [{'customer_email': 'john@techcorp.com', 'issue': f"{prefix} {number}"} for number in range(count)]
+
+
+def test_sqlite_ids_match_the_rows_across_batches(session):
+    from bulk import bulk_insert
+    from models import SupportTicket
+
+    rows = _rows(7, 'Bulk issue')
+    ids = bulk_insert(SupportTicket, rows, batch_size=3)
+    assert len(ids) == 7 and len(set(ids)) == 7
+    issues = dict(session.query(SupportTicket.id, SupportTicket.issue).filter(SupportTicket.id.in_(ids)))
+    assert [issues[ticket_id] for ticket_id in ids] == [row['issue'] for row in rows]
+    # Model defaults still apply
+    assert {ticket.status for ticket in SupportTicket.query.filter(SupportTicket.id.in_(ids))} == {'open'}
+
+
+def test_sqlite_ids_follow_a_deleted_last_row(session):
+    from bulk import bulk_insert
+    from models import SupportTicket
+
+    # Without AUTOINCREMENT, SQLite hands out the deleted row's id again
+    first = bulk_insert(SupportTicket, _rows(3, 'First'))
+    SupportTicket.query.filter_by(id=first[-1]).delete()
+    rows = _rows(2, 'Second')
+    ids = bulk_insert(SupportTicket, rows)
+    issues = dict(session.query(SupportTicket.id, SupportTicket.issue).filter(SupportTicket.id.in_(ids)))
+    assert [issues[ticket_id] for ticket_id in ids] == [row['issue'] for row in rows]
+
+
+def test_rows_must_share_their_keys(session):
+    from bulk import bulk_insert
+    from models import SupportTicket
+
+    rows = _rows(2, 'Mixed')
+    rows[1]['ticket_type'] = 'refund'
+    with pytest.raises(ValueError):
+        bulk_insert(SupportTicket, rows)
+    assert bulk_insert(SupportTicket, []) == []
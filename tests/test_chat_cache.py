@@ -0,0 +1,31 @@
+import pytest
+
+QUESTION = "What is the refund policy?"
+
+
+@pytest.fixture
+def engine(app_module):
+    engine = app_module.get_or_create_rag_engine('chat-cache-test')
+    engine.state.conversation_history = []
+    engine.state.summary = None
+    return engine
+
+
+def test_first_question_may_be_cached(engine):
+    _, chunk_ids = engine._retrieve(QUESTION)
+    _, cacheable = engine._cache_lookup(QUESTION, chunk_ids)
+    assert cacheable
+
+
+def test_follow_up_bypasses_the_cache(engine):
+    engine._cache_store(QUESTION, engine._retrieve(QUESTION)[1], "Refunds take 5 days.")
+    engine.state.conversation_history = [{'role': 'user', 'content': "I ordered the salad"},
+                                         {'role': 'assistant', 'content': "Noted."}]
+    cached, cacheable = engine._cache_lookup(QUESTION, engine._retrieve(QUESTION)[1])
+    assert cached is None and not cacheable
+
+
+def test_summarised_conversation_bypasses_the_cache(engine):
+    engine.state.summary = "The customer asked about a late pizza."
+    cached, cacheable = engine._cache_lookup(QUESTION, engine._retrieve(QUESTION)[1])
+    assert cached is None and not cacheable
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+import pytest
+
+from db import db
+from models import CheckoutRequest
+
+
+@pytest.fixture
+def client(seeded):
+    client = seeded.app.test_client()
+    client.post('/login', json={'email': 'john@techcorp.com', 'password': 'password123'})
+    return client
+
+
+def _checkout(client, key):
+    client.post('/api/cart/add', json={'product_id': 1, 'quantity': 1})
+    return client.post('/api/cart/place-order', headers={'Idempotency-Key': key})
+
+
+def test_same_key_replays_the_first_checkout(client):
+    first = _checkout(client, 'key-1')
+    again = client.post('/api/cart/place-order', headers={'Idempotency-Key': 'key-1'})
+    assert first.status_code == again.status_code == 200
+    assert again.headers.get('Idempotent-Replayed') == 'true'
+    assert again.get_json()['order_id'] == first.get_json()['order_id']
+
+
+def test_expired_keys_are_pruned_and_count_as_new(seeded, client):
+    first = _checkout(client, 'key-2')
+    _checkout(client, 'other-key')
+    with seeded.app.app_context():
+        for record in CheckoutRequest.query.all():
+            record.created_at -= timedelta(hours=seeded.app.config['CHECKOUT_KEY_TTL_HOURS'] + 1)
+        db.session.commit()
+
+    again = _checkout(client, 'key-2')
+    assert again.status_code == 200
+    assert 'Idempotent-Replayed' not in again.headers
+    assert again.get_json()['order_id'] != first.get_json()['order_id']
+    with seeded.app.app_context():
+        assert [record.idempotency_key for record in CheckoutRequest.query.all()] == ['key-2']
@@ -0,0 +1,58 @@
+import pytest
+
+from index_builder import build_index, load_build, publish_build
+
+SECTIONS = [
+    ('Delivery', 'Orders are delivered to the office reception before noon.'),
+    ('Refunds', 'Refunds are issued for late or missing orders within five business days.'),
+    ('Allowance', 'Each employee has a daily meal allowance that resets every morning.'),
+    ('Credits', 'Credits from cancelled orders are added to the employee balance.'),
+    ('Escalation', 'Customers who ask for a person are handed to the support team.'),
+]
+
+
+def write_corpus(path, sections):
+    path.write_text(''.join(f"## {heading}\n{text}\n\n" for heading, text in sections), encoding='utf-8')
+
+
+@pytest.fixture
+def published(tmp_path):
+    """Path of a one-document corpus and its published build, reopened for reuse"""
+    document = tmp_path / 'sop.md'
+    write_corpus(document, SECTIONS)
+    build, _ = build_index([str(document)])
+    try:
+        build_dir = publish_build(build, str(tmp_path / 'resources'))
+    finally:
+        build.cleanup()
+    return document, load_build(build_dir)
+
+
+def rebuild(document, previous, sections):
+    write_corpus(document, sections)
+    build, report = build_index([str(document)], previous=previous)
+    build.cleanup()
+    return build, report
+
+
+def test_edit_with_known_terms_stays_incremental(published):
+    document, previous = published
+    sections = list(SECTIONS)
+    sections[0] = ('Delivery', 'Orders are delivered to the office reception.')
+    _, report = rebuild(document, previous, sections)
+    assert report['mode'] == 'incremental'
+    assert report['new_terms'] == 0
+    assert report['rechunked_chunks'] == 1
+    assert report['reused_chunks'] == report['chunks'] - 1
+
+
+def test_edit_with_new_terms_refits_vocabulary(published):
+    document, previous = published
+    assert 'reimbursement' not in previous.vectorizer.vocabulary_
+    sections = list(SECTIONS)
+    sections[1] = ('Refunds', 'Refunds and travel reimbursement are issued within five business days.')
+    build, report = rebuild(document, previous, sections)
+    assert report['mode'] == 'full'
+    assert report['new_terms'] == 2
+    assert 'new terms' in report['reason']
+    assert {'reimbursement', 'travel'} <= set(build.vectorizer.vocabulary_)
@@ -0,0 +1,52 @@
+import pytest
+
+from intent_router import OTHER, IntentRouter
+
+
+@pytest.fixture(scope='module')
+def router():
+    return IntentRouter()
+
+
+@pytest.mark.parametrize('query, tool', [
+    ("What's my allowance?", 'get_available_allowance'),
+    ("what is my meal allowance", 'get_available_allowance'),
+    ("how much allowance do I have left", 'get_available_allowance'),
+    ("show my remaining allowance", 'get_available_allowance'),
+    ("how many credits do I have", 'get_available_credits'),
+    ("What is my credit balance?", 'get_available_credits'),
+    ("check my credits", 'get_available_credits'),
+    ("where is my order", 'get_last_order_status'),
+    ("track my order", 'get_last_order_status'),
+])
+def test_lookups_are_routed(router, query, tool):
+    assert router.route(query) == (tool, {})
+
+
+def test_order_number_is_routed(router):
+    assert router.route("status of order 42", {'order_id': '42'}) == ('get_order_status', {'order_id': '42'})
+
+
+@pytest.mark.parametrize('query', [
+    "I want to change my credit card on file",
+    "what is my credit card number",
+    "can I transfer my credits to a colleague",
+    "Is my allowance taxable?",
+    "how much allowance does a new employee get",
+    "what happens to my allowance at the end of the month",
+    "how does meal allowance work",
+    "I want to cancel order 42",
+])
+def test_questions_beyond_a_lookup_go_to_the_llm(router, query):
+    assert router.route(query) is None
+
+
+@pytest.mark.parametrize('query', [
+    "what is my credit balance and allowance please tell me",
+    "what is my allowance and credit balance",
+    "how much allowance do I have? also where is my order",
+    "what is my allowance and when is it topped up",
+])
+def test_several_requests_go_to_the_llm(router, query):
+    assert router.classify(query) == (OTHER, 1.0)
+    assert router.route(query) is None
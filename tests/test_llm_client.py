@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+from llm_client import LLMClient, LLMUnavailableError, RetryBudget
+from mock_openai_server import MockConfig, start_mock_server
+
+MESSAGES = [{'role': 'user', 'content': 'What is the refund policy?'}]
+
+
+@pytest.fixture
+def mock():
+    servers = []
+
+    def start(**settings):
+        config = MockConfig(**settings)
+        server, url = start_mock_server(config=config)
+        servers.append(server)
+        return config, url
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def _client(url, **settings):
+    settings.setdefault('backoff_base', 0.01)
+    return LLMClient('test-key', base_url=url, **settings)
+
+
+def test_retries_up_to_max_retries(mock):
+    config, url = mock(error_rate=1.0, error_status=429)
+    client = _client(url, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        client.chat_completion(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert config.requests == 3
+    assert client.stats()['retries'] == 2
+
+
+def test_retry_budget_is_shared_between_calls(mock):
+    config, url = mock(error_rate=1.0, error_status=503)
+    client = _client(url, max_retries=3, retry_budget=RetryBudget(ratio=0.0, reserve=1))
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            client.chat_completion(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert client.stats()['retries'] == 1
+    assert config.requests == 3
+
+
+def test_deadline_cuts_a_slow_call_short(mock):
+    _, url = mock(latency=2.0)
+    client = _client(url, timeout=0.3)
+    started = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        client.chat_completion(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert time.monotonic() - started < 1.5
+
+
+def test_concurrency_cap(mock):
+    _, url = mock(latency=0.2)
+    client = _client(url, max_concurrency=2)
+    threads = [threading.Thread(target=client.chat_completion,
+                                kwargs={'model': 'gpt-3.5-turbo', 'messages': MESSAGES}) for _ in range(4)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Two rounds of two calls
+    assert time.monotonic() - started >= 0.4
+
+
+def test_async_calls_share_the_cap(mock):
+    _, url = mock(latency=0.5)
+    client = _client(url, max_concurrency=1)
+    holder = threading.Thread(target=client.chat_completion,
+                              kwargs={'model': 'gpt-3.5-turbo', 'messages': MESSAGES})
+    holder.start()
+    time.sleep(0.1)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(client.achat_completion(timeout=0.2, model='gpt-3.5-turbo', messages=MESSAGES))
+    holder.join()
+
+
+def test_async_client_works_on_every_event_loop(mock):
+    _, url = mock()
+    client = _client(url)
+    for _ in range(2):
+        response = asyncio.run(client.achat_completion(model='gpt-3.5-turbo', messages=MESSAGES))
+        assert response.choices[0].message.content
@@ -0,0 +1,19 @@
+import contextlib
+
+from sqlalchemy import create_engine
+
+from db import db
+from migrations import create_missing_indexes, missing_indexes
+
+
+def test_missing_indexes_are_added_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    db.metadata.create_all(engine)
+    index = next(index for index in db.metadata.tables['order'].indexes if index.name == 'ix_order_employee_time')
+    index.drop(bind=engine)
+    assert [index.name for index in missing_indexes(engine)] == ['ix_order_employee_time']
+
+    with contextlib.redirect_stdout(None):
+        assert create_missing_indexes(engine) == ['ix_order_employee_time']
+        assert create_missing_indexes(engine) == []
+    assert missing_indexes(engine) == []
@@ -0,0 +1,42 @@
+from flask_login import login_user
+
+from models import Employee, Order
+
+
+def _order_of(email):
+    return Order.query.join(Employee, Order.employee_id == Employee.id)\
+        .filter(Employee.email == email).first().id
+
+
+def _routed_answer(app_module, email, question):
+    with app_module.app.test_request_context():
+        login_user(Employee.query.filter_by(email=email).first())
+        engine = app_module.get_or_create_rag_engine('order-lookup-test')
+        return engine._route_locally(question)
+
+
+def test_routed_lookup_finds_own_order(seeded):
+    with seeded.app.app_context():
+        order_id = _order_of('john@techcorp.com')
+    answer = _routed_answer(seeded, 'john@techcorp.com', f"status of order {order_id}")
+    assert answer.startswith(f"Order #{order_id} is currently")
+
+
+def test_routed_lookup_hides_other_employees_orders(seeded):
+    with seeded.app.app_context():
+        order_id = _order_of('jane@techcorp.com')
+    answer = _routed_answer(seeded, 'john@techcorp.com', f"status of order {order_id}")
+    assert answer == f"Order #{order_id} not found"
+
+
+def test_chat_tools_cannot_change_an_order(seeded):
+    with seeded.app.app_context():
+        order_id = _order_of('jane@techcorp.com')
+        status = Order.query.get(order_id).status
+    with seeded.app.test_request_context():
+        login_user(Employee.query.filter_by(email='john@techcorp.com').first())
+        engine = seeded.get_or_create_rag_engine('order-lookup-test')
+        result = engine._run_tool('create_support_ticket_for_cancellation', {'order_id': order_id, 'issue': 'late'})
+    assert result == {"error": "Unknown function"}
+    with seeded.app.app_context():
+        assert Order.query.get(order_id).status == status
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import PaginationError, decode_cursor, encode_cursor
+
+EMAIL = 'john@techcorp.com'
+
+
+@pytest.fixture
+def client(seeded):
+    """Logged in as an employee whose orders all share one order_time"""
+    from db import db
+    from models import Employee, Order, Product
+
+    with seeded.app.app_context():
+        employee = Employee.query.filter_by(email=EMAIL).first()
+        product = Product.query.first()
+        Order.query.filter_by(employee_id=employee.id).delete()
+        tied = datetime(2024, 5, 1, 12, 0, 0)
+        db.session.add_all([Order(employee_id=employee.id, product_id=product.id, quantity=1, price=product.price,
+                                  customer_email=EMAIL, order_time=tied) for _ in range(7)])
+        db.session.commit()
+    client = seeded.app.test_client()
+    client.post('/login', json={'email': EMAIL, 'password': 'password123'})
+    return client
+
+
+def test_cursor_round_trips():
+    timestamp = datetime(2024, 5, 1, 12, 0, 0, 250000)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+
+@pytest.mark.parametrize('token', ['bad', encode_cursor(datetime(2024, 5, 1), 1)[:-3], 'WyJ4IiwgMV0'])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(PaginationError):
+        decode_cursor(token)
+
+
+def test_pages_split_tied_timestamps_by_id(client):
+    ids, cursor, pages = [], None, 0
+    while True:
+        response = client.get('/api/orders/history', query_string={'limit': 3, 'cursor': cursor or ''})
+        assert response.status_code == 200
+        ids += [order['id'] for order in response.get_json()]
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert pages == 3
+    assert len(ids) == 7 and ids == sorted(set(ids), reverse=True)
+
+
+def test_bad_cursor_is_a_400(client):
+    response = client.get('/api/orders/history?cursor=bad')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+    assert client.get('/api/support/tickets?cursor=bad').status_code == 400
@@ -0,0 +1,27 @@
+import json
+import os
+import time
+
+from profiling import RequestProfiler
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_written_profile_matches_its_samples(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1.0, interval_ms=1)
+    for _ in range(20):
+        capture = profiler.start()
+        busy(0.02)
+        # The sampler keeps running while the capture is written
+        path = profiler.finish(capture, status=200)
+        with open(path) as f:
+            report = json.load(f)
+        with open(os.path.join(str(tmp_path), report['profile'])) as f:
+            folded = sum(int(line.rsplit(' ', 1)[1]) for line in f)
+        assert report['samples'] == folded
+        assert report['samples'] > 0
+    assert profiler.stats()['captured'] == 20
@@ -0,0 +1,79 @@
+import pytest
+
+from prompt_builder import PromptBuilder, TokenCounter
+
+SYSTEM = "You are a support agent."
+
+
+def render(context):
+    return f"Context:\n{context}\n\nUser Question: Where is my lunch?"
+
+
+@pytest.fixture
+def counter():
+    # The estimate, so the counts don't depend on whether tiktoken is installed
+    counter = TokenCounter()
+    counter.encoding = None
+    return counter
+
+
+def exchanges(count):
+    history = []
+    for number in range(count):
+        history.append({'role': 'user', 'content': f"Question {number} about the lunch order"})
+        history.append({'role': 'assistant', 'content': f"Answer {number}: it is on its way"})
+    return history
+
+
+def test_prompt_stays_within_budget(counter):
+    builder = PromptBuilder(counter, budget=200, context_tokens=80, history_tokens=60)
+    passages = [(f"sop.txt > Section {number}", 'Refunds are issued within five days. ' * 4)
+                for number in range(10)]
+    messages = builder.build(SYSTEM, render, passages, exchanges(20))
+    assert sum(counter.count_message(m) for m in messages) <= 200
+    assert builder.stats()['over_budget'] == 0
+    assert builder.stats()['passages_dropped'] > 0
+
+
+def test_passages_keep_rank_order_and_drop_duplicates(counter):
+    builder = PromptBuilder(counter, budget=1000, context_tokens=60)
+    passages = [('a', 'Orders ship at noon.'), ('b', 'orders  SHIP at noon.'),
+                ('c', 'Refunds take five days.'), ('d', 'Credits never expire. ' * 20)]
+    context = builder.build(SYSTEM, render, passages, [])[-1]['content']
+    assert '[a] Orders ship at noon.\n[c] Refunds take five days.' in context
+    assert '[b]' not in context and '[d]' not in context
+
+
+def test_oversized_best_passage_is_truncated(counter):
+    builder = PromptBuilder(counter, budget=1000, context_tokens=20)
+    context = builder.build(SYSTEM, render, [('a', 'word ' * 100)], [])[-1]['content']
+    assert '[a] word' in context and context.count('word') < 20 and '...' in context
+
+
+def test_history_keeps_the_most_recent_exchanges(counter):
+    builder = PromptBuilder(counter, budget=1000, history_tokens=60)
+    messages = builder.build(SYSTEM, render, [], exchanges(10))
+    history = messages[1:-1]
+    assert history and len(history) < 20
+    assert history[-1]['content'] == "Answer 9: it is on its way"
+    assert sum(counter.count_message(m) for m in history) <= 60
+
+
+def test_tool_results_are_capped(counter):
+    builder = PromptBuilder(counter, budget=1000, tool_result_tokens=10)
+    history = exchanges(1) + [
+        {'role': 'assistant', 'content': None, 'tool_calls': [
+            {'id': 'call_1', 'type': 'function', 'function': {'name': 'get_order_status', 'arguments': '{}'}}]},
+        {'role': 'tool', 'tool_call_id': 'call_1', 'content': 'status ' * 50},
+    ]
+    messages = builder.build(SYSTEM, render, [], history)
+    tool_message = [m for m in messages if m['role'] == 'tool'][0]
+    assert counter.count(tool_message['content']) <= 10
+
+
+def test_compact_rolls_old_turns_into_the_summary(counter):
+    builder = PromptBuilder(counter, history_tokens=1000)
+    history, summary = builder.compact(exchanges(5), None, max_turns=2)
+    assert [m['content'] for m in history] == ["Question 3 about the lunch order", "Answer 3: it is on its way",
+                                               "Question 4 about the lunch order", "Answer 4: it is on its way"]
+    assert summary.count('\n') == 2 and summary.startswith('- Customer: Question 0')
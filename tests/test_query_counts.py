@@ -0,0 +1,24 @@
+import contextlib
+
+import pytest
+
+from benchmarks.query_counts import QUERY_BUDGETS, check, run
+
+SIZES = (1, 8)
+
+
+@pytest.fixture(scope='module')
+def counts(app_module, query_counter):
+    with contextlib.redirect_stdout(None):
+        results, _ = run(app_module, query_counter, SIZES)
+    return results
+
+
+@pytest.mark.parametrize('name', QUERY_BUDGETS)
+def test_selects_within_budget(counts, name):
+    for items in SIZES:
+        assert counts[items][name][0] <= QUERY_BUDGETS[name], f"{items} items"
+
+
+def test_selects_do_not_grow_with_rows(counts):
+    assert check(counts, SIZES) == []
@@ -0,0 +1,33 @@
+import pytest
+
+from retrieval import read_query_file
+
+FAQ = "What is your refund policy?"
+
+
+@pytest.fixture
+def engine(app_module, monkeypatch):
+    assert FAQ in read_query_file(app_module.app.config['RETRIEVAL_WARM_QUERIES_FILE'])
+    engine = app_module.get_or_create_rag_engine('retrieval-warm-test')
+    engine.state.conversation_history = []
+
+    def search(queries, k):
+        raise AssertionError(f"searched {queries} instead of using the warm results")
+    monkeypatch.setattr(engine.retrieval, '_search', search)
+    return engine
+
+
+def test_first_turn_hits_warm_results(engine):
+    _, chunk_ids = engine._retrieve(FAQ)
+    assert chunk_ids == engine.retrieval.search_ids(FAQ)[0]
+
+
+def test_second_turn_still_hits_warm_results(engine):
+    engine.state.conversation_history = [{'role': 'user', 'content': "Hello"},
+                                         {'role': 'assistant', 'content': "Hi, how can I help?"}]
+    _, chunk_ids = engine._retrieve(FAQ)
+    assert chunk_ids == engine.retrieval.search_ids(FAQ)[0]
+
+
+def test_warm_lookup_ignores_case_and_spacing(engine):
+    assert engine.retrieval.is_warm("what is your  refund policy?")
@@ -0,0 +1,85 @@
+import pytest
+
+from session_store import ConversationState, InMemorySessionStore, SQLiteSessionStore
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def state_with(message):
+    state = ConversationState()
+    state.conversation_history = [{'role': 'user', 'content': message}]
+    return state
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_memory_store_evicts_least_recently_used(clock):
+    store = InMemorySessionStore(max_entries=2, ttl_seconds=None, clock=clock)
+    store.put('a', state_with('a'))
+    store.put('b', state_with('b'))
+    assert store.get('a') is not None  # 'b' is now the least recently used
+    store.put('c', state_with('c'))
+    assert store.get('b') is None
+    assert store.get('a') is not None and store.get('c') is not None
+    assert store.stats()['evictions'] == 1
+
+
+def test_memory_store_expires_idle_sessions(clock):
+    store = InMemorySessionStore(ttl_seconds=60, clock=clock)
+    store.put('idle', state_with('idle'))
+    store.put('busy', state_with('busy'))
+    clock.now += 40
+    assert store.get('busy') is not None
+    clock.now += 40
+    assert store.get('idle') is None
+    assert store.get('busy') is not None
+    # Expired entries at the front are purged on the next put
+    store.put('new', state_with('new'))
+    assert len(store) == 2
+    assert store.stats()['expirations'] == 1
+
+
+def test_sqlite_store_round_trips_state(tmp_path, clock):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), clock=clock)
+    state = state_with('Where is order #12?')
+    state.cancellation_state = 'awaiting_reason'
+    state.pending_order_id = 12
+    state.summary = 'Asked about a late lunch.'
+    store.put('session', state)
+
+    # A second store on the same file stands in for another worker
+    loaded = SQLiteSessionStore(str(tmp_path / 'sessions.db'), clock=clock).get('session')
+    assert loaded.to_dict() == state.to_dict()
+    assert store.get_or_create('unknown').conversation_history == []
+
+
+def test_sqlite_store_expires_on_read(tmp_path, clock):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), ttl_seconds=60, clock=clock)
+    store.put('session', state_with('hello'))
+    clock.now += 61
+    assert store.get('session') is None
+    assert store.stats()['entries'] == 0
+
+
+def test_sqlite_prune_drops_expired_and_least_recent(tmp_path, clock):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), max_entries=2, ttl_seconds=60, clock=clock)
+    store.put('expired', state_with('expired'))
+    clock.now += 50
+    for session_id in ('oldest', 'middle', 'newest'):
+        clock.now += 1
+        store.put(session_id, state_with(session_id))
+    clock.now += 20
+    store.prune()
+    assert store.get('expired') is None and store.get('oldest') is None
+    assert store.get('middle') is not None and store.get('newest') is not None
+    stats = store.stats()
+    assert (stats['expirations'], stats['evictions'], stats['entries']) == (1, 1, 2)
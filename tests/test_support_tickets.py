@@ -0,0 +1,27 @@
+def _client(app_module, email=None):
+    client = app_module.app.test_client()
+    if email:
+        client.post('/login', json={'email': email, 'password': 'password123'})
+    return client
+
+
+def test_batch_requires_login(seeded):
+    response = _client(seeded).post('/api/support/tickets/batch', json={'tickets': [{'issue': 'Cold food'}]})
+    assert response.status_code in (302, 401)
+
+
+def test_batch_tickets_are_filed_under_the_logged_in_user(seeded):
+    client = _client(seeded, 'john@techcorp.com')
+    response = client.post('/api/support/tickets/batch', json={'tickets': [
+        {'issue': 'Cold food'}, {'issue': 'Late delivery', 'customer_email': 'jane@techcorp.com'}]})
+    assert response.status_code == 201
+    tickets = response.get_json()
+    assert [ticket['customer_email'] for ticket in tickets] == ['john@techcorp.com'] * 2
+    assert tickets[1]['id'] == tickets[0]['id'] + 1
+
+
+def test_batch_size_is_capped(seeded):
+    cap = seeded.app.config['SUPPORT_TICKET_BATCH_MAX']
+    client = _client(seeded, 'john@techcorp.com')
+    response = client.post('/api/support/tickets/batch', json={'tickets': [{'issue': 'x'}] * (cap + 1)})
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from rag_engine import TOOL_LIMIT_MESSAGE
+
+QUESTION = "Which lunch options suit a vegetarian team?"
+
+
+def _tool_call(number):
+    return SimpleNamespace(id=f"call_{number}", function=SimpleNamespace(name='lookup_menu', arguments='{}'))
+
+
+class ToolLoopLLM:
+    """An LLM that asks for a tool on every round, whatever tool_choice says"""
+
+    def __init__(self):
+        self.tool_choices = []
+
+    def chat_completion(self, tool_choice=None, **kwargs):
+        self.tool_choices.append(tool_choice)
+        message = SimpleNamespace(content=None, tool_calls=[_tool_call(len(self.tool_choices))])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    def stream_chat_completion(self, tool_choice=None, **kwargs):
+        self.tool_choices.append(tool_choice)
+        call = _tool_call(len(self.tool_choices))
+        delta = SimpleNamespace(content=None, tool_calls=[
+            SimpleNamespace(index=0, id=call.id, function=call.function)])
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=delta)])])
+
+
+@pytest.fixture
+def engine(app_module, monkeypatch):
+    engine = app_module.get_or_create_rag_engine('tool-rounds-test')
+    engine.state.conversation_history = []
+    engine.state.summary = None
+    monkeypatch.setattr(engine, 'llm', ToolLoopLLM())
+    return engine
+
+
+def test_tool_loop_ends_with_fallback(engine):
+    assert engine.generate_response(QUESTION) == TOOL_LIMIT_MESSAGE
+    assert engine.llm.tool_choices == ['auto'] * engine.max_tool_rounds + ['none']
+    assert engine.conversation_history[-1] == {'role': 'assistant', 'content': TOOL_LIMIT_MESSAGE}
+
+
+def test_streamed_tool_loop_ends_with_fallback(engine):
+    assert ''.join(engine.stream_response(QUESTION)) == TOOL_LIMIT_MESSAGE
+    assert engine.llm.tool_choices == ['auto'] * engine.max_tool_rounds + ['none']
+    assert engine.conversation_history[-1] == {'role': 'assistant', 'content': TOOL_LIMIT_MESSAGE}
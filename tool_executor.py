@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import copy_current_request_context, has_request_context
+
+import metrics
+
+
+class ToolLatencyStats:
+    """Per-tool call counts, errors and latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools = {}
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            tool = self._tools.setdefault(name, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            tool['calls'] += 1
+            tool['errors'] += int(error)
+            tool['total_seconds'] += seconds
+            tool['max_seconds'] = max(tool['max_seconds'], seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(tool, avg_seconds=tool['total_seconds'] / tool['calls'])
+                for name, tool in self._tools.items()
+            }
+
+
+class ToolExecutor:
+    """Runs all tool calls of one completion turn concurrently.
+
+    Tools are mostly database lookups for the logged-in user, so each one runs in a
+    pool thread with a copy of the current request context (current_user and the
+    SQLAlchemy session work as they do in the view). A single call runs inline.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-tool')
+        self.latency = ToolLatencyStats()
+
+    def _timed(self, name, func):
+        def run():
+            started = time.perf_counter()
+            try:
+                result = func()
+            except Exception as e:
+                self.latency.record(name, time.perf_counter() - started, error=True)
+                metrics.record_tool_result(name, error=True)
+                print(f"Error running tool {name}: {str(e)}")
+                return {"error": f"Tool {name} failed"}
+            self.latency.record(name, time.perf_counter() - started)
+            metrics.record_tool_result(name)
+            return result
+        return run
+
+    def run_all(self, calls):
+        """Run [(name, callable), ...] and return their results in the same order"""
+        tasks = [self._timed(name, func) for name, func in calls]
+        if len(tasks) == 1:
+            return [tasks[0]()]
+        if has_request_context():
+            tasks = [copy_current_request_context(task) for task in tasks]
+        futures = [self._pool.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor():
+    """Return the process-wide ToolExecutor; TOOL_MAX_WORKERS sizes its thread pool"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ToolExecutor(max_workers=int(os.environ.get('TOOL_MAX_WORKERS', 4)))
+    return _executor